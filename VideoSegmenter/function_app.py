@@ -1,3 +1,4 @@
+import json
 import logging
 import azure.functions as func
 from azure.storage.blob import BlobServiceClient
@@ -5,26 +6,33 @@ from moviepy import VideoFileClip
 from pathlib import Path
 import tempfile
 import os
+from instrumentation import METRICS, PROFILER, export_metrics
 
 CONNECT_STR = os.getenv('AzureWebJobsStorage')
 INPUT_CONTAINER = "input-video"
 OUTPUT_CONTAINER = "output-segments"
 
 app = func.FunctionApp()
+METRICS.set_app("VideoSegmenter")
 
 def download_blob_to_temp(blob_service_client, container_name, blob_name):
     blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
     temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-    with open(temp_file.name, "wb") as f:
-        f.write(blob_client.download_blob().readall())
+    with METRICS.timer("blob_download_seconds", container=container_name):
+        with open(temp_file.name, "wb") as f:
+            f.write(blob_client.download_blob().readall())
+    METRICS.inc("blob_download_bytes_total", os.path.getsize(temp_file.name), container=container_name)
     return temp_file.name
 
 def upload_blob(blob_service_client, container_name, blob_name, file_path):
     blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-    with open(file_path, "rb") as f:
-        blob_client.upload_blob(f, overwrite=True)
+    with METRICS.timer("blob_upload_seconds", container=container_name):
+        with open(file_path, "rb") as f:
+            blob_client.upload_blob(f, overwrite=True)
+    METRICS.inc("blob_upload_bytes_total", os.path.getsize(file_path), container=container_name)
 
 @app.route(route="VideoSegmentFunction", auth_level=func.AuthLevel.FUNCTION)
+@PROFILER.profiled("VideoSegmentFunction")
 def VideoSegmentFunction(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request.')
 
@@ -46,7 +54,9 @@ def VideoSegmentFunction(req: func.HttpRequest) -> func.HttpResponse:
             end = start + segment_duration
             subclip = main_clip.subclipped(start, end).without_audio()
             with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_output:
-                subclip.write_videofile(temp_output.name, codec="libx264", audio_codec="aac")
+                with METRICS.timer("segment_encode_seconds"):
+                    subclip.write_videofile(temp_output.name, codec="libx264", audio_codec="aac")
+                METRICS.inc("segments_total")
                 output_blob_name = f"{Path(video_name).stem}_part{i+1}.mp4"
                 upload_blob(blob_service_client, OUTPUT_CONTAINER, output_blob_name, temp_output.name)
 
@@ -57,7 +67,9 @@ def VideoSegmentFunction(req: func.HttpRequest) -> func.HttpResponse:
             end = video_duration
             subclip = main_clip.subclipped(start, end).without_audio()
             with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_output:
-                subclip.write_videofile(temp_output.name, codec="libx264", audio_codec="aac")
+                with METRICS.timer("segment_encode_seconds"):
+                    subclip.write_videofile(temp_output.name, codec="libx264", audio_codec="aac")
+                METRICS.inc("segments_total")
                 output_blob_name = f"{Path(video_name).stem}_part{num_full_segments+1}.mp4"
                 upload_blob(blob_service_client, OUTPUT_CONTAINER, output_blob_name, temp_output.name)
 
@@ -65,4 +77,23 @@ def VideoSegmentFunction(req: func.HttpRequest) -> func.HttpResponse:
 
     except Exception as e:
         logging.exception("Error during video segmentation")
-        return func.HttpResponse(f"Error: {str(e)}", status_code=500)
\ No newline at end of file
+        METRICS.inc("invocation_errors_total", function="VideoSegmentFunction")
+        return func.HttpResponse(f"Error: {str(e)}", status_code=500)
+
+
+# Metrics of this app in Prometheus text format (?format=json for a JSON snapshot)
+@app.route(route="metrics", auth_level=func.AuthLevel.FUNCTION)
+def metrics(req: func.HttpRequest) -> func.HttpResponse:
+    (body, mimetype) = export_metrics(req.params.get("format", "prometheus"))
+    return func.HttpResponse(body, mimetype=mimetype)
+
+
+# Profiling status and summary of the last profiled request (?arm=N profiles the next N requests)
+@app.route(route="profile", auth_level=func.AuthLevel.FUNCTION)
+def profile(req: func.HttpRequest) -> func.HttpResponse:
+    if req.params.get("arm"):
+        try:
+            PROFILER.arm(int(req.params.get("arm")))
+        except ValueError:
+            return func.HttpResponse("'arm' must be a non-negative integer.", status_code=400)
+    return func.HttpResponse(json.dumps(PROFILER.status()), mimetype="application/json")
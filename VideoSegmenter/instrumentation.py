@@ -0,0 +1,289 @@
+"""
+Lightweight in-process metrics and profiling shared by the function apps.
+
+Every app deploys on its own, so each app directory carries a committed copy of this file.
+Edit this copy only and refresh the app copies with python shared/vendor.py.
+
+    from instrumentation import METRICS, PROFILER
+
+    with METRICS.timer("blob_download_seconds", container="output-segments"):
+        data = blob.read()
+    METRICS.inc("frames_total")
+    METRICS.set_gauge("stream_lag_seconds", lag)
+
+    METRICS.to_prometheus()   # Prometheus text exposition format
+    METRICS.snapshot()        # JSON-friendly dict with counts, sums and percentile estimates
+
+    with PROFILER.profile("open_cv_analyzer"):   # cProfile, only while armed, one request at a time
+        ...
+
+Metrics are plain dicts behind one lock; recording is a perf_counter call and a bucket lookup,
+cheap enough for per-frame stages.
+"""
+import bisect
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Requests profiled after start-up, e.g. PROFILE_REQUESTS=1 profiles the first request only
+PROFILE_REQUESTS = int(os.getenv("PROFILE_REQUESTS", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "profiles"))
+
+# Functions listed in the text summary of a profile
+PROFILE_SUMMARY_LINES = 30
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    # Percentile estimate: upper bound of the bucket holding the q-th observation (capped at the max seen)
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{key}="{value}"'.replace("\n", "\\n") for key, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and latency histograms, each identified by a name and optional labels.
+
+    Args:
+        namespace (str): Prefix of every exported metric name
+        const_labels (dict): Labels added to every exported sample (e.g. the app name)
+    """
+
+    def __init__(self, namespace="traffic", const_labels=None):
+        self.namespace = namespace
+        self.const_labels = dict(const_labels or {})
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def set_app(self, app_name):
+        self.const_labels["app"] = app_name
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, seconds, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator timing every call of a function into the `name` histogram."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+            histograms = [(key, histogram.count, histogram.sum, histogram.max,
+                           {f"p{q}": histogram.percentile(q) for q in (50, 95, 99)})
+                          for key, histogram in self._histograms.items()]
+
+        return {
+            "labels": self.const_labels,
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for ((name, labels), value) in counters],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value} for ((name, labels), value) in gauges],
+            "histograms": [{"name": name, "labels": dict(labels), "count": count, "sum": round(total, 6),
+                            "max": round(maximum, 6), **percentiles}
+                           for ((name, labels), count, total, maximum, percentiles) in histograms],
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self):
+        const = _label_key(self.const_labels)
+        lines = []
+        typed = set()
+
+        def metric_name(name):
+            return re.sub(r"[^a-zA-Z0-9_:]", "_", f"{self.namespace}_{name}" if self.namespace else name)
+
+        def type_line(name, metric_type):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        with self._lock:
+            for ((name, labels), value) in sorted(self._counters.items()):
+                full_name = metric_name(name)
+                type_line(full_name, "counter")
+                lines.append(f"{full_name}{_format_labels(const + labels)} {value}")
+
+            for ((name, labels), value) in sorted(self._gauges.items()):
+                full_name = metric_name(name)
+                type_line(full_name, "gauge")
+                lines.append(f"{full_name}{_format_labels(const + labels)} {value}")
+
+            for ((name, labels), histogram) in sorted(self._histograms.items(), key=lambda item: item[0]):
+                full_name = metric_name(name)
+                type_line(full_name, "histogram")
+                cumulative = 0
+                for bound, bucket_count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f"{full_name}_bucket{_format_labels(const + labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(const + labels)} {histogram.sum}")
+                lines.append(f"{full_name}_count{_format_labels(const + labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+class RequestProfiler:
+    """
+    cProfile hook for one request at a time.
+
+    Profiling is armed for a number of requests (PROFILE_REQUESTS at start-up or arm()). A profiled
+    request writes <label>-<timestamp>.prof to the output directory (open with pstats or snakeviz)
+    and keeps a text summary. Concurrent requests are not profiled while one is. During a profiled
+    request the thread is renamed "profiling:<label>" so it stands out in py-spy dump / top.
+    """
+
+    def __init__(self, output_dir=PROFILE_DIR, armed=PROFILE_REQUESTS):
+        self.output_dir = output_dir
+        self.armed = armed
+        self.last_profile_path = None
+        self.last_summary = None
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+
+    def arm(self, count=1):
+        if count < 0:
+            raise ValueError(f"Profile count must not be negative: {count}")
+        with self._lock:
+            self.armed = count
+
+    @contextlib.contextmanager
+    def profile(self, label):
+        with self._lock:
+            take = self.armed > 0 and self._active.acquire(blocking=False)
+            if take:
+                self.armed -= 1
+
+        if not take:
+            yield None
+            return
+
+        thread = threading.current_thread()
+        thread_name = thread.name
+        thread.name = f"profiling:{label}"
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                yield profiler
+            finally:
+                profiler.disable()
+                self._save(label, profiler)
+        finally:
+            thread.name = thread_name
+            self._active.release()
+
+    def profiled(self, label):
+        """Decorator profiling calls of a function (while armed)."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.profile(label):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _save(self, label, profiler):
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_label = re.sub(r"[^a-zA-Z0-9_.-]", "_", label)
+        path = os.path.join(self.output_dir, f"{safe_label}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(path)
+
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(PROFILE_SUMMARY_LINES)
+        self.last_profile_path = path
+        self.last_summary = summary.getvalue()
+
+    def status(self):
+        return {"armed": self.armed, "active": self._active.locked(), "output_dir": self.output_dir,
+                "last_profile_path": self.last_profile_path, "last_summary": self.last_summary}
+
+
+METRICS = MetricsRegistry()
+PROFILER = RequestProfiler()
+
+
+# Helper function for the metrics routes, returns (body, mimetype) of the requested format
+def export_metrics(fmt="prometheus"):
+    if fmt == "json":
+        return (METRICS.to_json(), "application/json")
+    return (METRICS.to_prometheus(), "text/plain; version=0.0.4")
@@ -0,0 +1,93 @@
+import collections
+import math
+import threading
+
+# Width of the time index buckets, in (relative) seconds of timeEntered
+TIME_INDEX_BUCKET_SECONDS = 60
+
+
+class AlertRingBuffer:
+    """
+    Bounded in-memory buffer of the most recent alerts, indexed by vehicle id and by time.
+
+    Alerts get an increasing sequence number and are evicted oldest first once `capacity` is
+    reached. Both indexes keep their sequence numbers in insertion order, so an evicted alert is
+    always at the front of its index entries and eviction stays O(1).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._alerts = {}
+        self._order = collections.deque()
+        self._by_vehicle = {}
+        self._by_time = {}
+        self._next_seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    # All-or-nothing: the index keys are computed first, so a bad alert raises before anything changes
+    def append(self, alert: dict) -> None:
+        vehicle_key = str(alert["vehicleId"])
+        time_key = time_bucket(alert["timeEntered"])
+        with self._lock:
+            if len(self._order) >= self.capacity:
+                self._evict_oldest()
+
+            seq = self._next_seq
+            self._next_seq += 1
+            self._alerts[seq] = alert
+            self._order.append(seq)
+            self._by_vehicle.setdefault(vehicle_key, collections.deque()).append(seq)
+            self._by_time.setdefault(time_key, collections.deque()).append(seq)
+
+    def extend(self, alerts: list) -> None:
+        for alert in alerts:
+            self.append(alert)
+
+    def _evict_oldest(self) -> None:
+        seq = self._order.popleft()
+        alert = self._alerts.pop(seq)
+        for (index, key) in ((self._by_vehicle, str(alert["vehicleId"])), (self._by_time, time_bucket(alert["timeEntered"]))):
+            entries = index[key]
+            entries.popleft()
+            if not entries:
+                del index[key]
+
+    # Recent alerts of a vehicle and/or within [start, end) of timeEntered, ordered by timeEntered
+    def query(self, vehicle_id=None, start: float = None, end: float = None, limit: int = 100) -> list:
+        with self._lock:
+            if vehicle_id is not None:
+                candidates = list(self._by_vehicle.get(str(vehicle_id), ()))
+            elif start is not None or end is not None:
+                candidates = self._time_candidates(start, end)
+            else:
+                candidates = list(self._order)
+
+            alerts = [self._alerts[seq] for seq in candidates]
+
+        alerts = [alert for alert in alerts
+                  if (start is None or alert["timeEntered"] >= start) and (end is None or alert["timeEntered"] < end)]
+        alerts.sort(key=lambda alert: alert["timeEntered"])
+        return alerts[:limit]
+
+    # Sequence numbers of the time buckets overlapping [start, end)
+    def _time_candidates(self, start: float, end: float) -> list:
+        first = time_bucket(start) if start is not None else None
+        last = time_bucket(end) if end is not None else None
+
+        if first is not None and last is not None and last - first + 1 <= len(self._by_time):
+            buckets = range(first, last + 1)
+        else:
+            buckets = [bucket for bucket in self._by_time
+                       if (first is None or bucket >= first) and (last is None or bucket <= last)]
+
+        candidates = []
+        for bucket in buckets:
+            candidates.extend(self._by_time.get(bucket, ()))
+        return candidates
+
+
+def time_bucket(time_entered: float) -> int:
+    return int(math.floor(time_entered / TIME_INDEX_BUCKET_SECONDS))
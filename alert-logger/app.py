@@ -1,12 +1,52 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
+import atexit
+import functools
+import gzip
+import hmac
+import io
+import json
 import logging
+import logging.handlers
+import math
+import os
+import queue
 import sys
+import time
+from alert_buffer import AlertRingBuffer
+from instrumentation import METRICS, PROFILER, export_metrics
 
 app = Flask(__name__)
+METRICS.set_app("alert-logger")
+
+# Number of recent alerts kept in memory for the lookup endpoint
+ALERT_BUFFER_SIZE = int(os.getenv("ALERT_BUFFER_SIZE", "100000"))
+
+# Alerts validated and logged together while reading a stream
+STREAM_BATCH_SIZE = 1000
+
+# Maximum number of per-item errors returned by the batch endpoints
+MAX_REPORTED_ERRORS = 100
+
+# Largest page of the recent alerts lookup
+MAX_RECENT_LIMIT = 1000
+
+# Key of the admin endpoints (metrics, profile), passed as the x-admin-key header or ?code=,
+# like a function key of the Azure apps. Unset disables the admin endpoints.
+ADMIN_API_KEY = os.getenv("ALERT_LOGGER_ADMIN_KEY")
+
+ALERT_MESSAGE = "🚨 ALERT: Vehicle ID %s (%s) was spotted at: %s (relative time) speeding at %s km/h!"
+
+
+# Queue handler that leaves formatting to the listener thread, the request thread only enqueues
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
 
 # Configure logger to output to stdout for Azure logging
 logger = logging.getLogger("alert-logger")
 logger.setLevel(logging.WARNING)
+logger.propagate = False
 
 if logger.hasHandlers():
     logger.handlers.clear()
@@ -16,7 +56,91 @@ console_handler.setLevel(logging.WARNING)
 formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 console_handler.setFormatter(formatter)
 
-logger.addHandler(console_handler)
+# Requests hand log records to a background writer instead of writing to stdout themselves
+log_queue = queue.SimpleQueue()
+logger.addHandler(DeferredQueueHandler(log_queue))
+log_listener = logging.handlers.QueueListener(log_queue, console_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+recent_alerts = AlertRingBuffer(ALERT_BUFFER_SIZE)
+
+
+# Helper function to validate one alert, returns (alert, "") or (None, error)
+def validate_alert(item) -> tuple[dict, str]:
+    if not isinstance(item, dict):
+        return (None, "Alert must be a JSON object")
+
+    try:
+        alert = {
+            "vehicleId": item["vehicleId"],
+            "timeEntered": float(item["timeEntered"]),
+            "speed": float(item["speed"]),
+            "vehicleType": item["vehicleType"],
+        }
+    except KeyError as e:
+        return (None, f"Missing field: {e}")
+    except (TypeError, ValueError) as e:
+        return (None, f"Invalid field value: {e}")
+
+    # float() accepts "NaN" and "inf", which cannot be placed in the time index
+    for field in ("timeEntered", "speed"):
+        if not math.isfinite(alert[field]):
+            return (None, f"Invalid field value: {field} must be a finite number")
+
+    return (alert, "")
+
+
+# Helper function to log and buffer accepted alerts
+def record_alerts(alerts: list) -> None:
+    for alert in alerts:
+        logger.warning(ALERT_MESSAGE, alert["vehicleId"], alert["vehicleType"], alert["timeEntered"], alert["speed"])
+    recent_alerts.extend(alerts)
+
+
+# Helper function to validate (index, item) pairs, keeping the valid alerts and reporting the others
+def process_alerts(indexed_items) -> tuple[int, list]:
+    accepted = []
+    errors = []
+    for (index, item) in indexed_items:
+        (alert, error) = validate_alert(item)
+        if alert is None:
+            errors.append({"index": index, "error": error})
+        else:
+            accepted.append(alert)
+
+    record_alerts(accepted)
+    METRICS.inc("alerts_accepted_total", len(accepted))
+    if errors:
+        METRICS.inc("alerts_rejected_total", len(errors))
+    return (len(accepted), errors)
+
+
+# Helper decorator to restrict an endpoint to callers presenting the admin key
+def admin_only(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("x-admin-key") or request.args.get("code") or ""
+        if not ADMIN_API_KEY or not hmac.compare_digest(key.encode("utf-8"), ADMIN_API_KEY.encode("utf-8")):
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Request latency per endpoint and status
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        METRICS.observe("request_seconds", time.perf_counter() - started, endpoint=request.endpoint or "unknown")
+    METRICS.inc("requests_total", endpoint=request.endpoint or "unknown", status=response.status_code)
+    return response
+
 
 # Standard route
 @app.route("/")
@@ -26,38 +150,117 @@ def hello():
 
 @app.route("/api/alert", methods=["POST"])
 def receive_alert():
-    data = request.get_json()
+    data = request.get_json(silent=True)
     if not data:
         return jsonify({"error": "Invalid or missing JSON"}), 400
 
-    try:
-        vehicle_id = data["vehicleId"]
-        time = data["timeEntered"]
-        speed = data["speed"]
-        vehicle_type = data["vehicleType"]
-    except KeyError as e:
-        return jsonify({"error": f"Missing field: {e}"}), 400
+    (alert, error) = validate_alert(data)
+    if alert is None:
+        METRICS.inc("alerts_rejected_total")
+        return jsonify({"error": error}), 400
 
-    logger.warning(f"🚨 ALERT: Vehicle ID {vehicle_id} ({vehicle_type}) was spotted at: {time} (relative time) speeding at {speed} km/h!")
+    record_alerts([alert])
+    METRICS.inc("alerts_accepted_total")
 
     return jsonify({"status": "received"})
 
 
 @app.route("/api/alert/list", methods=["POST"])
 def receive_alerts():
-    data = request.get_json()
+    data = request.get_json(silent=True)
     if not data or not isinstance(data, list):
         return jsonify({"error": "Invalid or missing JSON list"}), 400
 
-    for vehicle in data:
+    # Invalid items are reported one by one instead of failing the whole batch
+    (accepted, errors) = process_alerts(enumerate(data))
+
+    status_code = 200 if accepted else 400
+    return jsonify({"status": "received", "count": accepted, "rejected": len(errors),
+                    "errors": errors[:MAX_REPORTED_ERRORS]}), status_code
+
+
+# Streaming batch endpoint: one JSON alert per line (NDJSON), optionally gzip compressed
+# (Content-Encoding: gzip). The body is parsed while it is read, never loaded as a whole.
+@app.route("/api/alert/stream", methods=["POST"])
+def receive_alert_stream():
+    stream = request.stream
+    if request.headers.get("Content-Encoding", "").lower() == "gzip":
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+
+    accepted = 0
+    rejected = 0
+    errors = []
+    batch = []
+
+    def flush_batch():
+        nonlocal accepted, rejected
+        (batch_accepted, batch_errors) = process_alerts(batch)
+        accepted += batch_accepted
+        rejected += len(batch_errors)
+        errors.extend(batch_errors[:MAX_REPORTED_ERRORS - len(errors)])
+        batch.clear()
+
+    try:
+        for (index, line) in enumerate(io.BufferedReader(stream)):
+            if not line.strip():
+                continue
+            try:
+                batch.append((index, json.loads(line)))
+            except ValueError as e:
+                rejected += 1
+                METRICS.inc("alerts_rejected_total")
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"index": index, "error": f"Invalid JSON: {e}"})
+
+            if len(batch) >= STREAM_BATCH_SIZE:
+                flush_batch()
+    except (OSError, EOFError) as e:
+        flush_batch()
+        return jsonify({"error": f"Could not read request body: {e}", "count": accepted}), 400
+
+    flush_batch()
+    return jsonify({"status": "received", "count": accepted, "rejected": rejected, "errors": errors})
+
+
+# Lookup of recent alerts by vehicle and/or time window (relative timeEntered seconds)
+@app.route("/api/alert/recent", methods=["GET"])
+def get_recent_alerts():
+    try:
+        start = float(request.args["start"]) if "start" in request.args else None
+        end = float(request.args["end"]) if "end" in request.args else None
+        limit = int(request.args.get("limit", 100))
+        if any(bound is not None and not math.isfinite(bound) for bound in (start, end)):
+            raise ValueError("non-finite bound")
+        if not 1 <= limit <= MAX_RECENT_LIMIT:
+            raise ValueError("limit out of range")
+    except ValueError:
+        return jsonify({"error": f"'start' and 'end' must be finite numbers, 'limit' an integer between 1 and {MAX_RECENT_LIMIT}"}), 400
+
+    alerts = recent_alerts.query(request.args.get("vehicleId"), start, end, limit)
+    return jsonify({"count": len(alerts), "buffered": len(recent_alerts), "alerts": alerts})
+
+
+# Metrics of this app in Prometheus text format (?format=json for a JSON snapshot)
+@app.route("/api/metrics", methods=["GET"])
+@admin_only
+def get_metrics():
+    METRICS.set_gauge("alerts_buffered", len(recent_alerts))
+    (body, mimetype) = export_metrics(request.args.get("format", "prometheus"))
+    return app.response_class(body, mimetype=mimetype)
+
+
+# Profiling status and summary of the last profiled request (?arm=N profiles the next N requests)
+@app.route("/api/profile", methods=["GET"])
+@admin_only
+def get_profile():
+    if request.args.get("arm"):
         try:
-            vehicle_id = vehicle["vehicleId"]
-            time = vehicle["timeEntered"]
-            speed = vehicle["speed"]
-            vehicle_type = vehicle["vehicleType"]
-        except KeyError as e:
-            return jsonify({"error": f"Missing field in one of the list items: {e}"}), 400
+            PROFILER.arm(int(request.args.get("arm")))
+        except ValueError:
+            return jsonify({"error": "'arm' must be a non-negative integer"}), 400
+    return jsonify(PROFILER.status())
 
-        logger.warning(f"🚨 ALERT: Vehicle ID {vehicle_id} ({vehicle_type}) was spotted at: {time} (relative time) speeding at {speed} km/h!")
 
-    return jsonify({"status": "received", "count": len(data)})
+# Profile the alert endpoints one request at a time while the profiler is armed
+for endpoint in ("receive_alert", "receive_alerts", "receive_alert_stream", "get_recent_alerts"):
+    app.view_functions[endpoint] = PROFILER.profiled(endpoint)(app.view_functions[endpoint])
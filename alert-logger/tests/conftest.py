@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def alert_logger(load_app):
+    return load_app("alert-logger", "app.py")
+
+
+# Flask test client of the app, with an empty alert buffer
+@pytest.fixture
+def client(alert_logger, monkeypatch):
+    from alert_buffer import AlertRingBuffer
+
+    monkeypatch.setattr(alert_logger, "recent_alerts", AlertRingBuffer(alert_logger.ALERT_BUFFER_SIZE))
+    return alert_logger.app.test_client()
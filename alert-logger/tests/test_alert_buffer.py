@@ -0,0 +1,55 @@
+from alert_buffer import AlertRingBuffer, TIME_INDEX_BUCKET_SECONDS
+
+
+def make_alert(vehicle_id, time_entered: float) -> dict:
+    return {"vehicleId": vehicle_id, "timeEntered": time_entered, "speed": 150.0, "vehicleType": "car"}
+
+
+def times(alerts: list) -> list:
+    return [alert["timeEntered"] for alert in alerts]
+
+
+def test_eviction_drops_the_oldest_alerts_and_their_index_entries():
+    buffer = AlertRingBuffer(3)
+    buffer.extend([make_alert(1, 10.0), make_alert(2, 70.0), make_alert(1, 75.0), make_alert(3, 130.0), make_alert(4, 200.0)])
+
+    assert len(buffer) == 3
+    assert times(buffer.query()) == [75.0, 130.0, 200.0]
+    # Vehicle 2 and the first time bucket lost their only alerts, their index keys are gone
+    assert set(buffer._by_vehicle) == {"1", "3", "4"}
+    assert set(buffer._by_time) == {1, 2, 3}
+    assert times(buffer.query(vehicle_id=1)) == [75.0]
+    assert buffer.query(vehicle_id=2) == []
+    assert buffer.query(start=0.0, end=60.0) == []
+
+
+def test_eviction_keeps_every_index_consistent_over_many_rounds():
+    buffer = AlertRingBuffer(50)
+    for i in range(1000):
+        buffer.append(make_alert(i % 7, float(i)))
+
+    assert len(buffer) == 50
+    assert sum(len(entries) for entries in buffer._by_vehicle.values()) == 50
+    assert sum(len(entries) for entries in buffer._by_time.values()) == 50
+    assert times(buffer.query(limit=100)) == [float(i) for i in range(950, 1000)]
+
+
+def test_time_window_is_half_open_and_ordered_by_time_entered():
+    buffer = AlertRingBuffer(100)
+    # Appended out of order, across several index buckets
+    buffer.extend([make_alert(1, 125.0), make_alert(2, 59.0), make_alert(3, 300.0), make_alert(4, 60.0), make_alert(5, 10.0)])
+
+    assert times(buffer.query(start=59.0, end=125.0)) == [59.0, 60.0]
+    assert times(buffer.query(start=60.0)) == [60.0, 125.0, 300.0]
+    assert times(buffer.query(end=60.0)) == [10.0, 59.0]
+    assert times(buffer.query(start=59.0, end=125.0, limit=1)) == [59.0]
+    assert times(buffer.query(vehicle_id=3, start=0.0, end=300.0)) == []
+
+
+def test_wide_time_window_scans_the_occupied_buckets_only():
+    buffer = AlertRingBuffer(100)
+    buffer.extend([make_alert(1, 5.0), make_alert(2, 1e9)])
+
+    # Far more buckets in the window than occupied ones, both lookups must agree
+    assert times(buffer.query(start=0.0, end=2e9)) == [5.0, 1e9]
+    assert times(buffer.query(start=0.0, end=3 * TIME_INDEX_BUCKET_SECONDS)) == [5.0]
@@ -0,0 +1,61 @@
+import gzip
+import json
+
+import pytest
+
+
+def make_alert(vehicle_id, time_entered: float) -> dict:
+    return {"vehicleId": vehicle_id, "timeEntered": time_entered, "speed": 150.0, "vehicleType": "car"}
+
+
+def ndjson(lines: list) -> bytes:
+    return "".join(line + "\n" for line in lines).encode("utf-8")
+
+
+def test_stream_reports_bad_lines_and_keeps_the_good_ones(client):
+    lines = [json.dumps(make_alert(1, 10.0)), "{not json", "", json.dumps({"vehicleId": 2}),
+             json.dumps(make_alert(3, "NaN")), json.dumps(make_alert(4, 20.0))]
+
+    response = client.post("/api/alert/stream", data=ndjson(lines), content_type="application/x-ndjson")
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body["count"], body["rejected"]) == (2, 3)
+    assert [error["index"] for error in body["errors"]] == [1, 3, 4]
+    assert [alert["vehicleId"] for alert in client.get("/api/alert/recent").get_json()["alerts"]] == [1, 4]
+
+
+def test_stream_accepts_a_gzip_body(client):
+    data = gzip.compress(ndjson([json.dumps(make_alert(i, float(i))) for i in range(2500)] + ["oops"]))
+
+    response = client.post("/api/alert/stream", data=data, headers={"Content-Encoding": "gzip"})
+
+    body = response.get_json()
+    assert (response.status_code, body["count"], body["rejected"]) == (200, 2500, 1)
+    assert body["errors"][0]["index"] == 2500
+
+
+def test_truncated_gzip_body_is_rejected_after_keeping_what_was_read(client):
+    data = gzip.compress(ndjson([json.dumps(make_alert(i, float(i))) for i in range(2500)]))
+
+    response = client.post("/api/alert/stream", data=data[:len(data) // 2], headers={"Content-Encoding": "gzip"})
+
+    assert response.status_code == 400
+    assert 0 < response.get_json()["count"] < 2500
+
+
+@pytest.mark.parametrize("limit", ["-1", "0", "1001", "ten"])
+def test_recent_rejects_an_out_of_range_limit(client, limit):
+    client.post("/api/alert/list", json=[make_alert(1, 10.0), make_alert(2, 20.0)])
+
+    assert client.get(f"/api/alert/recent?limit={limit}").status_code == 400
+
+
+def test_recent_time_window_and_limit(client):
+    client.post("/api/alert/list", json=[make_alert(i, float(i * 30)) for i in range(10)])
+
+    body = client.get("/api/alert/recent?start=60&end=180&limit=3").get_json()
+
+    assert [alert["timeEntered"] for alert in body["alerts"]] == [60.0, 90.0, 120.0]
+    assert body["buffered"] == 10
+    assert client.get("/api/alert/recent?limit=1").get_json()["count"] == 1
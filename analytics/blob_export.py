@@ -0,0 +1,129 @@
+import base64
+import csv
+import io
+import logging
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import pyodbc
+from azure.storage.blob import BlobBlock, ContentSettings
+from instrumentation import METRICS
+
+# Rows fetched from SQL per round trip
+EXPORT_FETCH_BATCH_SIZE = 5000
+
+# Size of every staged block (the last one may be smaller)
+EXPORT_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Blocks being uploaded while the next one is filled, bounds memory to (in flight + 1) blocks
+EXPORT_MAX_BLOCKS_IN_FLIGHT = 2
+
+
+# Helper function to build fixed-length block ids (Azure requires equal length ids within a blob)
+def make_block_id(index: int) -> str:
+    return base64.b64encode(f"block-{index:08d}".encode("ascii")).decode("ascii")
+
+
+class _StagedBlockWriter:
+    """
+    File-like sink that cuts written bytes into fixed-size blocks and stages them on a block blob.
+
+    Blocks are staged in the background while the caller keeps producing data, with at most
+    EXPORT_MAX_BLOCKS_IN_FLIGHT uploads pending, so memory stays bounded whatever the blob size.
+    """
+
+    def __init__(self, blob_client, block_size: int = EXPORT_BLOCK_SIZE):
+        self.blob_client = blob_client
+        self.block_size = block_size
+        self.block_ids = []
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._executor = ThreadPoolExecutor(max_workers=EXPORT_MAX_BLOCKS_IN_FLIGHT)
+        self._in_flight = []
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._stage(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+
+    def _stage(self, block: bytes) -> None:
+        block_id = make_block_id(len(self.block_ids))
+        self.block_ids.append(block_id)
+        self.bytes_written += len(block)
+
+        # Wait for the oldest upload before queueing another one
+        if len(self._in_flight) >= EXPORT_MAX_BLOCKS_IN_FLIGHT:
+            self._in_flight.pop(0).result()
+        self._in_flight.append(self._executor.submit(self.blob_client.stage_block, block_id, block))
+
+    # Stage the remaining bytes and commit every block, in order, as the new blob content
+    def commit(self, content_settings: ContentSettings = None, metadata: dict = None) -> None:
+        try:
+            if self._buffer or not self.block_ids:
+                self._stage(bytes(self._buffer))
+                self._buffer.clear()
+            for future in self._in_flight:
+                future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+
+        self.blob_client.commit_block_list([BlobBlock(block_id=block_id) for block_id in self.block_ids],
+                                           content_settings=content_settings, metadata=metadata)
+
+    def abort(self) -> None:
+        # Uncommitted blocks are discarded by the service after a week, the existing blob is untouched
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Helper function to stream the results of a query into a (optionally gzip compressed) CSV block blob
+# Rows are read with fetchmany and serialized straight into staged blocks, nothing is kept on disk
+def stream_query_to_blob(conn_str: str, query: str, blob_client, compress: bool = False, metadata: dict = None,
+                         fetch_batch_size: int = EXPORT_FETCH_BATCH_SIZE, params: list = None) -> tuple[bool, int, int, str]:
+
+    writer = _StagedBlockWriter(blob_client)
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+    text_buffer = io.StringIO(newline='')
+    csv_writer = csv.writer(text_buffer)
+    row_count = 0
+
+    def flush_text():
+        data = text_buffer.getvalue().encode('utf-8')
+        text_buffer.seek(0)
+        text_buffer.truncate(0)
+        writer.write(compressor.compress(data) if compressor else data)
+
+    started = time.perf_counter()
+    try:
+        with pyodbc.connect(conn_str) as conn:
+            with conn.cursor() as cursor:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                csv_writer.writerow([desc[0] for desc in cursor.description])
+
+                while True:
+                    rows = cursor.fetchmany(fetch_batch_size)
+                    if not rows:
+                        break
+                    csv_writer.writerows(rows)
+                    row_count += len(rows)
+                    flush_text()
+
+        flush_text()
+        if compressor:
+            writer.write(compressor.flush())
+
+        content_settings = ContentSettings(content_type="text/csv", content_encoding="gzip" if compress else None)
+        writer.commit(content_settings=content_settings, metadata=metadata)
+
+        METRICS.observe("blob_export_seconds", time.perf_counter() - started)
+        METRICS.inc("blob_export_bytes_total", writer.bytes_written)
+        logging.info(f"Streamed {row_count} records ({writer.bytes_written} bytes, {len(writer.block_ids)} blocks) to blob")
+        return (True, row_count, writer.bytes_written, "")
+
+    except Exception as e:
+        writer.abort()
+        logging.error(f"Error occured: {e}")
+        return (False, row_count, writer.bytes_written, f"Error occured: {e}")
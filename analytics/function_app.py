@@ -1,135 +1,254 @@
 import azure.functions as func
 from azure.storage.blob import BlobServiceClient
 import datetime
+import hashlib
 import json
 import logging
 import csv
+import io
 import tempfile
+import time
 import pyodbc
 import os
+from concurrent.futures import ThreadPoolExecutor
+from result_cache import ResultCache, WATERMARK_METADATA_KEY
+from blob_export import stream_query_to_blob
+import report_queries
+from instrumentation import METRICS, PROFILER, export_metrics
 
 # ===================== Queries Consts ==========================================
 SELECT_ALL_QUERY = """
         SELECT * FROM VehicleData
     """
 
+# Q1-Q4 read the per-lane 5-minute rollup maintained by the ingestion worker (intermediateWorker/rollup.py)
+# instead of scanning VehicleData, so their cost grows with the number of buckets, not of vehicles
 VEHICLES_PER_LANE_QUERY = """
+        SELECT lane, SUM(vehicle_count) AS count_per_lane
+        FROM VehicleLaneRollup
+        GROUP BY lane
+        ORDER BY lane;
+    """
+
+SPEEDING_TOTAL_QUERY = """
+        SELECT COALESCE(SUM(speeding_count), 0) AS speeding_count
+        FROM VehicleLaneRollup
+    """
+
+VEHICLES_PER_5MIN_PER_LANE= """
+        SELECT time_bucket AS five_min_bucket, lane, vehicle_count AS count_per_bucket
+        FROM VehicleLaneRollup
+        ORDER BY five_min_bucket, lane;
+    """
+
+AVG_SPD_PER_LANE_PER_5MIN_QUERY = """
+        SELECT lane, time_bucket, ROUND(speed_sum / vehicle_count, 1) AS avg_speed_kmh
+        FROM VehicleLaneRollup
+        ORDER BY lane, time_bucket , avg_speed_kmh;
+    """
+
+# Same reports computed from the raw VehicleData table (source=raw), served by the persisted TimeBucket
+# column and the covering indexes of database/migrations/002_add_time_bucket_and_source.sql
+RAW_VEHICLES_PER_LANE_QUERY = """
         SELECT lane, COUNT(*) AS count_per_lane
         FROM VehicleData
         GROUP BY lane
         ORDER BY lane;
     """
 
-SPEEDING_TOTAL_QUERY = """
+RAW_SPEEDING_TOTAL_QUERY = """
         SELECT COUNT(*) AS speeding_count
         FROM VehicleData
         WHERE speeding = 1
     """
 
-VEHICLES_PER_5MIN_PER_LANE= """
-        SELECT FLOOR(TimeEntered / 300) AS five_min_bucket, lane,  COUNT(*) AS count_per_bucket
+RAW_VEHICLES_PER_5MIN_PER_LANE = """
+        SELECT TimeBucket AS five_min_bucket, lane, COUNT(*) AS count_per_bucket
         FROM VehicleData
-        GROUP BY lane, FLOOR(TimeEntered / 300)
+        GROUP BY lane, TimeBucket
         ORDER BY five_min_bucket, lane;
     """
 
-AVG_SPD_PER_LANE_PER_5MIN_QUERY = """
-        SELECT lane, FLOOR(TimeEntered / 300) AS time_bucket, ROUND(AVG(speed), 1) AS avg_speed_kmh
+RAW_AVG_SPD_PER_LANE_PER_5MIN_QUERY = """
+        SELECT lane, TimeBucket AS time_bucket, ROUND(AVG(speed), 1) AS avg_speed_kmh
         FROM VehicleData
-        GROUP BY lane, FLOOR(TimeEntered / 300)
+        GROUP BY lane, TimeBucket
         ORDER BY lane, time_bucket , avg_speed_kmh;
     """
 
+# Single scan of the rollup feeding every report of the "all reports" endpoint (Q1-Q4 are derived from it)
+# Lanes are ordered by SQL, as in the standalone queries (the collation is case-insensitive, Python's sort is not)
+ALL_REPORTS_SCAN_QUERY = """
+        SELECT lane, time_bucket, vehicle_count AS count_per_bucket, speeding_count,
+               ROUND(speed_sum / vehicle_count, 1) AS avg_speed_kmh
+        FROM VehicleLaneRollup
+        ORDER BY lane, time_bucket;
+    """
+
+# Max number of result blobs uploaded at the same time
+MAX_PARALLEL_UPLOADS = 4
+
+# Result blobs are reused while no new rows were ingested
+INGESTION_WATERMARK_QUERY = """
+        SELECT version FROM IngestionWatermark
+    """
+
+result_cache = ResultCache()
+
 app = func.FunctionApp()
 
 #===================== MAIN AZURE FUNCTIONS =========================================================================
 
 # Query 1: Get number of vehicles per lane
 @app.route(route="Q1", auth_level=func.AuthLevel.ANONYMOUS)
+@METRICS.timed("request_seconds", route="Q1")
+@PROFILER.profiled("GetVehPerLane")
 def GetVehPerLane(req: func.HttpRequest) -> func.HttpResponse:
-    
-    # Get necessary env variables
-    (env_configured, error_msg, SQL_STORAGE_CONN_STR, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME) = get_env_variables()
-    if( not env_configured):
-        func.HttpResponse(error_msg,status_code=500)
-    
-    # Query the SQL Storage
-    (was_successful,rows,headers,output_msg) = query_SQL_storage(SQL_STORAGE_CONN_STR, VEHICLES_PER_LANE_QUERY)
-    if( not was_successful):
-        return func.HttpResponse(output_msg,status_code=500)
-    
-    # Upload result of query to Azure Blob Storage
-    (upload_successful, error_msg) = save_csv_and_upload(rows,headers, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME, "VEHICLES_PER_LANE_QUERY.csv")
-    if( not upload_successful):
-        return func.HttpResponse(error_msg,status_code=500)
-
-    return func.HttpResponse("query executed successfully: vehicles per lane",status_code=200)
+    return run_report("Q1", req, VEHICLES_PER_LANE_QUERY, RAW_VEHICLES_PER_LANE_QUERY,
+                      "VEHICLES_PER_LANE_QUERY.csv", "vehicles per lane")
 
 
 # Query 2: Count the total speeding vehicles
 @app.route(route="Q2", auth_level=func.AuthLevel.ANONYMOUS)
+@METRICS.timed("request_seconds", route="Q2")
+@PROFILER.profiled("CountSpdVeh")
 def CountSpdVeh(req: func.HttpRequest) -> func.HttpResponse:
-    
-    # Get necessary env variables
-    (env_configured, error_msg, SQL_STORAGE_CONN_STR, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME) = get_env_variables()
-    if( not env_configured):
-        func.HttpResponse(error_msg,status_code=500)
-    
-    # Query the SQL Storage
-    (was_successful,rows,headers,output_msg) = query_SQL_storage(SQL_STORAGE_CONN_STR, SPEEDING_TOTAL_QUERY)
-    if( not was_successful):
-        return func.HttpResponse(output_msg,status_code=500)
-    
-    # Upload result of query to Azure Blob Storage
-    (upload_successful, error_msg) = save_csv_and_upload(rows,headers, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME, "SPEEDING_TOTAL_QUERY.csv")
-    if( not upload_successful):
-        return func.HttpResponse(error_msg,status_code=500)
-
-    return func.HttpResponse("query executed successfully: total speeding vehicles",status_code=200)
+    return run_report("Q2", req, SPEEDING_TOTAL_QUERY, RAW_SPEEDING_TOTAL_QUERY,
+                      "SPEEDING_TOTAL_QUERY.csv", "total speeding vehicles")
 
 
 # Query 3: Count the vehicles per 5 min per lane
 @app.route(route="Q3", auth_level=func.AuthLevel.ANONYMOUS)
+@METRICS.timed("request_seconds", route="Q3")
+@PROFILER.profiled("CntVehPerTimeAndLane")
 def CntVehPerTimeAndLane(req: func.HttpRequest) -> func.HttpResponse:
-    
+    return run_report("Q3", req, VEHICLES_PER_5MIN_PER_LANE, RAW_VEHICLES_PER_5MIN_PER_LANE,
+                      "VEHICLES_PER_5MIN_PER_LANE.csv", "vehicles per 5 min per lane")
+
+
+# Query 4: Find the average speed per lane per 5 mins
+@app.route(route="Q4", auth_level=func.AuthLevel.ANONYMOUS)
+@METRICS.timed("request_seconds", route="Q4")
+@PROFILER.profiled("AvgSpdPerTimeAndLane")
+def AvgSpdPerTimeAndLane(req: func.HttpRequest) -> func.HttpResponse:
+    return run_report("Q4", req, AVG_SPD_PER_LANE_PER_5MIN_QUERY, RAW_AVG_SPD_PER_LANE_PER_5MIN_QUERY,
+                      "AVG_SPD_PER_LANE_PER_5MIN_QUERY.csv", "average speed per lane per 5 mins")
+
+
+# All queries: Compute Q1-Q4 from a single scan on one connection and upload the results in parallel
+@app.route(route="QAll", auth_level=func.AuthLevel.ANONYMOUS)
+@METRICS.timed("request_seconds", route="QAll")
+@PROFILER.profiled("GetAllReports")
+def GetAllReports(req: func.HttpRequest) -> func.HttpResponse:
+    start_total = time.perf_counter()
+
     # Get necessary env variables
     (env_configured, error_msg, SQL_STORAGE_CONN_STR, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME) = get_env_variables()
     if( not env_configured):
-        func.HttpResponse(error_msg,status_code=500)
-    
-    # Query the SQL Storage
-    (was_successful,rows,headers,output_msg) = query_SQL_storage(SQL_STORAGE_CONN_STR, VEHICLES_PER_5MIN_PER_LANE)
+        return func.HttpResponse(error_msg,status_code=500)
+
+    # Skip everything if all result blobs are already up to date
+    (watermark, cache_hit) = check_result_cache(SQL_STORAGE_CONN_STR, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME,
+                                                [blob_name for (blob_name, _) in REPORT_DERIVATIONS])
+    if(cache_hit):
+        response_body = {
+            "status": "query result up to date: all reports",
+            "watermark": watermark,
+            "total_ms": round((time.perf_counter() - start_total) * 1000, 3),
+        }
+        return func.HttpResponse(json.dumps(response_body), mimetype="application/json", status_code=200)
+
+    # Query the SQL Storage once
+    start_scan = time.perf_counter()
+    (was_successful,rows,headers,output_msg) = query_SQL_storage(SQL_STORAGE_CONN_STR, ALL_REPORTS_SCAN_QUERY)
     if( not was_successful):
         return func.HttpResponse(output_msg,status_code=500)
-    
-    # Upload result of query to Azure Blob Storage
-    (upload_successful, error_msg) = save_csv_and_upload(rows,headers, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME, "VEHICLES_PER_5MIN_PER_LANE.csv")
+    scan_ms = (time.perf_counter() - start_scan) * 1000
+
+    # Derive every report from the grouped rows
+    timings = {}
+    reports = []
+    for (blob_name, derive_report) in REPORT_DERIVATIONS:
+        start_derive = time.perf_counter()
+        (report_headers, report_rows) = derive_report(rows)
+        timings[blob_name] = {"derive_ms": round((time.perf_counter() - start_derive) * 1000, 3)}
+        reports.append((blob_name, report_headers, report_rows))
+
+    # Upload result of every query to Azure Blob Storage in parallel
+    start_upload = time.perf_counter()
+    (upload_successful, error_msg, upload_timings) = upload_csvs_in_parallel(reports, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME, watermark)
     if( not upload_successful):
         return func.HttpResponse(error_msg,status_code=500)
+    upload_ms = (time.perf_counter() - start_upload) * 1000
 
-    return func.HttpResponse("query executed successfully: vehicles per 5 min per lane",status_code=200)
+    for (blob_name, upload_time_ms) in upload_timings.items():
+        timings[blob_name]["upload_ms"] = upload_time_ms
+        result_cache.store(blob_name, watermark)
 
+    response_body = {
+        "status": "query executed successfully: all reports",
+        "watermark": watermark,
+        "scan_ms": round(scan_ms, 3),
+        "upload_ms": round(upload_ms, 3),
+        "total_ms": round((time.perf_counter() - start_total) * 1000, 3),
+        "reports": timings,
+    }
+    return func.HttpResponse(json.dumps(response_body), mimetype="application/json", status_code=200)
+
+
+# Export: Stream every vehicle record to a (optionally gzip compressed) CSV blob with constant memory
+@app.route(route="export", auth_level=func.AuthLevel.ANONYMOUS)
+@METRICS.timed("request_seconds", route="export")
+@PROFILER.profiled("ExportAllVehicles")
+def ExportAllVehicles(req: func.HttpRequest) -> func.HttpResponse:
 
-# Query 4: Find the average speed per lane per 5 mins
-@app.route(route="Q4", auth_level=func.AuthLevel.ANONYMOUS)
-def AvgSpdPerTimeAndLane(req: func.HttpRequest) -> func.HttpResponse:
-    
     # Get necessary env variables
     (env_configured, error_msg, SQL_STORAGE_CONN_STR, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME) = get_env_variables()
     if( not env_configured):
-        func.HttpResponse(error_msg,status_code=500)
-    
-    # Query the SQL Storage
-    (was_successful,rows,headers,output_msg) = query_SQL_storage(SQL_STORAGE_CONN_STR, AVG_SPD_PER_LANE_PER_5MIN_QUERY)
-    if( not was_successful):
-        return func.HttpResponse(output_msg,status_code=500)
-    
-    # Upload result of query to Azure Blob Storage
-    (upload_successful, error_msg) = save_csv_and_upload(rows,headers, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME, "AVG_SPD_PER_LANE_PER_5MIN_QUERY.csv")
-    if( not upload_successful):
         return func.HttpResponse(error_msg,status_code=500)
 
-    return func.HttpResponse("query executed successfully: average speed per lane per 5 mins",status_code=200)
+    compress = req.params.get("compress", "").lower() in ("1", "true", "gzip")
+    blob_output_filename = "SELECT_ALL_QUERY.csv.gz" if compress else "SELECT_ALL_QUERY.csv"
+
+    # Skip the export if the result blob is already up to date
+    (watermark, cache_hit) = check_result_cache(SQL_STORAGE_CONN_STR, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME, blob_output_filename)
+    if(cache_hit):
+        return func.HttpResponse(f"export up to date: {blob_output_filename}",status_code=200)
+
+    # Stream the query results straight into staged blocks of the output blob
+    blob_service_client = BlobServiceClient.from_connection_string(BLOB_CONNECT_STR)
+    blob_client = blob_service_client.get_blob_client(container=BLOB_CONTAINER_NAME, blob=blob_output_filename)
+    (export_successful, row_count, bytes_written, error_msg) = stream_query_to_blob(
+        SQL_STORAGE_CONN_STR, SELECT_ALL_QUERY, blob_client, compress, watermark_metadata(watermark))
+    if( not export_successful):
+        return func.HttpResponse(error_msg,status_code=500)
+    result_cache.store(blob_output_filename, watermark)
+
+    return func.HttpResponse(f"export executed successfully: {row_count} records, {bytes_written} bytes to {blob_output_filename}",status_code=200)
+
+
+# Result cache hit-rate metrics
+@app.route(route="cache/stats", auth_level=func.AuthLevel.ANONYMOUS)
+def GetCacheStats(req: func.HttpRequest) -> func.HttpResponse:
+    return func.HttpResponse(json.dumps(result_cache.stats()), mimetype="application/json", status_code=200)
+
+
+# Metrics of this app in Prometheus text format (?format=json for a JSON snapshot)
+@app.route(route="metrics", auth_level=func.AuthLevel.FUNCTION)
+def GetMetrics(req: func.HttpRequest) -> func.HttpResponse:
+    (body, mimetype) = export_metrics(req.params.get("format", "prometheus"))
+    return func.HttpResponse(body, mimetype=mimetype, status_code=200)
+
+
+# Profiling status and summary of the last profiled request (?arm=N profiles the next N requests)
+@app.route(route="profile", auth_level=func.AuthLevel.FUNCTION)
+def GetProfile(req: func.HttpRequest) -> func.HttpResponse:
+    if req.params.get("arm"):
+        try:
+            PROFILER.arm(int(req.params.get("arm")))
+        except ValueError:
+            return func.HttpResponse("'arm' must be a non-negative integer.", status_code=400)
+    return func.HttpResponse(json.dumps(PROFILER.status()), mimetype="application/json", status_code=200)
 
 
 
@@ -154,21 +273,161 @@ def get_env_variables() -> tuple[bool, str, str, str, str]:
     
     return (True, "", SQL_STORAGE_CONN_STR, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME)
 
-# Helper function for the querying the SQL storage
+# Helper function to answer a Q1-Q4 request: a filtered report, or the whole report read from the rollup
+# (default) or the raw table and uploaded as a CSV blob, unless that blob is already up to date
+def run_report(report: str, req: func.HttpRequest, rollup_query: str, raw_query: str, blob_output_filename: str, description: str) -> func.HttpResponse:
+
+    # Get necessary env variables
+    (env_configured, error_msg, SQL_STORAGE_CONN_STR, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME) = get_env_variables()
+    if( not env_configured):
+        return func.HttpResponse(error_msg,status_code=500)
+
+    # Time-windowed, lane/video filtered, re-bucketed or paginated requests are answered by a parameterised query
+    if(report_queries.has_report_filters(req.params)):
+        return run_filtered_report(report, req, SQL_STORAGE_CONN_STR, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME)
+
+    # Read the rollup (default) or the indexed raw table
+    raw_source = use_raw_source(req)
+    query = raw_query if raw_source else rollup_query
+    blob_output_filename = source_output_filename(blob_output_filename, raw_source)
+
+    # Skip the query and the upload if the result blob is already up to date
+    (watermark, cache_hit) = check_result_cache(SQL_STORAGE_CONN_STR, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME, blob_output_filename)
+    if(cache_hit):
+        return func.HttpResponse(f"query result up to date: {description}",status_code=200)
+
+    # Query the SQL Storage
+    (was_successful,rows,headers,output_msg) = query_SQL_storage(SQL_STORAGE_CONN_STR, query)
+    if( not was_successful):
+        return func.HttpResponse(output_msg,status_code=500)
+
+    # Upload result of query to Azure Blob Storage
+    (upload_successful, error_msg) = save_csv_and_upload(rows,headers, BLOB_CONNECT_STR, BLOB_CONTAINER_NAME, blob_output_filename, watermark)
+    if( not upload_successful):
+        return func.HttpResponse(error_msg,status_code=500)
+    result_cache.store(blob_output_filename, watermark)
+
+    return func.HttpResponse(f"query executed successfully: {description}",status_code=200)
+
+# Helper function to answer a filtered report request: a JSON page (default) or a CSV blob (format=blob)
+# Parameters: start / end (TimeEntered seconds, [start, end)), lane (comma separated), video (SourceVideo),
+# bucketSeconds, source, limit and cursor (keyset pagination token returned as next_cursor)
+def run_filtered_report(report: str, req: func.HttpRequest, conn_str: str, blob_conn_str: str, container_name: str) -> func.HttpResponse:
+
+    (filters_valid, filters, error_msg) = report_queries.parse_report_filters(req.params, report)
+    if( not filters_valid):
+        return func.HttpResponse(error_msg,status_code=400)
+
+    start = time.perf_counter()
+
+    # Full filtered result streamed to a blob named after the filters
+    if(filters["format"] == "blob"):
+        (query, params, source) = report_queries.build_report_query(report, filters, paginate=False)
+        filters_key = json.dumps({name: req.params.get(name) for name in sorted(req.params.keys())}, sort_keys=True)
+        blob_output_filename = f"{report}_{hashlib.sha1(filters_key.encode('utf-8')).hexdigest()[:12]}.csv"
+
+        blob_service_client = BlobServiceClient.from_connection_string(blob_conn_str)
+        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_output_filename)
+        (export_successful, row_count, _, error_msg) = stream_query_to_blob(conn_str, query, blob_client, params=params)
+        if( not export_successful):
+            return func.HttpResponse(error_msg,status_code=500)
+
+        response_body = {"report": report, "source": source, "blob": blob_output_filename, "row_count": row_count,
+                         "query_ms": round((time.perf_counter() - start) * 1000, 3)}
+        return func.HttpResponse(json.dumps(response_body), mimetype="application/json", status_code=200)
+
+    # One page returned inline
+    (query, params, source) = report_queries.build_report_query(report, filters)
+    (was_successful, rows, headers, output_msg) = query_SQL_storage_with_params(conn_str, query, params)
+    if( not was_successful):
+        return func.HttpResponse(output_msg,status_code=500)
+
+    next_cursor = None
+    if(len(rows) > filters["limit"]):
+        rows = rows[:filters["limit"]]
+        next_cursor = report_queries.encode_cursor(report_queries.cursor_values(report, rows[-1]))
+
+    response_body = {
+        "report": report,
+        "source": source,
+        "columns": headers,
+        "rows": [list(row) for row in rows],
+        "row_count": len(rows),
+        "next_cursor": next_cursor,
+        "query_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+    return func.HttpResponse(json.dumps(response_body, default=str), mimetype="application/json", status_code=200)
+
+# Helper function to read the optional 'source' parameter: the rollup (default) or the raw table ('raw')
+# Both produce the same results, the raw table is there to verify the rollup and for benchmarking
+def use_raw_source(req: func.HttpRequest) -> bool:
+    return req.params.get("source", "rollup").lower() == "raw"
+
+# Helper function to get the result blob name of a report for its source, raw results never replace (or hit
+# the cache entry of) the rollup results
+def source_output_filename(blob_output_filename: str, raw_source: bool) -> str:
+    if( not raw_source):
+        return blob_output_filename
+    (name, extension) = os.path.splitext(blob_output_filename)
+    return f"{name}_RAW{extension}"
+
+# Helper function to read the current ingestion watermark, None if it cannot be read
+def get_ingestion_watermark(conn_str: str) -> int:
+
+    try:
+        with pyodbc.connect(conn_str) as conn:
+            with conn.cursor() as cursor:
+                with METRICS.timer("sql_query_seconds", kind="watermark"):
+                    cursor.execute(INGESTION_WATERMARK_QUERY)
+                    row = cursor.fetchone()
+                return int(row[0]) if row else None
+
+    except Exception as e:
+        logging.warning(f"Could not read the ingestion watermark, result cache bypassed: {e}")
+        return None
+
+# Helper function to check if the result blob(s) of a query are up to date with the ingested data
+# The watermark is read before the query runs, so a result is never labelled newer than its data
+def check_result_cache(conn_str: str, blob_conn_str: str, container_name: str, blob_output_filenames) -> tuple[int, bool]:
+
+    if isinstance(blob_output_filenames, str):
+        blob_output_filenames = [blob_output_filenames]
+
+    watermark = get_ingestion_watermark(conn_str)
+    if(watermark is None):
+        return (None, False)
+
+    # Every blob is looked up (and counted as a hit or miss), not only the ones before the first miss
+    all_hit = True
+    try:
+        blob_service_client = BlobServiceClient.from_connection_string(blob_conn_str)
+        for blob_output_filename in blob_output_filenames:
+            blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_output_filename)
+            hit = result_cache.lookup(blob_output_filename, watermark, blob_client)
+            METRICS.inc("result_cache_lookups_total", outcome="hit" if hit else "miss")
+            all_hit = all_hit and hit
+
+    except Exception as e:
+        logging.warning(f"Result cache lookup failed: {e}")
+        METRICS.inc("result_cache_lookups_total", outcome="error")
+        return (watermark, False)
+
+    if(all_hit):
+        logging.info(f"Result cache hit for {blob_output_filenames} at watermark {watermark}")
+    return (watermark, all_hit)
+
+# Helper function for the querying the SQL storage, an empty result is a valid (empty) report
 def query_SQL_storage(conn_str: str, query: str) -> tuple[bool, list, list, str]:
     
     try:
         with pyodbc.connect(conn_str) as conn:
             with conn.cursor() as cursor:
                 # execute the requested query
-                cursor.execute(query)
-                rows = cursor.fetchall()
+                with METRICS.timer("sql_query_seconds", kind="report"):
+                    cursor.execute(query)
+                    rows = cursor.fetchall()
                 headers = [desc[0] for desc in cursor.description]
-                                                
-                if(len(rows) == 0):
-                    logging.info(f"No records found by the query")
-                    return (False,None,None,"No records found by the query")
-                
+
                 # return the query results
                 logging.info(f"Found {len(rows)} records with the query")
                 return (True,rows,headers,"")
@@ -178,8 +437,26 @@ def query_SQL_storage(conn_str: str, query: str) -> tuple[bool, list, list, str]
         return (False,None,None,f"Connection Error: {e}")
 
 
+# Helper function for parameterised queries, an empty result is a valid (empty) page
+def query_SQL_storage_with_params(conn_str: str, query: str, params: list) -> tuple[bool, list, list, str]:
+
+    try:
+        with pyodbc.connect(conn_str) as conn:
+            with conn.cursor() as cursor:
+                with METRICS.timer("sql_query_seconds", kind="filtered"):
+                    cursor.execute(query, params)
+                    rows = cursor.fetchall()
+                headers = [desc[0] for desc in cursor.description]
+                logging.info(f"Found {len(rows)} records with the query")
+                return (True,rows,headers,"")
+
+    except Exception as e:
+        logging.error(f"Connection Error: {e}")
+        return (False,None,None,f"Connection Error: {e}")
+
+
 # Helper function to save the query results to a local csv and upload them to blob storage  
-def save_csv_and_upload(rows:list, headers:list, blob_conn_str:str, container_name:str, blob_output_filename:str)-> tuple[bool, str]:
+def save_csv_and_upload(rows:list, headers:list, blob_conn_str:str, container_name:str, blob_output_filename:str, watermark:int=None)-> tuple[bool, str]:
     
     try:
         # Create a temporary CSV file
@@ -193,8 +470,10 @@ def save_csv_and_upload(rows:list, headers:list, blob_conn_str:str, container_na
         # Upload to Azure Blob Storage
         blob_service_client = BlobServiceClient.from_connection_string(blob_conn_str)
         blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_output_filename)
-        with open(temp_file_path, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True)
+        with METRICS.timer("blob_upload_seconds", container=container_name):
+            with open(temp_file_path, "rb") as data:
+                blob_client.upload_blob(data, overwrite=True, metadata=watermark_metadata(watermark))
+        METRICS.inc("blob_upload_bytes_total", os.path.getsize(temp_file_path), container=container_name)
 
         # Cleanup local file
         os.remove(temp_file_path)
@@ -202,4 +481,82 @@ def save_csv_and_upload(rows:list, headers:list, blob_conn_str:str, container_na
     
     except Exception as e:
         logging.error(f"Error occured: {e}")
-        return (False,f"Error occured: {e}")    
\ No newline at end of file
+        return (False,f"Error occured: {e}")
+
+
+# Helper function to tag a result blob with the ingestion watermark it was computed at
+def watermark_metadata(watermark:int) -> dict:
+    return {WATERMARK_METADATA_KEY: str(watermark)} if watermark is not None else None
+
+
+# Helper function to write query results as CSV in memory and upload them with a shared blob client
+def upload_csv(rows:list, headers:list, blob_service_client:BlobServiceClient, container_name:str, blob_output_filename:str, watermark:int=None) -> float:
+    start = time.perf_counter()
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    writer.writerows(rows)
+
+    data = buffer.getvalue().encode('utf-8')
+
+    blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_output_filename)
+    with METRICS.timer("blob_upload_seconds", container=container_name):
+        blob_client.upload_blob(data, overwrite=True, metadata=watermark_metadata(watermark))
+    METRICS.inc("blob_upload_bytes_total", len(data), container=container_name)
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+# Helper function to upload several (blob name, headers, rows) reports at the same time
+def upload_csvs_in_parallel(reports:list, blob_conn_str:str, container_name:str, watermark:int=None) -> tuple[bool, str, dict]:
+
+    try:
+        blob_service_client = BlobServiceClient.from_connection_string(blob_conn_str)
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_UPLOADS) as executor:
+            futures = {
+                blob_name: executor.submit(upload_csv, rows, headers, blob_service_client, container_name, blob_name, watermark)
+                for (blob_name, headers, rows) in reports
+            }
+            upload_timings = {blob_name: future.result() for (blob_name, future) in futures.items()}
+        return (True, "", upload_timings)
+
+    except Exception as e:
+        logging.error(f"Error occured: {e}")
+        return (False, f"Error occured: {e}", {})
+
+
+#===================== REPORT DERIVATIONS =====================================================================
+# Each function receives the rows of ALL_REPORTS_SCAN_QUERY, ordered by lane and time_bucket:
+# (lane, time_bucket, count_per_bucket, speeding_count, avg_speed_kmh)
+# and returns the same headers and rows as the matching standalone query. Lanes are never compared in Python,
+# their order is the one SQL returned
+
+# Q1: same as VEHICLES_PER_LANE_QUERY
+def derive_vehicles_per_lane(rows:list) -> tuple[list, list]:
+    counts = {}
+    for row in rows:
+        counts[row[0]] = counts.get(row[0], 0) + row[2]
+    return (["lane", "count_per_lane"], list(counts.items()))
+
+# Q2: same as SPEEDING_TOTAL_QUERY
+def derive_speeding_total(rows:list) -> tuple[list, list]:
+    return (["speeding_count"], [(sum(row[3] for row in rows),)])
+
+# Q3: same as VEHICLES_PER_5MIN_PER_LANE
+def derive_vehicles_per_5min_per_lane(rows:list) -> tuple[list, list]:
+    # Stable sort on the bucket only, the lanes of a bucket keep their SQL order
+    report_rows = sorted(((row[1], row[0], row[2]) for row in rows), key=lambda r: r[0])
+    return (["five_min_bucket", "lane", "count_per_bucket"], report_rows)
+
+# Q4: same as AVG_SPD_PER_LANE_PER_5MIN_QUERY
+def derive_avg_speed_per_lane_per_5min(rows:list) -> tuple[list, list]:
+    report_rows = [(row[0], row[1], row[4]) for row in rows]
+    return (["lane", "time_bucket", "avg_speed_kmh"], report_rows)
+
+
+# Output blob name and derivation of every report produced by the "all reports" endpoint
+REPORT_DERIVATIONS = [
+    ("VEHICLES_PER_LANE_QUERY.csv", derive_vehicles_per_lane),
+    ("SPEEDING_TOTAL_QUERY.csv", derive_speeding_total),
+    ("VEHICLES_PER_5MIN_PER_LANE.csv", derive_vehicles_per_5min_per_lane),
+    ("AVG_SPD_PER_LANE_PER_5MIN_QUERY.csv", derive_avg_speed_per_lane_per_5min),
+]
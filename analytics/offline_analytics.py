@@ -0,0 +1,226 @@
+"""
+Offline, in-process version of the analytics queries (Q1-Q4) over the analyzer's intermediate CSV files.
+
+Used for ad-hoc analysis and local benchmarking without loading anything into Azure SQL. Results
+follow the SQL definitions in function_app.py (5-minute buckets = FLOOR(TimeEntered / 300), averages
+rounded like SQL Server's ROUND(x, 1)) and are written to the same CSV files with the same headers.
+
+Every CSV is parsed once and cached as a binary .npy file next to it, later runs memory-map the
+cache. The group-by itself is NumPy-vectorized (bincount over a combined lane/bucket key).
+Requires numpy, which is not part of the deployed function app requirements.
+
+Usage:
+    python offline_analytics.py intermediate-results/*.csv --output-dir reports
+    python offline_analytics.py --synthetic 5000000 --benchmark
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+import numpy as np
+from report_queries import ROLLUP_BUCKET_SECONDS
+
+# Columnar layout of one intermediate record, lanes are short labels ("in" / "out")
+RECORD_DTYPE = np.dtype([
+    ("vehicleId", "<i8"),
+    ("timeEntered", "<f8"),
+    ("speed", "<f8"),
+    ("vehicleType", "S8"),
+    ("lane", "S8"),
+    ("speeding", "<i1"),
+])
+
+# Output file name of every report, same as the analytics function app
+REPORT_FILES = {
+    "vehicles_per_lane": "VEHICLES_PER_LANE_QUERY.csv",
+    "speeding_total": "SPEEDING_TOTAL_QUERY.csv",
+    "vehicles_per_5min_per_lane": "VEHICLES_PER_5MIN_PER_LANE.csv",
+    "avg_speed_per_lane_per_5min": "AVG_SPD_PER_LANE_PER_5MIN_QUERY.csv",
+}
+
+
+#===================== LOADING =====================================================================
+
+# Helper function to parse one intermediate CSV into a structured array
+def parse_csv(csv_path: str) -> np.ndarray:
+    with open(csv_path, newline='') as f:
+        reader = csv.DictReader(f)
+        rows = [
+            (int(row['vehicleId']), float(row['timeEntered']), float(row['speed']),
+             row['vehicleType'].encode(), row['lane'].encode(), int(row['speeding']))
+            for row in reader
+        ]
+    return np.array(rows, dtype=RECORD_DTYPE)
+
+
+# Helper function to load one CSV through its .npy cache (rebuilt when the CSV is newer)
+def load_csv(csv_path: str, cache_dir: str = None) -> np.ndarray:
+    cache_path = os.path.join(cache_dir or os.path.dirname(csv_path) or ".", os.path.basename(csv_path) + ".npy")
+
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        return np.load(cache_path, mmap_mode="r")
+
+    records = parse_csv(csv_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    np.save(cache_path, records)
+    return np.load(cache_path, mmap_mode="r")
+
+
+# Helper function to load and concatenate several intermediate files
+def load_records(csv_paths: list, cache_dir: str = None) -> np.ndarray:
+    parts = [load_csv(path, cache_dir) for path in csv_paths]
+    if not parts:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+# Helper function to generate reproducible synthetic records, for benchmarking
+def generate_synthetic_records(count: int, duration_seconds: float = 3600.0, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    records = np.empty(count, dtype=RECORD_DTYPE)
+    records["vehicleId"] = np.arange(count)
+    records["timeEntered"] = np.round(rng.uniform(0, duration_seconds, count), 2)
+    is_car = rng.random(count) < 0.8
+    records["vehicleType"] = np.where(is_car, b"car", b"truck")
+    records["lane"] = np.where(rng.random(count) < 0.5, b"in", b"out")
+    records["speed"] = np.round(rng.normal(np.where(is_car, 85.0, 75.0), 12.0).clip(20.0, 199.0), 1)
+    records["speeding"] = np.where(is_car, records["speed"] > 90.0, records["speed"] > 80.0)
+    return records
+
+
+#===================== VECTORIZED GROUP BY =====================================================================
+
+# Helper function to round like SQL Server ROUND(x, 1) (half away from zero) instead of NumPy's half to even
+def sql_round_1(values: np.ndarray) -> np.ndarray:
+    return np.sign(values) * np.floor(np.abs(values) * 10.0 + 0.5) / 10.0
+
+
+# Helper function to map lane labels to dense codes, codes follow the sorted (ORDER BY lane) order
+def factorize_lanes(lanes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # 8-byte labels compare as one uint64, far cheaper to sort than strings
+    as_int = np.ascontiguousarray(lanes).view(np.uint64)
+    unique_ints, codes = np.unique(as_int, return_inverse=True)
+    labels = unique_ints.view("S8")
+
+    order = np.argsort(labels)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return (labels[order], rank[codes])
+
+
+# Compute the aggregates of every (lane, 5-minute bucket): the same rows as the VehicleLaneRollup table
+def compute_rollup(records: np.ndarray, bucket_seconds: int = ROLLUP_BUCKET_SECONDS) -> dict:
+    if len(records) == 0:
+        empty = np.empty(0)
+        return {"lanes": np.empty(0, dtype="S8"), "lane_code": empty.astype(np.int64), "bucket": empty.astype(np.int64),
+                "count": empty.astype(np.int64), "speed_sum": empty, "speeding_count": empty.astype(np.int64)}
+
+    (lanes, lane_codes) = factorize_lanes(records["lane"])
+    buckets = np.floor(np.asarray(records["timeEntered"]) / bucket_seconds).astype(np.int64)
+    min_bucket = buckets.min()
+    n_lanes = len(lanes)
+
+    # Bucket-major, lane-minor key -> results come out in (bucket, lane) order
+    keys = (buckets - min_bucket) * n_lanes + lane_codes
+    n_keys = int(keys.max()) + 1
+    speeding = (np.asarray(records["speeding"]) == 1).astype(np.float64)
+    speeds = np.asarray(records["speed"], dtype=np.float64)
+
+    if n_keys <= 4 * len(records):
+        counts = np.bincount(keys, minlength=n_keys)
+        present = np.flatnonzero(counts)
+        speed_sums = np.bincount(keys, weights=speeds, minlength=n_keys)[present]
+        speeding_counts = np.bincount(keys, weights=speeding, minlength=n_keys)[present]
+        counts = counts[present]
+    else:
+        # Very sparse key space (huge time range): fall back to a sort based group by
+        (present, inverse) = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse)
+        speed_sums = np.bincount(inverse, weights=speeds)
+        speeding_counts = np.bincount(inverse, weights=speeding)
+
+    return {
+        "lanes": lanes,
+        "lane_code": present % n_lanes,
+        "bucket": present // n_lanes + min_bucket,
+        "count": counts.astype(np.int64),
+        "speed_sum": speed_sums,
+        "speeding_count": speeding_counts.astype(np.int64),
+    }
+
+
+# Compute Q1-Q4 as (headers, rows) tuples, matching the analytics function app output
+def compute_reports(records: np.ndarray) -> dict:
+    rollup = compute_rollup(records)
+    lane_names = [lane.decode() for lane in rollup["lanes"]]
+    lanes = np.array(lane_names, dtype=object)[rollup["lane_code"]] if lane_names else np.empty(0, dtype=object)
+
+    # Q1: vehicles per lane, ORDER BY lane
+    per_lane = np.bincount(rollup["lane_code"], weights=rollup["count"], minlength=len(lane_names)).astype(np.int64)
+    q1_rows = list(zip(lane_names, per_lane.tolist()))
+
+    # Q2: total speeding vehicles
+    q2_rows = [(int(rollup["speeding_count"].sum()),)]
+
+    # Q3: vehicles per 5 min per lane, ORDER BY five_min_bucket, lane (already the rollup order)
+    q3_rows = list(zip(rollup["bucket"].tolist(), lanes.tolist(), rollup["count"].tolist()))
+
+    # Q4: average speed per lane per 5 min, ORDER BY lane, time_bucket
+    averages = sql_round_1(rollup["speed_sum"] / np.maximum(rollup["count"], 1))
+    order = np.lexsort((rollup["bucket"], rollup["lane_code"]))
+    q4_rows = list(zip(lanes[order].tolist(), rollup["bucket"][order].tolist(), averages[order].tolist()))
+
+    return {
+        "vehicles_per_lane": (["lane", "count_per_lane"], q1_rows),
+        "speeding_total": (["speeding_count"], q2_rows),
+        "vehicles_per_5min_per_lane": (["five_min_bucket", "lane", "count_per_bucket"], q3_rows),
+        "avg_speed_per_lane_per_5min": (["lane", "time_bucket", "avg_speed_kmh"], q4_rows),
+    }
+
+
+# Helper function to write every report with the same file names as the analytics function app
+def write_reports(reports: dict, output_dir: str) -> list:
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for (report_name, (headers, rows)) in reports.items():
+        path = os.path.join(output_dir, REPORT_FILES[report_name])
+        with open(path, "w", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(rows)
+        written.append(path)
+    return written
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Compute the Q1-Q4 traffic reports from intermediate CSV files")
+    parser.add_argument("csv_files", nargs="*", help="Intermediate result CSV files produced by the analyzer")
+    parser.add_argument("--output-dir", default="reports", help="Directory for the report CSVs")
+    parser.add_argument("--cache-dir", default=None, help="Directory for the .npy caches (default: next to each CSV)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic records instead of CSV files")
+    parser.add_argument("--benchmark", action="store_true", help="Print load and compute timings")
+    args = parser.parse_args(argv)
+
+    if not args.csv_files and not args.synthetic:
+        parser.error("pass intermediate CSV files or --synthetic N")
+
+    start = time.perf_counter()
+    records = generate_synthetic_records(args.synthetic) if args.synthetic else load_records(args.csv_files, args.cache_dir)
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reports = compute_reports(records)
+    compute_s = time.perf_counter() - start
+
+    written = write_reports(reports, args.output_dir)
+    print(f"Wrote {len(written)} reports for {len(records)} records to {args.output_dir}")
+    if args.benchmark:
+        print(f"Load: {load_s * 1000:.1f} ms, compute: {compute_s * 1000:.1f} ms "
+              f"({len(records) / compute_s / 1e6 if compute_s else float('inf'):.1f} M records/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
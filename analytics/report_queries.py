@@ -0,0 +1,244 @@
+import base64
+import json
+import math
+
+# Granularity of VehicleData.TimeBucket and of the rollup buckets. The source of truth is the TimeBucket column
+# of database/migrations/002_add_time_bucket_and_source.sql, the rest of analytics imports this constant
+ROLLUP_BUCKET_SECONDS = 300
+
+# Page size of inline JSON results
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+# Table, bucket column and aggregates of each source the reports can be computed from
+SOURCES = {
+    "rollup": {
+        "table": "VehicleLaneRollup",
+        "bucket_column": "time_bucket",
+        "count": "SUM(vehicle_count)",
+        "speeding_count": "SUM(speeding_count)",
+        "avg_speed": "ROUND(SUM(speed_sum) / SUM(vehicle_count), 1)",
+    },
+    "raw": {
+        "table": "VehicleData",
+        "bucket_column": "TimeBucket",
+        "count": "COUNT(*)",
+        "speeding_count": "COUNT(*)",
+        "avg_speed": "ROUND(AVG(speed), 1)",
+    },
+}
+
+REPORT_NAMES = ("Q1", "Q2", "Q3", "Q4")
+
+# Query parameters that switch a report endpoint to the filtered / paginated mode
+FILTER_PARAMS = ("start", "end", "lane", "video", "bucketSeconds", "limit", "cursor", "format")
+
+# Types of the keyset cursor values of each report, the key columns of its ORDER BY
+CURSOR_TYPES = {
+    "Q1": (str,),
+    "Q2": (),
+    "Q3": (int, str),
+    "Q4": (str, int),
+}
+
+# Segments of a video are ingested as <video>_part<N>, see VideoSegmenter
+CLIP_SUFFIX = "_part"
+
+
+# Helper function to check if a request asks for a filtered or paginated report
+def has_report_filters(params) -> bool:
+    return any(params.get(name) is not None for name in FILTER_PARAMS)
+
+
+# Helper function to validate the filter parameters of a report request
+def parse_report_filters(params, report: str) -> tuple[bool, dict, str]:
+    filters = {"start": None, "end": None, "lanes": [], "video": None, "bucket_seconds": ROLLUP_BUCKET_SECONDS,
+               "limit": DEFAULT_PAGE_SIZE, "cursor": None, "format": "json",
+               "source": params.get("source", "rollup").lower()}
+
+    try:
+        for name in ("start", "end"):
+            if params.get(name) is not None:
+                filters[name] = float(params.get(name))
+        if params.get("bucketSeconds") is not None:
+            filters["bucket_seconds"] = int(params.get("bucketSeconds"))
+        if params.get("limit") is not None:
+            filters["limit"] = int(params.get("limit"))
+    except ValueError:
+        return (False, filters, "'start' and 'end' must be numbers, 'bucketSeconds' and 'limit' integers")
+
+    if filters["start"] is not None and filters["end"] is not None and filters["start"] >= filters["end"]:
+        return (False, filters, "'start' must be before 'end'")
+    if filters["bucket_seconds"] <= 0:
+        return (False, filters, "'bucketSeconds' must be positive")
+    if not 1 <= filters["limit"] <= MAX_PAGE_SIZE:
+        return (False, filters, f"'limit' must be between 1 and {MAX_PAGE_SIZE}")
+
+    if params.get("lane"):
+        filters["lanes"] = [lane.strip() for lane in params.get("lane").split(",") if lane.strip()]
+    filters["video"] = params.get("video") or None
+
+    filters["format"] = params.get("format", "json").lower()
+    if filters["format"] not in ("json", "blob"):
+        return (False, filters, "'format' must be 'json' or 'blob'")
+
+    if params.get("cursor"):
+        try:
+            filters["cursor"] = decode_cursor(params.get("cursor"), report)
+        except ValueError:
+            return (False, filters, "Invalid 'cursor'")
+
+    return (True, filters, "")
+
+
+# Helper function to pick the cheapest source that can answer the filters exactly
+# The rollup only knows whole 5-minute buckets and has no per-video breakdown
+def choose_source(filters: dict) -> str:
+    if filters["source"] == "raw" or filters["video"] is not None:
+        return "raw"
+    if filters["bucket_seconds"] % ROLLUP_BUCKET_SECONDS != 0:
+        return "raw"
+    for name in ("start", "end"):
+        if filters[name] is not None and filters[name] % ROLLUP_BUCKET_SECONDS != 0:
+            return "raw"
+    return "rollup"
+
+
+# Helper function to build the SQL bucket expression for the requested bucket size
+def bucket_expression(source: str, bucket_seconds: int) -> str:
+    bucket_column = SOURCES[source]["bucket_column"]
+    if bucket_seconds % ROLLUP_BUCKET_SECONDS == 0:
+        factor = bucket_seconds // ROLLUP_BUCKET_SECONDS
+        return bucket_column if factor == 1 else f"{bucket_column} / {factor}"
+    # bucket_seconds is a validated int, safe to inline (a parameter could not be matched with GROUP BY)
+    return f"CAST(FLOOR(TimeEntered / {bucket_seconds}) AS INT)"
+
+
+# Helper function to build the sargable WHERE predicates of the time, lane and video filters
+def build_predicates(source: str, filters: dict) -> tuple[list, list]:
+    predicates = []
+    params = []
+    bucket_column = SOURCES[source]["bucket_column"]
+
+    # The bucket range lets SQL seek on the (TimeBucket, lane) / (lane, time_bucket) indexes,
+    # on the raw table the exact TimeEntered range then trims the first and last bucket
+    if filters["start"] is not None:
+        predicates.append(f"{bucket_column} >= ?")
+        params.append(int(math.floor(filters["start"] / ROLLUP_BUCKET_SECONDS)))
+        if source == "raw":
+            predicates.append("TimeEntered >= ?")
+            params.append(filters["start"])
+
+    if filters["end"] is not None:
+        if source == "raw":
+            predicates.append(f"{bucket_column} <= ?")
+            params.append(int(math.floor(filters["end"] / ROLLUP_BUCKET_SECONDS)))
+            predicates.append("TimeEntered < ?")
+            params.append(filters["end"])
+        else:
+            predicates.append(f"{bucket_column} < ?")
+            params.append(int(filters["end"] // ROLLUP_BUCKET_SECONDS))
+
+    if filters["lanes"]:
+        predicates.append(f"lane IN ({', '.join('?' for _ in filters['lanes'])})")
+        params.extend(filters["lanes"])
+
+    # SourceVideo holds the clip name, a video matches all of its clips (prefix LIKE, still an index seek)
+    # and a clip name matches that clip only
+    if filters["video"] is not None:
+        predicates.append("(SourceVideo = ? OR SourceVideo LIKE ? ESCAPE '\\')")
+        params.extend([filters["video"], escape_like(filters["video"] + CLIP_SUFFIX) + "%"])
+
+    return (predicates, params)
+
+
+# Build the (sql, params) of one page of a report, the page holds up to limit + 1 rows so
+# the caller can tell whether there is a next page
+def build_report_query(report: str, filters: dict, paginate: bool = True) -> tuple[str, list, str]:
+    source = choose_source(filters)
+    spec = SOURCES[source]
+    bucket_expr = bucket_expression(source, filters["bucket_seconds"])
+    bucket_alias = "five_min_bucket" if filters["bucket_seconds"] == ROLLUP_BUCKET_SECONDS else "bucket"
+    (predicates, params) = build_predicates(source, filters)
+    cursor = filters["cursor"] if paginate else None
+
+    if report == "Q1":
+        select = f"lane, {spec['count']} AS count_per_lane"
+        group_by = "lane"
+        order_by = "lane"
+        if cursor:
+            predicates.append("lane > ?")
+            params.extend(cursor)
+
+    elif report == "Q2":
+        if source == "raw":
+            predicates.append("speeding = 1")
+        select = f"COALESCE({spec['speeding_count']}, 0) AS speeding_count"
+        group_by = None
+        order_by = None
+
+    elif report == "Q3":
+        select = f"{bucket_expr} AS {bucket_alias}, lane, {spec['count']} AS count_per_bucket"
+        group_by = f"lane, {bucket_expr}"
+        order_by = f"{bucket_alias}, lane"
+        if cursor:
+            predicates.append(f"({bucket_expr} > ? OR ({bucket_expr} = ? AND lane > ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+
+    elif report == "Q4":
+        bucket_alias = "time_bucket" if filters["bucket_seconds"] == ROLLUP_BUCKET_SECONDS else "bucket"
+        select = f"lane, {bucket_expr} AS {bucket_alias}, {spec['avg_speed']} AS avg_speed_kmh"
+        group_by = f"lane, {bucket_expr}"
+        order_by = f"lane, {bucket_alias}"
+        if cursor:
+            predicates.append(f"(lane > ? OR (lane = ? AND {bucket_expr} > ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+
+    else:
+        raise ValueError(f"Unknown report: {report}")
+
+    sql = f"SELECT {select} FROM {spec['table']}"
+    if predicates:
+        sql += " WHERE " + " AND ".join(predicates)
+    if group_by:
+        sql += f" GROUP BY {group_by}"
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+        if paginate:
+            sql += " OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY"
+            params.append(filters["limit"] + 1)
+
+    return (sql, params, source)
+
+
+# Helper function to get the keyset cursor values of the last row of a page
+def cursor_values(report: str, row) -> list:
+    if report == "Q1":
+        return [row[0]]
+    if report in ("Q3", "Q4"):
+        return [row[0], row[1]]
+    return []
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+# Decode a cursor and check it holds one value of the right type per key column of the report
+def decode_cursor(token: str, report: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    types = CURSOR_TYPES.get(report)
+    if types is None or not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("Invalid cursor")
+    for (value, expected_type) in zip(values, types):
+        if isinstance(value, bool) or not isinstance(value, expected_type):
+            raise ValueError("Invalid cursor")
+    return values
+
+
+# Helper function to escape the LIKE wildcards of a literal prefix (escape character: backslash)
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("[", "\\[")
@@ -0,0 +1,78 @@
+import threading
+
+# Blob metadata key holding the ingestion watermark a result blob was computed at
+WATERMARK_METADATA_KEY = "ingestionwatermark"
+
+
+class ResultCache:
+    """
+    In-process cache of which result blob is up to date for which ingestion watermark.
+
+    An entry maps a query key (the output blob name) to the watermark of the data it was computed
+    from. As long as IngestionWatermark.version is unchanged the existing blob is still correct, so
+    the query and the upload can be skipped. New ingestions bump the watermark, which invalidates
+    every entry at once. On a cold instance the watermark stored in the blob metadata is used instead.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Check if the blob for query_key was produced at the given watermark
+    def lookup(self, query_key: str, watermark: int, blob_client=None) -> bool:
+        if watermark is None:
+            return self._record(False)
+
+        with self._lock:
+            cached_watermark = self._entries.get(query_key)
+
+        if cached_watermark is None and blob_client is not None:
+            cached_watermark = read_blob_watermark(blob_client)
+            if cached_watermark is not None:
+                with self._lock:
+                    self._entries[query_key] = cached_watermark
+
+        return self._record(cached_watermark == watermark)
+
+    # Remember that the blob for query_key now holds the results at the given watermark
+    def store(self, query_key: str, watermark: int) -> None:
+        if watermark is None:
+            return
+        with self._lock:
+            self._entries[query_key] = watermark
+
+    def invalidate(self, query_key: str = None) -> None:
+        with self._lock:
+            if query_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(query_key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": dict(self._entries),
+            }
+
+    def _record(self, hit: bool) -> bool:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return hit
+
+
+# Helper function to read the watermark a result blob was uploaded with, None if missing
+def read_blob_watermark(blob_client) -> int:
+    try:
+        metadata = blob_client.get_blob_properties().metadata or {}
+        return int(metadata[WATERMARK_METADATA_KEY])
+    except Exception:
+        return None
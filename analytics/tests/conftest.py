@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def analytics(load_app):
+    return load_app("analytics")
+
+
+# Settings of the analytics app for one test: SQLite database, filesystem blob storage, empty result cache
+@pytest.fixture
+def blob_root(analytics, sql_conn_str, tmp_path, monkeypatch) -> str:
+    from local_blob import LocalBlobServiceClient
+
+    root = str(tmp_path / "blobs")
+    monkeypatch.setenv("SQL_STORAGE_CONN_STR", sql_conn_str)
+    monkeypatch.setenv("AzureWebJobsStorage", f"LocalBlobRoot={root}")
+    monkeypatch.setenv("BLOB_CONTAINER_NAME", "results")
+    monkeypatch.setattr(analytics, "BlobServiceClient", LocalBlobServiceClient)
+    analytics.result_cache.invalidate()
+    return root
@@ -0,0 +1,66 @@
+import csv
+import os
+
+import azure.functions as func
+import sqlite_odbc
+
+REPORT_ROUTES = {
+    "Q1": ("GetVehPerLane", "VEHICLES_PER_LANE_QUERY.csv"),
+    "Q2": ("CountSpdVeh", "SPEEDING_TOTAL_QUERY.csv"),
+    "Q3": ("CntVehPerTimeAndLane", "VEHICLES_PER_5MIN_PER_LANE.csv"),
+    "Q4": ("AvgSpdPerTimeAndLane", "AVG_SPD_PER_LANE_PER_5MIN_QUERY.csv"),
+}
+
+
+def http_request(route: str, params: dict = None) -> func.HttpRequest:
+    return func.HttpRequest("GET", f"http://localhost/api/{route}", params=params or {}, body=b"")
+
+
+def read_report(blob_root: str, blob_name: str) -> list:
+    with open(os.path.join(blob_root, "results", blob_name), newline="") as f:
+        return list(csv.reader(f))
+
+
+def insert_rollup(conn_str: str, rows: list) -> None:
+    with sqlite_odbc.connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.executemany("INSERT INTO VehicleLaneRollup (lane, time_bucket, vehicle_count, speed_sum, speeding_count) "
+                               "VALUES (?, ?, ?, ?, ?)", rows)
+            cursor.execute("UPDATE IngestionWatermark SET version = version + 1")
+        conn.commit()
+
+
+def test_all_reports_of_an_empty_rollup(analytics, blob_root):
+    response = analytics.GetAllReports(http_request("QAll"))
+
+    assert response.status_code == 200
+    assert read_report(blob_root, "VEHICLES_PER_LANE_QUERY.csv") == [["lane", "count_per_lane"]]
+    assert read_report(blob_root, "SPEEDING_TOTAL_QUERY.csv") == [["speeding_count"], ["0"]]
+    assert read_report(blob_root, "VEHICLES_PER_5MIN_PER_LANE.csv") == [["five_min_bucket", "lane", "count_per_bucket"]]
+    assert read_report(blob_root, "AVG_SPD_PER_LANE_PER_5MIN_QUERY.csv") == [["lane", "time_bucket", "avg_speed_kmh"]]
+
+
+def test_all_reports_match_the_standalone_queries(analytics, blob_root, sql_conn_str):
+    insert_rollup(sql_conn_str, [("out", 1, 2, 150.0, 0), ("in", 0, 3, 420.0, 2), ("in", 1, 1, 80.0, 0), ("out", 0, 1, 95.0, 0)])
+
+    assert analytics.GetAllReports(http_request("QAll")).status_code == 200
+    all_reports = {blob_name: read_report(blob_root, blob_name) for (_, blob_name) in REPORT_ROUTES.values()}
+
+    for (route, (handler, blob_name)) in REPORT_ROUTES.items():
+        os.remove(os.path.join(blob_root, "results", blob_name))
+        analytics.result_cache.invalidate()
+        assert getattr(analytics, handler)(http_request(route)).status_code == 200
+        assert read_report(blob_root, blob_name) == all_reports[blob_name]
+
+
+def test_derived_reports_keep_the_lane_order_of_sql(analytics):
+    # Rows as SQL Server returns them with a case-insensitive collation: "in" sorts before "OUT"
+    rows = [("in", 0, 3, 2, 140.0), ("in", 1, 1, 0, 80.0), ("OUT", 0, 1, 0, 95.0), ("OUT", 1, 2, 0, 75.0)]
+
+    (_, per_lane) = analytics.derive_vehicles_per_lane(rows)
+    (_, per_bucket) = analytics.derive_vehicles_per_5min_per_lane(rows)
+    (_, avg_speed) = analytics.derive_avg_speed_per_lane_per_5min(rows)
+
+    assert per_lane == [("in", 4), ("OUT", 3)]
+    assert per_bucket == [(0, "in", 3), (0, "OUT", 1), (1, "in", 1), (1, "OUT", 2)]
+    assert avg_speed == [("in", 0, 140.0), ("in", 1, 80.0), ("OUT", 0, 95.0), ("OUT", 1, 75.0)]
@@ -0,0 +1,24 @@
+import azure.functions as func
+import pytest
+
+REPORT_HANDLERS = {
+    "Q1": "GetVehPerLane",
+    "Q2": "CountSpdVeh",
+    "Q3": "CntVehPerTimeAndLane",
+    "Q4": "AvgSpdPerTimeAndLane",
+}
+
+
+def http_request(route: str, params: dict = None) -> func.HttpRequest:
+    return func.HttpRequest("GET", f"http://localhost/api/{route}", params=params or {}, body=b"")
+
+
+@pytest.mark.parametrize("route", sorted(REPORT_HANDLERS))
+def test_report_without_configuration_fails(analytics, route, monkeypatch):
+    for name in ("SQL_STORAGE_CONN_STR", "AzureWebJobsStorage", "BLOB_CONTAINER_NAME"):
+        monkeypatch.delenv(name, raising=False)
+
+    response = getattr(analytics, REPORT_HANDLERS[route])(http_request(route))
+
+    assert response.status_code == 500
+    assert b"connection string to the Azure SQL Storage" in response.get_body()
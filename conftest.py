@@ -0,0 +1,51 @@
+"""
+Shared pytest setup of the app test suites (<app>/tests).
+
+The apps run against local_pipeline/sqlite_odbc.py installed as the pyodbc module, the same
+SQLite stand-in the local pipeline uses, so no test needs Azure SQL or an ODBC driver.
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+SHARED_DIR = os.path.join(REPO_ROOT, "shared")
+LOCAL_PIPELINE_DIR = os.path.join(REPO_ROOT, "local_pipeline")
+
+sys.path.insert(0, LOCAL_PIPELINE_DIR)
+import sqlite_odbc  # noqa: E402
+
+sys.modules["pyodbc"] = sqlite_odbc
+
+
+# Helper function to import an app module under a unique name, every app has its own function_app.py
+def load_app_module(app_dir: str, file_name: str = "function_app.py"):
+    app_path = os.path.join(REPO_ROOT, app_dir)
+    module_name = f"{app_dir.replace('-', '_')}_{os.path.splitext(file_name)[0]}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    sys.path[0:0] = [SHARED_DIR, app_path]
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(app_path, file_name))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(SHARED_DIR)
+        sys.path.remove(app_path)
+    return module
+
+
+@pytest.fixture(scope="session")
+def load_app():
+    return load_app_module
+
+
+@pytest.fixture
+def sql_conn_str(tmp_path) -> str:
+    path = str(tmp_path / "traffic.db")
+    sqlite_odbc.create_schema(path)
+    return f"Database={path}"
@@ -0,0 +1,156 @@
+"""
+Populate a local (or test) database with synthetic vehicle records and time the analytics queries.
+
+The generated rows look like the analyzer output: 2-minute clips (SourceVideo = <video>_partN),
+relative TimeEntered seconds, "in"/"out" lanes, car/truck speeds and the speeding flag with the
+same limits as proccess2.py. After loading, the rollup table is rebuilt and the ingestion watermark
+bumped, exactly as if the rows had gone through the ingestion worker.
+
+With --benchmark the legacy full-scan queries (FLOOR(TimeEntered / 300) per row) are timed against
+the indexed TimeBucket versions and the rollup versions used by the analytics app.
+
+Usage:
+    python migrate.py --conn-str "<conn>"
+    python load_synthetic.py --conn-str "<conn>" --rows 1000000 --benchmark
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import pyodbc
+
+CLIP_SECONDS = 120
+CAR_LIMIT = 90.0
+TRUCK_LIMIT = 80.0
+
+INSERT_QUERY = """
+    INSERT INTO VehicleData (vehicleId, timeEntered, speed, vehicletype, lane, speeding, SourceVideo)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+REBUILD_ROLLUP_QUERIES = [
+    "DELETE FROM VehicleLaneRollup",
+    """
+    INSERT INTO VehicleLaneRollup (lane, time_bucket, vehicle_count, speed_sum, speeding_count)
+    SELECT lane, TimeBucket, COUNT(*), SUM(speed), SUM(CASE WHEN speeding = 1 THEN 1 ELSE 0 END)
+    FROM VehicleData
+    GROUP BY lane, TimeBucket
+    """,
+    "UPDATE IngestionWatermark SET version = version + 1",
+]
+
+# (report, legacy full-scan query, indexed raw-table query, rollup query)
+BENCHMARK_QUERIES = [
+    ("Q1 vehicles per lane",
+     "SELECT lane, COUNT(*) FROM VehicleData WITH (INDEX(PK_VehicleData)) GROUP BY lane ORDER BY lane",
+     "SELECT lane, COUNT(*) FROM VehicleData WITH (INDEX(IX_VehicleData_Lane_TimeBucket)) GROUP BY lane ORDER BY lane",
+     "SELECT lane, SUM(vehicle_count) FROM VehicleLaneRollup GROUP BY lane ORDER BY lane"),
+    ("Q2 total speeding",
+     "SELECT COUNT(*) FROM VehicleData WITH (INDEX(PK_VehicleData)) WHERE speeding = 1",
+     "SELECT COUNT(*) FROM VehicleData WHERE speeding = 1",
+     "SELECT COALESCE(SUM(speeding_count), 0) FROM VehicleLaneRollup"),
+    ("Q3 vehicles per 5 min per lane",
+     "SELECT FLOOR(TimeEntered / 300) AS b, lane, COUNT(*) FROM VehicleData WITH (INDEX(PK_VehicleData)) "
+     "GROUP BY lane, FLOOR(TimeEntered / 300) ORDER BY b, lane",
+     "SELECT TimeBucket, lane, COUNT(*) FROM VehicleData GROUP BY lane, TimeBucket ORDER BY TimeBucket, lane",
+     "SELECT time_bucket, lane, vehicle_count FROM VehicleLaneRollup ORDER BY time_bucket, lane"),
+    ("Q4 avg speed per lane per 5 min",
+     "SELECT lane, FLOOR(TimeEntered / 300) AS b, ROUND(AVG(speed), 1) FROM VehicleData WITH (INDEX(PK_VehicleData)) "
+     "GROUP BY lane, FLOOR(TimeEntered / 300) ORDER BY lane, b",
+     "SELECT lane, TimeBucket, ROUND(AVG(speed), 1) FROM VehicleData GROUP BY lane, TimeBucket ORDER BY lane, TimeBucket",
+     "SELECT lane, time_bucket, ROUND(speed_sum / vehicle_count, 1) FROM VehicleLaneRollup ORDER BY lane, time_bucket"),
+]
+
+
+# Helper function to generate synthetic rows, deterministic for a given seed
+def generate_rows(row_count: int, videos: int = 1, vehicles_per_clip: int = 60, seed: int = 0):
+    rng = random.Random(seed)
+    rows_per_video = max(1, row_count // videos)
+    for video_index in range(videos):
+        video_name = f"synthetic{video_index}"
+        for i in range(rows_per_video):
+            clip_number = i // vehicles_per_clip + 1
+            is_car = rng.random() < 0.8
+            speed = round(min(199.0, max(20.0, rng.gauss(85.0 if is_car else 75.0, 12.0))), 1)
+            speeding = int(speed > (CAR_LIMIT if is_car else TRUCK_LIMIT))
+            time_entered = round((clip_number - 1) * CLIP_SECONDS + rng.uniform(0, CLIP_SECONDS), 2)
+            yield (i % vehicles_per_clip + 1, time_entered, speed, "car" if is_car else "truck",
+                   "in" if rng.random() < 0.5 else "out", speeding, f"{video_name}_part{clip_number}")
+
+
+# Insert the synthetic rows in batches and rebuild the derived tables
+def load(conn_str: str, row_count: int, videos: int, batch_size: int = 10000, truncate: bool = False) -> float:
+    start = time.perf_counter()
+    with pyodbc.connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            if truncate:
+                cursor.execute("TRUNCATE TABLE VehicleData")
+            cursor.fast_executemany = True
+
+            batch = []
+            for row in generate_rows(row_count, videos):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    cursor.executemany(INSERT_QUERY, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(INSERT_QUERY, batch)
+
+            for query in REBUILD_ROLLUP_QUERIES:
+                cursor.execute(query)
+            conn.commit()
+    return time.perf_counter() - start
+
+
+# Helper function to time one query (median of several runs, results fully fetched)
+def time_query(cursor, query: str, repeats: int) -> float:
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        cursor.execute(query)
+        cursor.fetchall()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def benchmark(conn_str: str, repeats: int = 5) -> list:
+    results = []
+    with pyodbc.connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            for (report, legacy_query, indexed_query, rollup_query) in BENCHMARK_QUERIES:
+                results.append((report,
+                                time_query(cursor, legacy_query, repeats),
+                                time_query(cursor, indexed_query, repeats),
+                                time_query(cursor, rollup_query, repeats)))
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Load synthetic vehicle records and time the analytics queries")
+    parser.add_argument("--conn-str", default=os.getenv("SQL_STORAGE_CONN_STR"), help="ODBC connection string")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of synthetic vehicle records")
+    parser.add_argument("--videos", type=int, default=1, help="Number of source videos the rows are spread over")
+    parser.add_argument("--truncate", action="store_true", help="Empty VehicleData before loading")
+    parser.add_argument("--skip-load", action="store_true", help="Only run the benchmark")
+    parser.add_argument("--benchmark", action="store_true", help="Time legacy, indexed and rollup queries")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per query, the median is reported")
+    args = parser.parse_args(argv)
+
+    if not args.conn_str:
+        parser.error("pass --conn-str or set SQL_STORAGE_CONN_STR")
+
+    if not args.skip_load:
+        elapsed = load(args.conn_str, args.rows, args.videos, truncate=args.truncate)
+        print(f"Loaded {args.rows} records in {elapsed:.1f} s ({args.rows / elapsed:.0f} records/s)")
+
+    if args.benchmark:
+        print(f"{'report':<34}{'legacy ms':>12}{'indexed ms':>12}{'rollup ms':>12}")
+        for (report, legacy_ms, indexed_ms, rollup_ms) in benchmark(args.conn_str, args.repeats):
+            print(f"{report:<34}{legacy_ms:>12.1f}{indexed_ms:>12.1f}{rollup_ms:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
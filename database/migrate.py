@@ -0,0 +1,96 @@
+"""
+Apply the SQL migrations in database/migrations to an Azure SQL / SQL Server database.
+
+Migrations are plain T-SQL files named NNN_description.sql, split into batches on GO lines and
+applied in file name order. Applied versions are recorded in dbo.SchemaMigrations so every file
+runs once. Every migration is also written to be idempotent, so it is safe on databases whose
+tables were created by hand before the migrations existed.
+
+Usage:
+    python migrate.py --conn-str "<ODBC connection string>"     (or set SQL_STORAGE_CONN_STR)
+    python migrate.py --list
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import pyodbc
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+CREATE_MIGRATIONS_TABLE = """
+    IF OBJECT_ID('dbo.SchemaMigrations', 'U') IS NULL
+        CREATE TABLE dbo.SchemaMigrations (
+            version     NVARCHAR(255) NOT NULL CONSTRAINT PK_SchemaMigrations PRIMARY KEY,
+            applied_at  DATETIME2     NOT NULL DEFAULT SYSUTCDATETIME()
+        );
+"""
+
+GO_SEPARATOR = re.compile(r"^\s*GO\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+# Helper function to list the migration files in the order they must be applied
+def list_migrations(migrations_dir: str = MIGRATIONS_DIR) -> list:
+    return sorted(name for name in os.listdir(migrations_dir) if re.match(r"^\d+_.*\.sql$", name))
+
+
+# Helper function to split a T-SQL script into the batches separated by GO
+def split_batches(script: str) -> list:
+    return [batch.strip() for batch in GO_SEPARATOR.split(script) if batch.strip()]
+
+
+# Apply every pending migration, returns the versions that were applied
+def apply_migrations(conn_str: str, migrations_dir: str = MIGRATIONS_DIR) -> list:
+    applied_now = []
+    with pyodbc.connect(conn_str, autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(CREATE_MIGRATIONS_TABLE)
+            cursor.execute("SELECT version FROM dbo.SchemaMigrations")
+            applied = {row[0] for row in cursor.fetchall()}
+
+            for name in list_migrations(migrations_dir):
+                if name in applied:
+                    continue
+
+                with open(os.path.join(migrations_dir, name), encoding="utf-8") as f:
+                    batches = split_batches(f.read())
+
+                logging.info(f"Applying migration {name} ({len(batches)} batches)")
+                # One transaction per migration, a failing batch leaves the schema as it was
+                cursor.execute("BEGIN TRANSACTION")
+                try:
+                    for batch in batches:
+                        cursor.execute(batch)
+                    cursor.execute("INSERT INTO dbo.SchemaMigrations (version) VALUES (?)", name)
+                    cursor.execute("COMMIT TRANSACTION")
+                except Exception:
+                    cursor.execute("IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION")
+                    raise
+                applied_now.append(name)
+
+    return applied_now
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply the traffic monitoring database migrations")
+    parser.add_argument("--conn-str", default=os.getenv("SQL_STORAGE_CONN_STR"), help="ODBC connection string")
+    parser.add_argument("--list", action="store_true", help="Only list the migration files")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.list:
+        for name in list_migrations():
+            print(name)
+        return 0
+
+    if not args.conn_str:
+        parser.error("pass --conn-str or set SQL_STORAGE_CONN_STR")
+
+    applied = apply_migrations(args.conn_str)
+    print(f"Applied {len(applied)} migrations" + (f": {', '.join(applied)}" if applied else ", schema up to date"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+-- Raw vehicle records written by the ingestion worker (intermediateWorker), one row per counted vehicle.
+-- Databases created before the migrations existed already have this table and skip this step.
+IF OBJECT_ID('dbo.VehicleData', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.VehicleData (
+        Id           BIGINT IDENTITY(1, 1) NOT NULL,
+        vehicleId    INT           NOT NULL,
+        TimeEntered  FLOAT         NOT NULL,
+        speed        FLOAT         NOT NULL,
+        vehicletype  NVARCHAR(16)  NOT NULL,
+        lane         NVARCHAR(16)  NOT NULL,
+        speeding     TINYINT       NOT NULL,
+        CONSTRAINT PK_VehicleData PRIMARY KEY CLUSTERED (Id)
+    );
+END
+GO
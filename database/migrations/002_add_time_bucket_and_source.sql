@@ -0,0 +1,29 @@
+-- 5-minute bucket stored once per row instead of computing FLOOR(TimeEntered / 300) in every query,
+-- plus the clip the row came from, and covering indexes for the per-lane and speeding reports.
+IF COL_LENGTH('dbo.VehicleData', 'TimeBucket') IS NULL
+    ALTER TABLE dbo.VehicleData ADD TimeBucket AS CAST(FLOOR(TimeEntered / 300) AS INT) PERSISTED;
+GO
+
+IF COL_LENGTH('dbo.VehicleData', 'SourceVideo') IS NULL
+    ALTER TABLE dbo.VehicleData ADD SourceVideo NVARCHAR(256) NULL;
+GO
+
+-- Per-lane / per-bucket counts and averages (Q1, Q3, Q4 on the raw table) read only this index
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_VehicleData_Lane_TimeBucket' AND object_id = OBJECT_ID('dbo.VehicleData'))
+    CREATE NONCLUSTERED INDEX IX_VehicleData_Lane_TimeBucket
+        ON dbo.VehicleData (lane, TimeBucket)
+        INCLUDE (speed, speeding);
+GO
+
+-- Speeding vehicles are a small fraction of the table, a filtered index keeps Q2 tiny
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_VehicleData_Speeding' AND object_id = OBJECT_ID('dbo.VehicleData'))
+    CREATE NONCLUSTERED INDEX IX_VehicleData_Speeding
+        ON dbo.VehicleData (speeding)
+        INCLUDE (lane, TimeBucket, TimeEntered, speed)
+        WHERE speeding = 1;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_VehicleData_SourceVideo' AND object_id = OBJECT_ID('dbo.VehicleData'))
+    CREATE NONCLUSTERED INDEX IX_VehicleData_SourceVideo
+        ON dbo.VehicleData (SourceVideo, TimeBucket);
+GO
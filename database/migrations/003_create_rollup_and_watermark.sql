@@ -0,0 +1,37 @@
+-- Per-lane 5-minute rollup of VehicleData, maintained by save_data_to_SQL_storage on every ingestion
+-- and read by the analytics queries (Q1-Q4). time_bucket = VehicleData.TimeBucket = FLOOR(TimeEntered / 300).
+IF OBJECT_ID('dbo.VehicleLaneRollup', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.VehicleLaneRollup (
+        lane            NVARCHAR(16)  NOT NULL,
+        time_bucket     INT           NOT NULL,
+        vehicle_count   INT           NOT NULL,
+        speed_sum       FLOAT         NOT NULL,
+        speeding_count  INT           NOT NULL,
+        CONSTRAINT PK_VehicleLaneRollup PRIMARY KEY CLUSTERED (lane, time_bucket)
+    );
+END
+GO
+
+-- One-off backfill from the rows ingested before the rollup existed
+IF NOT EXISTS (SELECT 1 FROM dbo.VehicleLaneRollup)
+BEGIN
+    INSERT INTO dbo.VehicleLaneRollup (lane, time_bucket, vehicle_count, speed_sum, speeding_count)
+    SELECT lane, TimeBucket, COUNT(*), SUM(speed), SUM(CASE WHEN speeding = 1 THEN 1 ELSE 0 END)
+    FROM dbo.VehicleData
+    GROUP BY lane, TimeBucket;
+END
+GO
+
+-- Single-row ingestion watermark, bumped after every ingestion commits. The analytics app
+-- keys its result cache by this version and reuses existing result blobs while it is unchanged.
+IF OBJECT_ID('dbo.IngestionWatermark', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.IngestionWatermark (
+        id       TINYINT NOT NULL CONSTRAINT PK_IngestionWatermark PRIMARY KEY DEFAULT 1,
+        version  BIGINT  NOT NULL,
+        CONSTRAINT CK_IngestionWatermark_SingleRow CHECK (id = 1)
+    );
+    INSERT INTO dbo.IngestionWatermark (id, version) VALUES (1, 0);
+END
+GO
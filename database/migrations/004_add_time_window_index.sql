@@ -0,0 +1,7 @@
+-- Time-windowed analytics requests ("last hour", optionally per lane) seek on the bucket first;
+-- the (lane, TimeBucket) index only helps when the lane is known.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_VehicleData_TimeBucket_Lane' AND object_id = OBJECT_ID('dbo.VehicleData'))
+    CREATE NONCLUSTERED INDEX IX_VehicleData_TimeBucket_Lane
+        ON dbo.VehicleData (TimeBucket, lane)
+        INCLUDE (TimeEntered, speed, speeding, SourceVideo);
+GO
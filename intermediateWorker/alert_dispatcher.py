@@ -0,0 +1,357 @@
+"""
+Batched, spooled delivery of speeding alerts to the alert-logger app.
+
+Used by the ingestion worker (intermediateWorker) and by the live mode of the analyzer
+(opencvanalyzerbloblocal/live_monitor.py). Each app carries a committed copy of this file, edit this
+copy and refresh the app copies with python shared/vendor.py.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+from instrumentation import METRICS
+
+# ===================== Dispatcher Consts ==========================================
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", "200"))
+ALERT_FLUSH_INTERVAL_S = float(os.getenv("ALERT_FLUSH_INTERVAL_S", "1.0"))
+ALERT_QUEUE_MAX_SIZE = int(os.getenv("ALERT_QUEUE_MAX_SIZE", "10000"))
+ALERT_SPOOL_DIR = os.getenv("ALERT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "alert-spool"))
+ALERT_SPOOL_MAX_FILES = int(os.getenv("ALERT_SPOOL_MAX_FILES", "500"))
+ALERT_CONNECT_TIMEOUT_S = 3.05
+ALERT_READ_TIMEOUT_S = 10.0
+ALERT_RETRY_MIN_BACKOFF_S = 1.0
+ALERT_RETRY_MAX_BACKOFF_S = 60.0
+
+# Seconds an ingestion request waits for its alerts to be delivered before spooling them
+ALERT_REQUEST_FLUSH_TIMEOUT_S = float(os.getenv("ALERT_REQUEST_FLUSH_TIMEOUT_S", "2.0"))
+
+# Queue marker that makes the worker send the batch it is collecting without waiting for the flush interval
+_FLUSH = object()
+
+# Status codes worth retrying later, everything else in the 4xx range is a bad batch
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class AlertDispatcher:
+    """
+    Background dispatcher that batches speeding alerts and posts them to the alert-logger app.
+
+    Alerts are queued in memory and flushed by a worker thread either when `batch_size` alerts
+    are waiting or `flush_interval` seconds after the first one arrived. Batches that cannot be
+    delivered are written to a bounded on-disk spool and retried with exponential backoff, so
+    the caller (an ingestion request, the live analysis loop) never waits on the alert sink for long.
+
+    The worker is a daemon thread and the host may freeze or recycle the process after a request,
+    so requests call flush_or_spool() before they return: alerts not delivered within a short
+    timeout are moved to the spool, and nothing acknowledged lives only in memory.
+
+    Args:
+        app_url (str): Full URL of the alert-logger list endpoint (`/api/alert/list`)
+        batch_size (int): Maximum number of alerts per POST
+        flush_interval (float): Maximum seconds an alert waits in memory before being sent
+        spool_dir (str): Directory holding batches that failed to send
+        max_spool_files (int): Maximum spooled batches kept on disk, the oldest are dropped first
+    """
+
+    def __init__(self, app_url: str, batch_size: int = ALERT_BATCH_SIZE,
+                 flush_interval: float = ALERT_FLUSH_INTERVAL_S, spool_dir: str = ALERT_SPOOL_DIR,
+                 max_spool_files: int = ALERT_SPOOL_MAX_FILES):
+        self.app_url = app_url
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self.max_spool_files = max_spool_files
+
+        # Keep-alive connection pool shared by every POST of this dispatcher
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        self._queue = queue.Queue(maxsize=ALERT_QUEUE_MAX_SIZE)
+        self._idle = threading.Condition()
+        self._pending = 0
+        self._spool_lock = threading.Lock()
+        self._backoff = ALERT_RETRY_MIN_BACKOFF_S
+        self._next_retry_at = 0.0
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        # Batch the worker is sending, with the spool file it was copied to by flush_or_spool (if any)
+        self._in_flight = None
+        self._in_flight_lock = threading.Lock()
+        self.stats = {"queued": 0, "sent": 0, "batches_sent": 0, "spooled": 0, "retried": 0, "dropped": 0}
+        self._stats_lock = threading.Lock()
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    # Queue alerts for delivery, returns immediately
+    def enqueue(self, alerts: list) -> None:
+        self._ensure_worker()
+        overflow = []
+        for alert in alerts:
+            try:
+                with self._idle:
+                    self._pending += 1
+                self._queue.put_nowait(alert)
+                self._count("queued")
+            except queue.Full:
+                self._mark_done(1)
+                overflow.append(alert)
+
+        # The in-memory queue is full, keep the rest on disk instead of blocking ingestion
+        if overflow:
+            logging.warning(f"Alert queue full, spooling {len(overflow)} alerts to disk")
+            self._spool(overflow)
+
+    # Block until everything queued so far was sent or spooled, False if the timeout expired first
+    def flush(self, timeout: float = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self._queue.put_nowait(_FLUSH)
+        except queue.Full:
+            # A full queue makes full batches, nothing waits for the flush interval
+            pass
+
+        with self._idle:
+            while self._pending > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining if remaining is not None else 1.0)
+                # Keep the worker alive while waiting for it
+                if self._pending > 0:
+                    self._ensure_worker()
+        return True
+
+    # Called before a request returns: deliver the queued alerts within the timeout, or move them to the spool
+    def flush_or_spool(self, timeout: float) -> bool:
+        if self.flush(timeout):
+            return True
+
+        leftover = []
+        while True:
+            try:
+                alert = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if alert is not _FLUSH:
+                leftover.append(alert)
+
+        in_flight_count = 0
+        with self._in_flight_lock:
+            if self._in_flight is not None and self._in_flight["spool_path"] is None:
+                batch = list(self._in_flight["batch"])
+                self._in_flight["spool_path"] = self._spool(batch)
+                self._in_flight["spooled_count"] = in_flight_count = len(batch)
+
+        if leftover:
+            self._spool(leftover)
+            self._mark_done(len(leftover))
+        logging.warning(f"Alert web app slow, spooled {len(leftover) + in_flight_count} undelivered alerts for a later retry")
+        return False
+
+    def spooled_batches(self) -> int:
+        return len(self._spool_files())
+
+    def _ensure_worker(self) -> None:
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+                self._worker.start()
+
+    # Worker loop, an unexpected error is logged and the loop goes on (flush() waits on this thread)
+    def _run(self) -> None:
+        while True:
+            try:
+                self._run_once()
+            except Exception as e:
+                logging.exception(f"Alert dispatcher error: {e}")
+                METRICS.inc("alert_dispatcher_errors_total")
+                self._schedule_retry()
+                time.sleep(ALERT_RETRY_MIN_BACKOFF_S)
+
+    # Collect a size or time bounded batch, send it, then give the spool a chance
+    def _run_once(self) -> None:
+        batch = []
+        try:
+            first = self._queue.get(timeout=self._retry_wait())
+            if first is not _FLUSH:
+                batch.append(first)
+                # From here on flush_or_spool can see (and spool) the batch
+                with self._in_flight_lock:
+                    self._in_flight = {"batch": batch, "spool_path": None, "spooled_count": 0}
+                batch_deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = batch_deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    alert = self._queue.get(timeout=remaining)
+                    if alert is _FLUSH:
+                        break
+                    batch.append(alert)
+        except queue.Empty:
+            pass
+
+        if batch:
+            self._deliver(batch)
+        self._retry_spooled()
+
+    # Send a fresh batch, spooling it when it cannot be delivered now
+    def _deliver(self, batch: list) -> None:
+        sent = False
+        try:
+            sent = self._send(batch)
+        except Exception as e:
+            logging.error(f"Could not send {len(batch)} alerts: {e}")
+        finally:
+            with self._in_flight_lock:
+                (spool_path, spooled_count) = (self._in_flight["spool_path"], self._in_flight["spooled_count"])
+                self._in_flight = None
+
+            try:
+                if sent and spool_path is not None:
+                    # flush_or_spool gave up on this batch meanwhile, it was delivered after all
+                    self._remove_spooled(spool_path)
+                elif not sent:
+                    if spooled_count < len(batch):
+                        self._spool(batch[spooled_count:])
+                    self._schedule_retry()
+            finally:
+                self._mark_done(len(batch))
+
+    # How long the worker may sleep waiting for new alerts before it has to retry the spool
+    def _retry_wait(self) -> float:
+        if not self._spool_files():
+            return self.flush_interval * 10
+        return max(0.05, self._next_retry_at - time.monotonic())
+
+    # Delay the next spool retry, exponentially while the sink keeps failing
+    def _schedule_retry(self) -> None:
+        self._next_retry_at = time.monotonic() + self._backoff * random.uniform(0.5, 1.0)
+        self._backoff = min(self._backoff * 2, ALERT_RETRY_MAX_BACKOFF_S)
+
+    def _count(self, key: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _remove_spooled(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _mark_done(self, count: int) -> None:
+        with self._idle:
+            self._pending -= count
+            self._idle.notify_all()
+
+    # POST one batch, returns False only if the batch should be retried later
+    def _send(self, batch: list) -> bool:
+        try:
+            with METRICS.timer("alert_post_seconds"):
+                response = self.session.post(self.app_url, data=json.dumps(batch),
+                                             timeout=(ALERT_CONNECT_TIMEOUT_S, ALERT_READ_TIMEOUT_S))
+        except requests.RequestException as e:
+            logging.warning(f"Alert web app unreachable: {e}")
+            METRICS.inc("alert_post_failures_total")
+            return False
+
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            logging.warning(f"Alert web app responded with retryable code: {response.status_code}")
+            METRICS.inc("alert_post_failures_total")
+            return False
+
+        if response.status_code >= 400:
+            # Retrying a rejected batch would only fail again
+            logging.error(f"Alert web app rejected {len(batch)} alerts with code {response.status_code}: {response.text}")
+            self._count("dropped", len(batch))
+            METRICS.inc("alerts_dropped_total", len(batch))
+            return True
+
+        self._count("sent", len(batch))
+        METRICS.inc("alerts_sent_total", len(batch))
+        self._count("batches_sent")
+        logging.info(f"Alert web app accepted {len(batch)} alerts")
+        return True
+
+    def _spool_files(self) -> list:
+        try:
+            return sorted(name for name in os.listdir(self.spool_dir) if name.endswith(".json"))
+        except FileNotFoundError:
+            return []
+
+    # Write a batch to the spool atomically, dropping the oldest batches if the spool is full. Returns its path
+    def _spool(self, batch: list) -> str:
+        with self._spool_lock:
+            files = self._spool_files()
+            while len(files) >= self.max_spool_files:
+                oldest = files.pop(0)
+                try:
+                    with open(os.path.join(self.spool_dir, oldest), "r") as f:
+                        self._count("dropped", len(json.load(f)))
+                    os.remove(os.path.join(self.spool_dir, oldest))
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Could not drop spooled alert batch {oldest}: {e}")
+                logging.warning(f"Alert spool full, dropped oldest batch {oldest}")
+
+            name = f"{time.time_ns():020d}-{uuid.uuid4().hex}.json"
+            temp_path = os.path.join(self.spool_dir, name + ".tmp")
+            with open(temp_path, "w") as f:
+                json.dump(batch, f)
+            os.replace(temp_path, os.path.join(self.spool_dir, name))
+            self._count("spooled", len(batch))
+            METRICS.inc("alerts_spooled_total", len(batch))
+            return os.path.join(self.spool_dir, name)
+
+    # Resend spooled batches oldest first, backing off exponentially while the sink is down
+    def _retry_spooled(self) -> None:
+        if time.monotonic() < self._next_retry_at:
+            return
+
+        for name in self._spool_files():
+            path = os.path.join(self.spool_dir, name)
+            try:
+                with open(path, "r") as f:
+                    batch = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Discarding unreadable spooled alert batch {name}: {e}")
+                os.remove(path)
+                continue
+
+            self._count("retried")
+            if not self._send(batch):
+                self._schedule_retry()
+                return
+
+            self._remove_spooled(path)
+            self._backoff = ALERT_RETRY_MIN_BACKOFF_S
+
+            # Fresh alerts take priority over draining the backlog
+            if not self._queue.empty():
+                return
+
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+# Helper function to get the dispatcher shared by every caller in this process
+def get_alert_dispatcher(app_url: str) -> AlertDispatcher:
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(app_url)
+        if dispatcher is None:
+            dispatcher = AlertDispatcher(app_url)
+            _dispatchers[app_url] = dispatcher
+
+    # Batches left over from a previous (possibly frozen or recycled) host are retried right away
+    if dispatcher.spooled_batches():
+        dispatcher._ensure_worker()
+    return dispatcher
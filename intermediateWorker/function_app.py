@@ -1,16 +1,25 @@
 import azure.functions as func
+import json
 import logging
 import csv
 import io
 import pyodbc
 import os
-import requests
+from pathlib import Path
 from azure.storage.blob import BlobServiceClient
+from alert_dispatcher import ALERT_REQUEST_FLUSH_TIMEOUT_S, get_alert_dispatcher
+from rollup import remove_source_rows, update_rollup
+from instrumentation import METRICS, PROFILER, export_metrics
+
+# Alerts are raised above this speed, whatever the vehicle type (same rule as the live mode of the analyzer)
+ALERT_SPEED_KMH = float(os.getenv("ALERT_SPEED_KMH", "130"))
 
 app = func.FunctionApp()
+METRICS.set_app("intermediateWorker")
 
 @app.function_name(name="HttpTriggerFunc")
 @app.route(route="process", auth_level=func.AuthLevel.ANONYMOUS)
+@PROFILER.profiled("HttpTriggerFunc")
 def HttpTriggerFunc(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('HTTP trigger function to process a blob file by filename.')
 
@@ -43,31 +52,35 @@ def HttpTriggerFunc(req: func.HttpRequest) -> func.HttpResponse:
         if not blob_client.exists():
             return func.HttpResponse(f"Blob file '{filename}' not found in container.", status_code=404)
 
-        blob_data = blob_client.download_blob().readall().decode('utf-8')
+        with METRICS.timer("blob_download_seconds", container=BLOB_CONTAINER_NAME):
+            blob_data = blob_client.download_blob().readall().decode('utf-8')
+        METRICS.inc("blob_download_bytes_total", len(blob_data), container=BLOB_CONTAINER_NAME)
 
         vehicle_records_list = []
         reader = csv.DictReader(io.StringIO(blob_data))
 
-        for row in reader:
-            record = (
-                int(row['vehicleId']),
-                float(row['timeEntered']),
-                float(row['speed']),
-                row['vehicleType'],
-                row['lane'],
-                int(row['speeding'])
-            )
-            vehicle_records_list.append(record)
+        with METRICS.timer("csv_parse_seconds"):
+            for row in reader:
+                record = (
+                    int(row['vehicleId']),
+                    float(row['timeEntered']),
+                    float(row['speed']),
+                    row['vehicleType'],
+                    row['lane'],
+                    int(row['speeding'])
+                )
+                vehicle_records_list.append(record)
+        METRICS.inc("records_parsed_total", len(vehicle_records_list))
 
         if not vehicle_records_list:
             return func.HttpResponse("CSV file has no records.", status_code=400)
 
         # Save to SQL
-        upload_succeeded, error_msg = save_data_to_SQL_storage(SQL_STORAGE_CONN_STRING, vehicle_records_list)
+        upload_succeeded, error_msg, alerted_vehicle_ids = save_data_to_SQL_storage(SQL_STORAGE_CONN_STRING, vehicle_records_list, Path(filename).stem)
         if not upload_succeeded:
             return func.HttpResponse(f"SQL error: {error_msg}", status_code=500)
 
-        # Check for speeding vehicles
+        # Check for speeding vehicles, once the rows are committed
         speeding_vehicles = [
             {
                 "vehicleId": rec[0],
@@ -75,13 +88,18 @@ def HttpTriggerFunc(req: func.HttpRequest) -> func.HttpResponse:
                 "speed": rec[2],
                 "vehicleType": rec[3]
             }
-            for rec in vehicle_records_list if rec[2] > 130
+            for rec in vehicle_records_list if rec[2] > ALERT_SPEED_KMH
         ]
 
-        if speeding_vehicles:
-            alert_successful, alert_error = send_alert(ALERT_WEB_APP_URL, speeding_vehicles)
-            if not alert_successful:
-                return func.HttpResponse(f"Alert failed: {alert_error}", status_code=500)
+        # Alerts are unique per (clip, vehicleId): a repeated ingestion of the clip only alerts on new vehicles
+        new_alerts = [alert for alert in speeding_vehicles if alert["vehicleId"] not in alerted_vehicle_ids]
+
+        # Alerts are delivered in the background, ingestion waits for the alert web app only briefly:
+        # whatever is not delivered by then is spooled to disk, the host may freeze the process after returning
+        if new_alerts:
+            dispatcher = get_alert_dispatcher(ALERT_WEB_APP_URL)
+            dispatcher.enqueue(new_alerts)
+            dispatcher.flush_or_spool(ALERT_REQUEST_FLUSH_TIMEOUT_S)
 
         return func.HttpResponse(
             f"Successfully processed {len(vehicle_records_list)} records. "
@@ -91,31 +109,72 @@ def HttpTriggerFunc(req: func.HttpRequest) -> func.HttpResponse:
 
     except Exception as e:
         logging.error(f"Exception occurred: {e}")
+        METRICS.inc("invocation_errors_total", function="HttpTriggerFunc")
         return func.HttpResponse(f"Internal error: {e}", status_code=500)
 
 
-# Helper functions remain exactly the same as in your original code
-def save_data_to_SQL_storage(conn_str: str, data_rows: list) -> tuple[bool, str]:
+# Metrics of this worker in Prometheus text format (?format=json for a JSON snapshot)
+@app.route(route="metrics", auth_level=func.AuthLevel.FUNCTION)
+def metrics(req: func.HttpRequest) -> func.HttpResponse:
+    (body, mimetype) = export_metrics(req.params.get("format", "prometheus"))
+    return func.HttpResponse(body, mimetype=mimetype)
+
+
+# Profiling status and summary of the last profiled request (?arm=N profiles the next N requests)
+@app.route(route="profile", auth_level=func.AuthLevel.FUNCTION)
+def profile(req: func.HttpRequest) -> func.HttpResponse:
+    if req.params.get("arm"):
+        try:
+            PROFILER.arm(int(req.params.get("arm")))
+        except ValueError:
+            return func.HttpResponse("'arm' must be a non-negative integer.", status_code=400)
+    return func.HttpResponse(json.dumps(PROFILER.status()), mimetype="application/json")
+
+
+# Helper function to save the records of a clip, returns (succeeded, error message, ids of the vehicles of the clip
+# that a previous ingestion already alerted on)
+def save_data_to_SQL_storage(conn_str: str, data_rows: list, source_video: str = None) -> tuple[bool, str, set]:
     insert_query = """
-        INSERT INTO vehicledata (vehicleId, timeEntered, speed, vehicletype, lane, speeding)
-        VALUES (?, ?, ?, ?, ?, ?)
+        INSERT INTO vehicledata (vehicleId, timeEntered, speed, vehicletype, lane, speeding, SourceVideo)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """
+    # Analytics result caches are keyed by this version, bumping it invalidates them. It is bumped last, in the
+    # same transaction as the rows and the rollup: committed rows always come with a new version, and the
+    # single row is only locked from the bump to the commit
+    watermark_query = """
+        UPDATE IngestionWatermark SET version = version + 1
+    """
+    alerted_vehicles_query = """
+        SELECT vehicleId FROM VehicleData WHERE SourceVideo = ? AND speed > ?
     """
     try:
         with pyodbc.connect(conn_str) as conn:
             with conn.cursor() as cursor:
                 cursor.fast_executemany = True
-                cursor.executemany(insert_query, data_rows)
-                conn.commit()
-                return (True, "")
-    except Exception as e:
-        return (False, f"Connection Error: {e}")
 
-def send_alert(app_url: str, alert_data) -> tuple[bool, str]:
-    try:
-        headers = {"Content-Type": "application/json"}
-        logging.info("Sending POST to Alert web app")
-        response = requests.post(app_url, json=alert_data, headers=headers)
-        logging.info(f"Alert web app responded with code: {response.status_code}\n{response.text}")
-        return (True, "")
+                # Ingestion is idempotent per clip: a retried or repeated request replaces the rows it wrote before
+                (alerted_vehicle_ids, replaced) = (set(), 0)
+                if source_video:
+                    with METRICS.timer("sql_replace_seconds"):
+                        # Read before the rows go, the caller does not alert on these vehicles again
+                        cursor.execute(alerted_vehicles_query, source_video, ALERT_SPEED_KMH)
+                        alerted_vehicle_ids = {row[0] for row in cursor.fetchall()}
+                        replaced = remove_source_rows(cursor, source_video)
+                if replaced:
+                    logging.warning(f"Replacing {replaced} rows of a previous ingestion of {source_video}")
+                    METRICS.inc("sql_rows_replaced_total", replaced)
+
+                with METRICS.timer("sql_insert_seconds"):
+                    cursor.executemany(insert_query, [row + (source_video,) for row in data_rows])
+
+                # Keep the per-lane 5-minute rollup in the same transaction as the raw rows
+                with METRICS.timer("sql_rollup_seconds"):
+                    update_rollup(cursor, data_rows)
+                cursor.execute(watermark_query)
+                with METRICS.timer("sql_commit_seconds"):
+                    conn.commit()
+                METRICS.inc("sql_rows_inserted_total", len(data_rows))
+                return (True, "", alerted_vehicle_ids)
     except Exception as e:
-        return (False, f"Connection Error: {e}")
\ No newline at end of file
+        METRICS.inc("sql_errors_total")
+        return (False, f"Connection Error: {e}", set())
\ No newline at end of file
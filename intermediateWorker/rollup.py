@@ -0,0 +1,79 @@
+import math
+
+# Granularity of the stored rollup buckets, coarser reports are re-bucketed from these. Must match
+# VehicleData.TimeBucket, defined in database/migrations/002_add_time_bucket_and_source.sql
+ROLLUP_BUCKET_SECONDS = 300
+
+# UPDLOCK + SERIALIZABLE keeps the key range locked until commit, so two ingestions
+# touching the same (lane, bucket) cannot both miss the update and race on the insert
+UPDATE_ROLLUP_QUERY = """
+        UPDATE VehicleLaneRollup WITH (UPDLOCK, SERIALIZABLE)
+        SET vehicle_count = vehicle_count + ?, speed_sum = speed_sum + ?, speeding_count = speeding_count + ?
+        WHERE lane = ? AND time_bucket = ?
+    """
+
+INSERT_ROLLUP_QUERY = """
+        INSERT INTO VehicleLaneRollup (lane, time_bucket, vehicle_count, speed_sum, speeding_count)
+        VALUES (?, ?, ?, ?, ?)
+    """
+
+# Rows of a clip that was ingested before, per (lane, bucket), locked until the replacement commits
+SOURCE_ROLLUP_QUERY = """
+        SELECT lane, TimeBucket, COUNT(*), SUM(speed), SUM(CASE WHEN speeding = 1 THEN 1 ELSE 0 END)
+        FROM VehicleData WITH (UPDLOCK, SERIALIZABLE)
+        WHERE SourceVideo = ?
+        GROUP BY lane, TimeBucket
+    """
+
+SUBTRACT_ROLLUP_QUERY = """
+        UPDATE VehicleLaneRollup WITH (UPDLOCK, SERIALIZABLE)
+        SET vehicle_count = vehicle_count - ?, speed_sum = speed_sum - ?, speeding_count = speeding_count - ?
+        WHERE lane = ? AND time_bucket = ?
+    """
+
+# An emptied bucket is removed, the reports divide speed_sum by vehicle_count
+DELETE_EMPTY_ROLLUP_QUERY = """
+        DELETE FROM VehicleLaneRollup WHERE lane = ? AND time_bucket = ? AND vehicle_count <= 0
+    """
+
+DELETE_SOURCE_ROWS_QUERY = """
+        DELETE FROM VehicleData WHERE SourceVideo = ?
+    """
+
+
+# Helper function to aggregate vehicle records into (lane, time_bucket, vehicle_count, speed_sum, speeding_count) rows
+def aggregate_rollup(data_rows: list) -> list:
+    # Records are (vehicleId, timeEntered, speed, vehicleType, lane, speeding)
+    buckets = {}
+    for (_, time_entered, speed, _, lane, speeding) in data_rows:
+        key = (lane, int(math.floor(time_entered / ROLLUP_BUCKET_SECONDS)))
+        (count, speed_sum, speeding_count) = buckets.get(key, (0, 0.0, 0))
+        buckets[key] = (count + 1, speed_sum + speed, speeding_count + (1 if speeding == 1 else 0))
+
+    return [(lane, bucket, count, speed_sum, speeding_count)
+            for ((lane, bucket), (count, speed_sum, speeding_count)) in sorted(buckets.items())]
+
+
+# Helper function to merge a batch of vehicle records into the rollup table, inside the caller's transaction
+def update_rollup(cursor, data_rows: list) -> int:
+    rollup_rows = aggregate_rollup(data_rows)
+    for (lane, bucket, count, speed_sum, speeding_count) in rollup_rows:
+        cursor.execute(UPDATE_ROLLUP_QUERY, count, speed_sum, speeding_count, lane, bucket)
+        if cursor.rowcount == 0:
+            cursor.execute(INSERT_ROLLUP_QUERY, lane, bucket, count, speed_sum, speeding_count)
+    return len(rollup_rows)
+
+
+# Helper function to remove the rows of a previous ingestion of the same clip and their rollup counts, inside
+# the caller's transaction. Returns the number of removed rows (0 for a clip ingested for the first time)
+def remove_source_rows(cursor, source_video: str) -> int:
+    cursor.execute(SOURCE_ROLLUP_QUERY, source_video)
+    previous = cursor.fetchall()
+    if not previous:
+        return 0
+
+    for (lane, bucket, count, speed_sum, speeding_count) in previous:
+        cursor.execute(SUBTRACT_ROLLUP_QUERY, count, speed_sum, speeding_count, lane, bucket)
+        cursor.execute(DELETE_EMPTY_ROLLUP_QUERY, lane, bucket)
+    cursor.execute(DELETE_SOURCE_ROWS_QUERY, source_video)
+    return sum(row[2] for row in previous)
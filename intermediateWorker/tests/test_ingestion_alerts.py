@@ -0,0 +1,52 @@
+import azure.functions as func
+import pytest
+from local_blob import LocalBlobServiceClient
+
+CSV_HEADER = "vehicleId,timeEntered,speed,vehicleType,lane,speeding\n"
+
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.alerts = []
+
+    def enqueue(self, alerts: list) -> None:
+        self.alerts.extend(alerts)
+
+    def flush_or_spool(self, timeout: float) -> bool:
+        return True
+
+
+@pytest.fixture
+def ingest(worker, sql_conn_str, tmp_path, monkeypatch):
+    blob_conn_str = f"LocalBlobRoot={tmp_path / 'blobs'}"
+    monkeypatch.setenv("ALERT_WEB_APP_URL", "http://alert-logger/api/alert/list")
+    monkeypatch.setenv("SQL_STORAGE_CONN_STRING", sql_conn_str)
+    monkeypatch.setenv("AzureWebJobsStorage", blob_conn_str)
+    monkeypatch.setattr(worker, "BlobServiceClient", LocalBlobServiceClient)
+    dispatcher = RecordingDispatcher()
+    monkeypatch.setattr(worker, "get_alert_dispatcher", lambda app_url: dispatcher)
+    blob_service_client = LocalBlobServiceClient.from_connection_string(blob_conn_str)
+
+    # Upload the CSV of a clip and ingest it, returns the vehicle ids alerted on by this request
+    def ingest_clip(filename: str, rows: list) -> list:
+        data = CSV_HEADER + "".join(",".join(str(value) for value in row) + "\n" for row in rows)
+        blob_service_client.get_blob_client("intermediate-results", filename).upload_blob(data.encode(), overwrite=True)
+        already_sent = len(dispatcher.alerts)
+        request = func.HttpRequest("GET", "http://localhost/api/process", params={"filename": filename}, body=b"")
+        assert worker.HttpTriggerFunc(request).status_code == 200
+        return [alert["vehicleId"] for alert in dispatcher.alerts[already_sent:]]
+
+    return ingest_clip
+
+
+def test_repeated_ingestion_only_alerts_on_new_vehicles(ingest):
+    rows = [(1, 10.0, 150.0, "car", "in", 1), (2, 11.0, 90.0, "car", "in", 0), (3, 12.0, 140.0, "truck", "out", 1)]
+
+    assert ingest("video_part1.csv", rows) == [1, 3]
+    assert ingest("video_part1.csv", rows) == []
+    assert ingest("video_part1.csv", rows + [(4, 13.0, 160.0, "car", "out", 1)]) == [4]
+
+
+def test_alerts_are_unique_per_clip_not_per_vehicle_id(ingest):
+    assert ingest("video_part1.csv", [(1, 10.0, 150.0, "car", "in", 1)]) == [1]
+    assert ingest("video_part2.csv", [(1, 70.0, 145.0, "car", "in", 1)]) == [1]
@@ -0,0 +1,58 @@
+import sqlite_odbc
+
+# (vehicleId, timeEntered, speed, vehicleType, lane, speeding)
+RECORDS = [
+    (1, 10.0, 90.0, "car", "in", 0),
+    (2, 20.0, 140.0, "car", "in", 1),
+    (3, 310.0, 60.0, "truck", "out", 0),
+]
+
+
+def rollup_rows(conn_str: str) -> list:
+    with sqlite_odbc.connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT lane, time_bucket, vehicle_count, speed_sum, speeding_count "
+                           "FROM VehicleLaneRollup ORDER BY lane, time_bucket")
+            return cursor.fetchall()
+
+
+def vehicle_count(conn_str: str) -> int:
+    with sqlite_odbc.connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM VehicleData")
+            return cursor.fetchone()[0]
+
+
+def test_rollup_buckets_follow_time_bucket(worker, sql_conn_str):
+    assert worker.save_data_to_SQL_storage(sql_conn_str, RECORDS, "video_part1") == (True, "", set())
+
+    assert rollup_rows(sql_conn_str) == [("in", 0, 2, 230.0, 1), ("out", 1, 1, 60.0, 0)]
+
+
+def test_repeated_ingestion_replaces_the_rows_of_the_clip(worker, sql_conn_str):
+    worker.save_data_to_SQL_storage(sql_conn_str, RECORDS, "video_part1")
+    worker.save_data_to_SQL_storage(sql_conn_str, [(7, 12.0, 100.0, "car", "in", 0)], "video_part2")
+
+    worker.save_data_to_SQL_storage(sql_conn_str, RECORDS[:2], "video_part1")
+
+    assert vehicle_count(sql_conn_str) == 3
+    assert rollup_rows(sql_conn_str) == [("in", 0, 3, 330.0, 1)]
+
+
+def watermark(conn_str: str) -> int:
+    with sqlite_odbc.connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT version FROM IngestionWatermark")
+            return cursor.fetchone()[0]
+
+
+def test_ingestion_bumps_the_watermark_with_its_rows(worker, sql_conn_str):
+    worker.save_data_to_SQL_storage(sql_conn_str, RECORDS, "video_part1")
+    assert watermark(sql_conn_str) == 1
+
+    # A failing insert rolls back the rows, the rollup and the bump together
+    (succeeded, _, _) = worker.save_data_to_SQL_storage(sql_conn_str, [(9, 30.0, None, "car", "in", 0)], "video_part2")
+
+    assert not succeeded
+    assert watermark(sql_conn_str) == 1
+    assert vehicle_count(sql_conn_str) == 3
@@ -0,0 +1,202 @@
+"""
+Filesystem stand-in for azure.storage.blob.BlobServiceClient, for running the function apps locally.
+
+Containers are directories under the root of the connection string ("LocalBlobRoot=<dir>") and
+blobs are files in them; blob metadata lives in <root>/.metadata/<container>/<blob>.json. Only the
+client calls the apps make are provided (upload / download / exists / properties / staged blocks).
+
+Every byte read or written is counted per container in TRANSFER_STATS, so the pipeline harness can
+report the bytes each stage moved.
+"""
+import collections
+import json
+import os
+import threading
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+# (container, "read" | "written") -> bytes, for all clients of the process
+TRANSFER_STATS = collections.Counter()
+_stats_lock = threading.Lock()
+
+METADATA_DIR = ".metadata"
+
+
+def _count(container: str, direction: str, size: int) -> None:
+    with _stats_lock:
+        TRANSFER_STATS[(container, direction)] += size
+
+
+# Helper function to get a copy of the transfer counters (to diff before / after a stage)
+def transfer_snapshot() -> dict:
+    with _stats_lock:
+        return dict(TRANSFER_STATS)
+
+
+# Helper function to read upload data given as bytes, str or a file-like object
+def _read_data(data) -> bytes:
+    if hasattr(data, "read"):
+        data = data.read()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return bytes(data)
+
+
+class BlobProperties:
+    def __init__(self, name, container, size, metadata, content_settings=None):
+        self.name = name
+        self.container = container
+        self.size = size
+        self.metadata = metadata
+        self.content_settings = content_settings
+
+
+class StorageStreamDownloader:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def readall(self) -> bytes:
+        return self._data
+
+    def readinto(self, stream) -> int:
+        stream.write(self._data)
+        return len(self._data)
+
+
+class LocalBlobClient:
+    def __init__(self, root, container, blob):
+        self.root = root
+        self.container_name = container
+        self.blob_name = blob
+        self.path = os.path.join(root, container, blob)
+        self.metadata_path = os.path.join(root, METADATA_DIR, container, blob + ".json")
+        self._blocks = {}
+        self._blocks_lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def _write(self, data: bytes, overwrite: bool, metadata: dict, content_settings) -> None:
+        if not overwrite and self.exists():
+            raise ResourceExistsError(f"The specified blob already exists: {self.container_name}/{self.blob_name}")
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".uploading"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+
+        os.makedirs(os.path.dirname(self.metadata_path), exist_ok=True)
+        with open(self.metadata_path, "w") as f:
+            json.dump({"metadata": metadata or {},
+                       "content_type": getattr(content_settings, "content_type", None),
+                       "content_encoding": getattr(content_settings, "content_encoding", None)}, f)
+
+    def upload_blob(self, data, overwrite=False, metadata=None, content_settings=None, **kwargs):
+        data = _read_data(data)
+        self._write(data, overwrite, metadata, content_settings)
+        _count(self.container_name, "written", len(data))
+        return {"name": self.blob_name}
+
+    def download_blob(self, **kwargs) -> StorageStreamDownloader:
+        if not self.exists():
+            raise ResourceNotFoundError(f"The specified blob does not exist: {self.container_name}/{self.blob_name}")
+        with open(self.path, "rb") as f:
+            data = f.read()
+        _count(self.container_name, "read", len(data))
+        return StorageStreamDownloader(data)
+
+    def get_blob_properties(self, **kwargs) -> BlobProperties:
+        if not self.exists():
+            raise ResourceNotFoundError(f"The specified blob does not exist: {self.container_name}/{self.blob_name}")
+        stored = {}
+        if os.path.isfile(self.metadata_path):
+            with open(self.metadata_path) as f:
+                stored = json.load(f)
+        return BlobProperties(self.blob_name, self.container_name, os.path.getsize(self.path),
+                              stored.get("metadata", {}), stored)
+
+    def delete_blob(self, **kwargs) -> None:
+        if not self.exists():
+            raise ResourceNotFoundError(f"The specified blob does not exist: {self.container_name}/{self.blob_name}")
+        os.remove(self.path)
+        if os.path.isfile(self.metadata_path):
+            os.remove(self.metadata_path)
+
+    # Staged blocks are kept in memory until commit_block_list, as uncommitted blocks are on the service
+    def stage_block(self, block_id, data, **kwargs) -> None:
+        data = _read_data(data)
+        with self._blocks_lock:
+            self._blocks[block_id] = data
+        _count(self.container_name, "written", len(data))
+
+    def commit_block_list(self, block_list, content_settings=None, metadata=None, **kwargs):
+        with self._blocks_lock:
+            block_ids = [getattr(block, "id", block) for block in block_list]
+            missing = [block_id for block_id in block_ids if block_id not in self._blocks]
+            if missing:
+                raise ResourceNotFoundError(f"Blocks were never staged: {missing[:3]}")
+            data = b"".join(self._blocks[block_id] for block_id in block_ids)
+            self._blocks.clear()
+        self._write(data, True, metadata, content_settings)
+        return {"name": self.blob_name}
+
+
+class LocalContainerClient:
+    def __init__(self, root, container):
+        self.root = root
+        self.container_name = container
+        self.path = os.path.join(root, container)
+
+    def get_blob_client(self, blob) -> LocalBlobClient:
+        return LocalBlobClient(self.root, self.container_name, blob)
+
+    def upload_blob(self, name, data, overwrite=False, **kwargs) -> LocalBlobClient:
+        blob_client = self.get_blob_client(name)
+        blob_client.upload_blob(data, overwrite=overwrite, **kwargs)
+        return blob_client
+
+    def download_blob(self, blob, **kwargs) -> StorageStreamDownloader:
+        return self.get_blob_client(blob).download_blob(**kwargs)
+
+    def delete_blob(self, blob, **kwargs) -> None:
+        self.get_blob_client(blob).delete_blob(**kwargs)
+
+    def list_blobs(self, name_starts_with=None, **kwargs) -> list:
+        if not os.path.isdir(self.path):
+            return []
+        blobs = []
+        for (dir_path, _, file_names) in os.walk(self.path):
+            for file_name in file_names:
+                if file_name.endswith(".uploading"):
+                    continue
+                name = os.path.relpath(os.path.join(dir_path, file_name), self.path).replace(os.sep, "/")
+                if name_starts_with is None or name.startswith(name_starts_with):
+                    blobs.append(self.get_blob_client(name).get_blob_properties())
+        return sorted(blobs, key=lambda blob: blob.name)
+
+
+class LocalBlobServiceClient:
+    """
+    Drop-in for BlobServiceClient over a local directory.
+
+    Args:
+        root (str): Directory holding one sub-directory per container
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def from_connection_string(cls, conn_str, **kwargs):
+        for part in (conn_str or "").split(";"):
+            (key, _, value) = part.partition("=")
+            if key.strip() == "LocalBlobRoot" and value.strip():
+                return cls(value.strip())
+        raise ValueError(f"No LocalBlobRoot=<dir> in connection string: {conn_str}")
+
+    def get_container_client(self, container) -> LocalContainerClient:
+        return LocalContainerClient(self.root, container)
+
+    def get_blob_client(self, container, blob, **kwargs) -> LocalBlobClient:
+        return LocalBlobClient(self.root, container, blob)
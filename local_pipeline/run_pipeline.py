@@ -0,0 +1,508 @@
+"""
+Run the whole traffic monitoring pipeline on one machine, with the functions of every app as deployed.
+
+    input-video --VideoSegmenter--> output-segments --opencvanalyzerbloblocal--> output-csv
+        --(handoff)--> intermediate-results --intermediateWorker--> SQL + alerts --> alert-logger
+        --analytics (QAll, export)--> result blobs
+
+Blob storage is a directory tree (local_blob.py), Azure SQL is a SQLite file with the schema of
+database/migrations (sqlite_odbc.py, installed as the pyodbc module), and the alert-logger Flask app
+is served on a local port. Every function app is imported from its own directory and called with
+the same trigger objects the Functions host passes (HttpRequest, InputStream, TimerRequest), one after
+the other. The analyzer queues the segments in a local job queue (scheduler.LocalJobQueue) and its
+timer-triggered worker drains it.
+The handoff stage copies the analyzer CSVs into the container the ingestion worker reads, which
+is done outside the function apps in the deployment.
+
+Without --video a deterministic synthetic video (opencvanalyzerbloblocal/benchmarks) is generated
+and analysed with the colour-based synthetic detector, so the ingested counts can be checked
+against its ground truth. A real video is analysed with YOLOv8 (needs ultralytics). Vehicles that are
+inside a lane ROI at a segment boundary are timed by the later segment from its first frame, each
+of them may add one record above the ground truth; the report lists how many there are and flags
+(exit code 1) an over-count they do not explain.
+
+Per stage the report holds the wall-clock time, the bytes read / written per blob container and
+how far the RSS rose above its level at the start of the stage (peak sampled from /proc, Linux
+only); with --trace-python-memory also how far the Python heap rose (tracemalloc peak, slows the
+analyzer down). Memory kept from earlier stages is not charged to later ones.
+
+Requirements: the packages of the apps' requirements.txt files (azure-functions, azure-storage-blob,
+moviepy, opencv, pandas, flask, requests), no Azure account, ODBC driver or SQL Server.
+
+Usage (from the repository root):
+    python local_pipeline/run_pipeline.py
+    python local_pipeline/run_pipeline.py --duration 300 --vehicles-per-minute 40 --json baseline.json
+    python local_pipeline/run_pipeline.py --video traffic.mp4
+"""
+import argparse
+import contextlib
+import functools
+import importlib.util
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+PIPELINE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(PIPELINE_DIR)
+sys.path.insert(0, PIPELINE_DIR)
+
+import azure.functions as func
+from azure.functions.blob import InputStream
+from azure.functions.timer import TimerRequest
+import sqlite_odbc
+from local_blob import LocalBlobServiceClient, transfer_snapshot
+
+SEGMENTER_DIR = os.path.join(REPO_ROOT, "VideoSegmenter")
+ANALYZER_DIR = os.path.join(REPO_ROOT, "opencvanalyzerbloblocal")
+WORKER_DIR = os.path.join(REPO_ROOT, "intermediateWorker")
+ANALYTICS_DIR = os.path.join(REPO_ROOT, "analytics")
+ALERT_LOGGER_DIR = os.path.join(REPO_ROOT, "alert-logger")
+SHARED_DIR = os.path.join(REPO_ROOT, "shared")
+
+# Containers used by the apps (hard-coded in them, except the analytics results)
+INPUT_CONTAINER = "input-video"
+SEGMENTS_CONTAINER = "output-segments"
+ANALYZER_CSV_CONTAINER = "output-csv"
+WORKER_CONTAINER = "intermediate-results"
+ANALYTICS_CONTAINER = "analytics-results"
+
+# Longest wait for the alert dispatcher to deliver every queued alert
+ALERT_FLUSH_TIMEOUT_S = 30.0
+
+# Interval of the RSS sampler
+MEMORY_SAMPLE_INTERVAL_S = 0.02
+
+
+class PipelineError(Exception):
+    pass
+
+
+# Helper function to import an app's entry module under a unique name with the app's own local modules
+# (proccess2, ... exist in several apps, each app must get its copy). The shared modules are imported
+# from shared/ rather than from a possibly stale vendored copy, once per app like the local ones.
+def load_app(app_dir: str, module_name: str, file_name: str = "function_app.py"):
+    for directory in (app_dir, SHARED_DIR):
+        for local_module in [os.path.splitext(name)[0] for name in os.listdir(directory) if name.endswith(".py")]:
+            sys.modules.pop(local_module, None)
+
+    sys.path[0:0] = [SHARED_DIR, app_dir]
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(app_dir, file_name))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(SHARED_DIR)
+        sys.path.remove(app_dir)
+    return module
+
+
+# Helper function to build the HttpRequest the Functions host passes to an HTTP trigger
+def http_request(route: str, params: dict = None) -> func.HttpRequest:
+    return func.HttpRequest("GET", f"http://localhost/api/{route}", params=params or {}, body=b"")
+
+
+def _current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemorySampler(threading.Thread):
+    """Samples the RSS of the process while a stage runs and keeps the peak above the starting RSS."""
+
+    def __init__(self):
+        super().__init__(name="memory-sampler", daemon=True)
+        self.start_rss = _current_rss_bytes()
+        self.peak = self.start_rss
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(MEMORY_SAMPLE_INTERVAL_S):
+            rss = _current_rss_bytes()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    # Returns the growth of the RSS while the stage ran (None without /proc)
+    def stop(self) -> int:
+        self._stop_event.set()
+        self.join()
+        if self.start_rss is None:
+            return None
+        return max(self.peak, _current_rss_bytes() or 0) - self.start_rss
+
+
+class StageRecorder:
+    """Wall-clock time, blob bytes and peak memory of every pipeline stage."""
+
+    def __init__(self):
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        details = {}
+        before = transfer_snapshot()
+        sampler = MemorySampler()
+        sampler.start()
+        python_start = 0
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            python_start = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            yield details
+        finally:
+            seconds = time.perf_counter() - started
+            rss_growth = sampler.stop()
+            after = transfer_snapshot()
+
+            containers = {}
+            for (container, direction), size in after.items():
+                moved = size - before.get((container, direction), 0)
+                if moved:
+                    containers.setdefault(container, {"read": 0, "written": 0})[direction] = moved
+
+            self.stages.append({
+                "stage": name,
+                "seconds": round(seconds, 3),
+                "bytes_read": sum(c["read"] for c in containers.values()),
+                "bytes_written": sum(c["written"] for c in containers.values()),
+                "containers": containers,
+                "rss_growth_mb": round(rss_growth / 2**20, 1) if rss_growth is not None else None,
+                "python_growth_mb": (round((tracemalloc.get_traced_memory()[1] - python_start) / 2**20, 1)
+                                     if tracemalloc.is_tracing() else None),
+                **details,
+            })
+
+
+class Pipeline:
+    """
+    The five apps wired to local storage.
+
+    Args:
+        work_dir (str): Directory for the blob containers, the SQLite database and temp files
+        detector (str): "synthetic" (colour detector of the benchmarks) or "yolo" (the analyzer's default)
+        batch_segments (int): Segments the analysis worker analyses together (ANALYSIS_BATCH_SEGMENTS)
+    """
+
+    def __init__(self, work_dir: str, detector: str = "yolo", batch_segments: int = 1):
+        self.work_dir = work_dir
+        self.blob_root = os.path.join(work_dir, "blobs")
+        self.database = os.path.join(work_dir, "traffic.sqlite")
+        self.temp_dir = os.path.join(work_dir, "tmp")
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+        blob_conn_str = f"LocalBlobRoot={self.blob_root}"
+        sql_conn_str = f"Database={self.database}"
+        self.blob_service_client = LocalBlobServiceClient(self.blob_root)
+
+        # Every app reads its configuration from the environment, partly at import time
+        os.environ.update({
+            "AzureWebJobsStorage": blob_conn_str,
+            "SQL_STORAGE_CONN_STRING": sql_conn_str,
+            "SQL_STORAGE_CONN_STR": sql_conn_str,
+            "BLOB_CONTAINER_NAME": ANALYTICS_CONTAINER,
+            "TEMP": self.temp_dir,
+            "ANALYSIS_CHECKPOINT_DIR": os.path.join(work_dir, "checkpoints"),
+            "ALERT_SPOOL_DIR": os.path.join(work_dir, "alert-spool"),
+        })
+        os.environ.update({"ANALYSIS_QUEUE_BACKEND": "local", "ANALYSIS_QUEUE_DB": os.path.join(work_dir, "analysis-jobs.sqlite"),
+                           "ANALYSIS_BATCH_SEGMENTS": str(batch_segments),
+                           "ANALYSIS_MAX_CONCURRENCY": str(max(batch_segments, int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "2"))))})
+        # Ingestion is run (and timed) as its own stage
+        for name in ("ANALYSIS_CHECKPOINT_CONTAINER", "INGESTION_URL"):
+            os.environ.pop(name, None)
+        tempfile.tempdir = self.temp_dir
+
+        sqlite_odbc.create_schema(self.database)
+        sys.modules["pyodbc"] = sqlite_odbc
+
+        self.alert_logger = load_app(ALERT_LOGGER_DIR, "alert_logger_app", "app.py")
+        self.segmenter = load_app(SEGMENTER_DIR, "segmenter_function_app")
+        self.worker = load_app(WORKER_DIR, "intermediate_worker_function_app")
+        self.analytics = load_app(ANALYTICS_DIR, "analytics_function_app")
+        # Loaded last: its proccess2 / checkpoint modules stay importable for pickled checkpoints
+        self.analyzer = load_app(ANALYZER_DIR, "analyzer_function_app")
+        sys.path.insert(0, ANALYZER_DIR)
+
+        for app_module in (self.segmenter, self.worker, self.analytics, self.analyzer):
+            app_module.BlobServiceClient = LocalBlobServiceClient
+
+        if detector == "synthetic":
+            sys.path.insert(0, os.path.join(ANALYZER_DIR, "benchmarks"))
+            from synthetic_tracker import SyntheticBatchedTracker, SyntheticTracker
+            analyse_clip = self.analyzer.analyse_clip
+            analyse_streams = self.analyzer.analyse_streams
+
+            @functools.wraps(analyse_clip)
+            def analyse_clip_with_synthetic_detector(*args, **kwargs):
+                kwargs.setdefault("tracker", SyntheticTracker())
+                return analyse_clip(*args, **kwargs)
+
+            @functools.wraps(analyse_streams)
+            def analyse_streams_with_synthetic_detector(*args, **kwargs):
+                kwargs.setdefault("tracker", SyntheticBatchedTracker())
+                return analyse_streams(*args, **kwargs)
+
+            self.analyzer.analyse_clip = analyse_clip_with_synthetic_detector
+            self.analyzer.analyse_streams = analyse_streams_with_synthetic_detector
+
+        self.alert_url = self._start_alert_logger()
+        os.environ["ALERT_WEB_APP_URL"] = self.alert_url
+
+    def _start_alert_logger(self) -> str:
+        from werkzeug.serving import make_server
+
+        self.alert_server = make_server("127.0.0.1", 0, self.alert_logger.app, threaded=True)
+        threading.Thread(target=self.alert_server.serve_forever, name="alert-logger", daemon=True).start()
+        return f"http://127.0.0.1:{self.alert_server.server_port}/api/alert/list"
+
+    def close(self) -> None:
+        self.alert_server.shutdown()
+
+    def blob_names(self, container: str, prefix: str = None) -> list:
+        return [blob.name for blob in self.blob_service_client.get_container_client(container).list_blobs(name_starts_with=prefix)]
+
+    # Put the source video where the segmenter expects it
+    def upload_video(self, video_path: str) -> str:
+        video_name = os.path.basename(video_path)
+        with open(video_path, "rb") as f:
+            self.blob_service_client.get_blob_client(INPUT_CONTAINER, video_name).upload_blob(f, overwrite=True)
+        return video_name
+
+    def segment(self, video_name: str) -> list:
+        response = self.segmenter.VideoSegmentFunction(http_request("VideoSegmentFunction", {"video": video_name}))
+        if response.status_code != 200:
+            raise PipelineError(f"VideoSegmenter failed ({response.status_code}): {response.get_body().decode()}")
+        return self.blob_names(SEGMENTS_CONTAINER, os.path.splitext(video_name)[0] + "_part")
+
+    # Blob trigger of one segment: the host reads the blob and passes it as an InputStream, the analyzer queues it
+    def queue_segment(self, segment_name: str) -> str:
+        data = self.blob_service_client.get_blob_client(SEGMENTS_CONTAINER, segment_name).download_blob().readall()
+        self.analyzer.open_cv_analyzer(InputStream(data=data, name=segment_name, length=len(data),
+                                                   uri=f"local://{SEGMENTS_CONTAINER}/{segment_name}"))
+        return os.path.splitext(segment_name)[0] + ".csv"
+
+    # One invocation of the timer-triggered analysis worker, which drains the job queue
+    def run_analysis_worker(self, csv_names: list) -> dict:
+        self.analyzer.analysis_worker(TimerRequest())
+        stats = json.loads(self.analyzer.job_stats(http_request("jobs/stats")).get_body())
+        missing = [csv_name for csv_name in csv_names if csv_name not in self.blob_names(ANALYZER_CSV_CONTAINER)]
+        if missing:
+            raise PipelineError(f"Analysis jobs did not produce {missing}, queue: {stats}")
+        return stats
+
+    def handoff(self, csv_name: str) -> None:
+        data = self.blob_service_client.get_blob_client(ANALYZER_CSV_CONTAINER, csv_name).download_blob().readall()
+        self.blob_service_client.get_blob_client(WORKER_CONTAINER, csv_name).upload_blob(data, overwrite=True)
+
+    def ingest(self, csv_name: str) -> str:
+        response = self.worker.HttpTriggerFunc(http_request("process", {"filename": csv_name}))
+        if response.status_code != 200:
+            raise PipelineError(f"intermediateWorker failed on {csv_name} ({response.status_code}): {response.get_body().decode()}")
+        return response.get_body().decode()
+
+    # Wait until the background dispatcher has delivered every alert to the alert-logger
+    def deliver_alerts(self) -> dict:
+        dispatcher = self.worker.get_alert_dispatcher(self.alert_url)
+        delivered = dispatcher.flush(ALERT_FLUSH_TIMEOUT_S)
+        return {"delivered": delivered, "dispatcher": dict(dispatcher.stats),
+                "alerts_logged": len(self.alert_logger.recent_alerts)}
+
+    def run_analytics(self, route: str, function, params: dict = None) -> str:
+        response = function(http_request(route, params))
+        if response.status_code != 200:
+            raise PipelineError(f"analytics {route} failed ({response.status_code}): {response.get_body().decode()}")
+        return response.get_body().decode()
+
+    def ingested_records(self) -> list:
+        with sqlite_odbc.connect(f"Database={self.database}") as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT TimeEntered, speed, vehicletype, lane, speeding FROM VehicleData")
+                return [{"timeEntered": row[0], "speed": row[1], "vehicleType": row[2], "lane": row[3], "speeding": row[4]}
+                        for row in cursor.fetchall()]
+
+    def metrics_snapshots(self) -> dict:
+        return {name: module.METRICS.snapshot() for (name, module) in
+                (("VideoSegmenter", self.segmenter), ("opencvanalyzerbloblocal", self.analyzer),
+                 ("intermediateWorker", self.worker), ("analytics", self.analytics), ("alert-logger", self.alert_logger))}
+
+
+# Helper function to render the synthetic input video, returns (video path, ground truth records)
+def make_synthetic_video(work_dir: str, duration_s: int, vehicles_per_minute: int, seed: int) -> tuple[str, list]:
+    from synthetic_video import make_scenario, plan_vehicles, render_video, scenario_name
+
+    scenario = make_scenario(duration_s=duration_s, vehicles_per_minute=vehicles_per_minute, seed=seed)
+    vehicles = plan_vehicles(scenario)
+    video_path = os.path.join(work_dir, scenario_name(scenario) + ".avi")
+    render_video(scenario, vehicles, video_path)
+    ground_truth = [{key: vehicle[key] for key in ("lane", "vehicleType", "speed", "timeEntered", "speeding")}
+                    for vehicle in vehicles]
+    return (video_path, ground_truth)
+
+
+# Helper function to get the ground truth vehicles inside a lane ROI at a segment boundary: entered before it,
+# exit line crossed after it (the segmenter cuts every CLIP_SECONDS)
+def boundary_vehicles(ground_truth: list, duration_s: float) -> list:
+    from proccess2 import CLIP_SECONDS, ROI_LENGTH_M
+
+    boundaries = range(CLIP_SECONDS, int(math.ceil(duration_s)), CLIP_SECONDS)
+    return [vehicle for vehicle in ground_truth
+            if any(vehicle["timeEntered"] < boundary < vehicle["timeEntered"] + ROI_LENGTH_M / (vehicle["speed"] / 3.6)
+                   for boundary in boundaries)]
+
+
+# Helper function to add the segment boundary allowance to a ground truth comparison
+def check_boundary_over_count(check: dict, ground_truth: list, duration_s: float) -> dict:
+    check["boundary_vehicles"] = len(boundary_vehicles(ground_truth, duration_s))
+    check["over_count"] = max(0, check["detected"] - check["expected"])
+    check["over_count_flagged"] = check["over_count"] > check["boundary_vehicles"]
+    return check
+
+
+def video_duration_s(video_path: str) -> float:
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps if fps else None
+    finally:
+        cap.release()
+
+
+def run_pipeline(pipeline: Pipeline, video_path: str) -> dict:
+    recorder = StageRecorder()
+
+    with recorder.stage("upload") as details:
+        video_name = pipeline.upload_video(video_path)
+        details["items"] = 1
+
+    started = time.perf_counter()
+    with recorder.stage("segment") as details:
+        segment_names = pipeline.segment(video_name)
+        details["items"] = len(segment_names)
+
+    with recorder.stage("analyze") as details:
+        csv_names = [pipeline.queue_segment(segment_name) for segment_name in segment_names]
+        details["queue"] = pipeline.run_analysis_worker(csv_names)
+        details["items"] = len(csv_names)
+
+    with recorder.stage("handoff") as details:
+        for csv_name in csv_names:
+            pipeline.handoff(csv_name)
+        details["items"] = len(csv_names)
+
+    with recorder.stage("ingest") as details:
+        details["responses"] = [pipeline.ingest(csv_name) for csv_name in csv_names]
+        details["items"] = len(csv_names)
+
+    with recorder.stage("alerts") as details:
+        details.update(pipeline.deliver_alerts())
+        details["items"] = details["alerts_logged"]
+
+    with recorder.stage("analytics") as details:
+        details["responses"] = {
+            "QAll": json.loads(pipeline.run_analytics("QAll", pipeline.analytics.GetAllReports)),
+            "export": pipeline.run_analytics("export", pipeline.analytics.ExportAllVehicles),
+        }
+        details["items"] = 2
+    end_to_end_s = time.perf_counter() - started
+
+    duration_s = video_duration_s(video_path)
+    return {
+        "video": video_name,
+        "video_duration_s": round(duration_s, 2) if duration_s else None,
+        "end_to_end_s": round(end_to_end_s, 3),
+        "realtime_factor": round(duration_s / end_to_end_s, 2) if duration_s else None,
+        "stages": recorder.stages,
+    }
+
+
+def print_report(results: dict) -> None:
+    print(f"\nVideo {results['video']} ({results['video_duration_s']} s), end-to-end {results['end_to_end_s']} s "
+          f"(segment -> analytics, {results['realtime_factor']}x realtime)\n")
+    header = f"{'stage':<10} {'items':>6} {'seconds':>9} {'share':>6} {'read KB':>11} {'written KB':>11} {'+RSS MB':>12} {'+py MB':>11}"
+    print(header)
+    print("-" * len(header))
+    for stage in results["stages"]:
+        share = f"{100.0 * stage['seconds'] / results['end_to_end_s']:.1f}%" if stage["stage"] != "upload" else "-"
+        rss_growth = stage["rss_growth_mb"] if stage["rss_growth_mb"] is not None else "-"
+        python_growth = stage["python_growth_mb"] if stage["python_growth_mb"] is not None else "-"
+        print(f"{stage['stage']:<10} {stage.get('items', ''):>6} {stage['seconds']:>9.3f} {share:>6} "
+              f"{stage['bytes_read'] / 1024:>11,.1f} {stage['bytes_written'] / 1024:>11,.1f} "
+              f"{rss_growth:>12} {python_growth:>11}")
+
+    if "ground_truth" in results:
+        check = results["ground_truth"]
+        print(f"\nIngested {check['detected']} of {check['expected']} vehicles, {check['matched']} matched "
+              f"({check['count_agreement_pct']}%), {check['false_positives']} false positives")
+        print(f"{check['boundary_vehicles']} vehicles were inside a lane ROI at a segment boundary, the later segment "
+              f"times them from its first frame: each may add one record above the ground truth")
+        if check["over_count_flagged"]:
+            print(f"WARNING: {check['over_count']} records above the ground truth, more than the boundary vehicles explain")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the traffic monitoring pipeline locally and report stage latencies")
+    parser.add_argument("--video", help="Video to process (default: a generated synthetic video)")
+    parser.add_argument("--detector", choices=("synthetic", "yolo"),
+                        help="Detector of the analyzer (default: synthetic for generated videos, yolo otherwise)")
+    parser.add_argument("--duration", type=int, default=60, help="Seconds of synthetic video")
+    parser.add_argument("--vehicles-per-minute", type=int, default=12, help="Synthetic traffic density, both lanes together")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic video")
+    parser.add_argument("--work-dir", help="Directory for blobs, database and temp files (default: a new temp directory, removed at the end)")
+    parser.add_argument("--json", help="Also write the results (with every app's metrics snapshot) to this file")
+    parser.add_argument("--batch-segments", type=int, default=1,
+                        help="Segments the analysis worker analyses together with one batched model (multistream)")
+    parser.add_argument("--trace-python-memory", action="store_true", help="Report how far the Python heap rose in every stage (tracemalloc, slower)")
+    args = parser.parse_args(argv)
+
+    detector = args.detector or ("yolo" if args.video else "synthetic")
+    if detector == "synthetic" and args.video:
+        parser.error("the synthetic detector only understands generated videos, use --detector yolo")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="traffic-pipeline-")
+    os.makedirs(work_dir, exist_ok=True)
+    if args.trace_python_memory:
+        tracemalloc.start()
+
+    pipeline = Pipeline(work_dir, detector, args.batch_segments)
+    try:
+        ground_truth = None
+        video_path = args.video
+        if video_path is None:
+            print(f"Rendering a {args.duration} s synthetic video ({args.vehicles_per_minute} vehicles/min)")
+            (video_path, ground_truth) = make_synthetic_video(work_dir, args.duration, args.vehicles_per_minute, args.seed)
+
+        results = run_pipeline(pipeline, video_path)
+        results["detector"] = detector
+        if ground_truth is not None:
+            from run_benchmarks import compare_with_ground_truth
+            results["ground_truth"] = check_boundary_over_count(compare_with_ground_truth(pipeline.ingested_records(), ground_truth),
+                                                                ground_truth, args.duration)
+
+        print_report(results)
+        if args.json:
+            results["metrics"] = pipeline.metrics_snapshots()
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=1, default=str)
+            print(f"\nResults written to {args.json}")
+    finally:
+        pipeline.close()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return 1 if results.get("ground_truth", {}).get("over_count_flagged") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
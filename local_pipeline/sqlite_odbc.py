@@ -0,0 +1,243 @@
+"""
+pyodbc-compatible stand-in backed by SQLite, for running the function apps without Azure SQL.
+
+Only the parts of the pyodbc API the apps use are provided: connect() with a connection string,
+connections and cursors as context managers, execute() with a parameter sequence or pyodbc-style
+positional parameters, executemany() (fast_executemany is accepted and ignored), fetchone /
+fetchmany / fetchall, description and rowcount.
+
+The T-SQL the apps send is translated where SQLite differs:
+    - table hints, e.g. WITH (UPDLOCK, SERIALIZABLE), are dropped (SQLite locks the whole database)
+    - OFFSET n ROWS FETCH NEXT m ROWS ONLY becomes LIMIT m OFFSET n
+    - FLOOR() is registered as a function
+
+The connection string is "Database=<path of the SQLite file>", create_schema() builds the tables of
+database/migrations in it and fails when a migration adds a table, column or index that
+SCHEMA_STATEMENTS does not mirror (see check_schema).
+"""
+import math
+import os
+import re
+import sqlite3
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "migrations")
+
+# Exception types the apps may catch
+Error = sqlite3.Error
+DatabaseError = sqlite3.DatabaseError
+
+# SQLite version of database/migrations, kept in step by check_schema. TimeEntered is never negative, so the CAST
+# truncation of TimeBucket equals the FLOOR of the SQL Server column (database/migrations/002, 300 s buckets)
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS VehicleData (
+        Id           INTEGER PRIMARY KEY AUTOINCREMENT,
+        vehicleId    INT      NOT NULL,
+        TimeEntered  FLOAT    NOT NULL,
+        speed        FLOAT    NOT NULL,
+        vehicletype  TEXT     NOT NULL,
+        lane         TEXT     NOT NULL,
+        speeding     TINYINT  NOT NULL,
+        TimeBucket   INT      GENERATED ALWAYS AS (CAST(TimeEntered / 300 AS INT)) STORED,
+        SourceVideo  TEXT     NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS IX_VehicleData_Lane_TimeBucket ON VehicleData (lane, TimeBucket, speed, speeding)",
+    "CREATE INDEX IF NOT EXISTS IX_VehicleData_Speeding ON VehicleData (speeding) WHERE speeding = 1",
+    "CREATE INDEX IF NOT EXISTS IX_VehicleData_SourceVideo ON VehicleData (SourceVideo, TimeBucket)",
+    "CREATE INDEX IF NOT EXISTS IX_VehicleData_TimeBucket_Lane ON VehicleData (TimeBucket, lane)",
+    """
+    CREATE TABLE IF NOT EXISTS VehicleLaneRollup (
+        lane            TEXT   NOT NULL,
+        time_bucket     INT    NOT NULL,
+        vehicle_count   INT    NOT NULL,
+        speed_sum       FLOAT  NOT NULL,
+        speeding_count  INT    NOT NULL,
+        PRIMARY KEY (lane, time_bucket)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS IngestionWatermark (
+        id       TINYINT  NOT NULL PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        version  BIGINT   NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO IngestionWatermark (id, version) VALUES (1, 0)",
+]
+
+TABLE_HINT = re.compile(r"\bWITH\s*\(\s*(?:UPDLOCK|SERIALIZABLE|HOLDLOCK|ROWLOCK|NOLOCK|READPAST|INDEX\s*\(\s*\w+\s*\))"
+                        r"(?:\s*,\s*(?:UPDLOCK|SERIALIZABLE|HOLDLOCK|ROWLOCK|NOLOCK|READPAST|INDEX\s*\(\s*\w+\s*\)))*\s*\)",
+                        re.IGNORECASE)
+OFFSET_FETCH = re.compile(r"\bOFFSET\s+(\d+)\s+ROWS\s+FETCH\s+(?:NEXT|FIRST)\s+(\?|\d+)\s+ROWS\s+ONLY\b", re.IGNORECASE)
+
+
+# Helper function to rewrite the T-SQL constructs SQLite does not understand
+def translate(sql: str) -> str:
+    sql = TABLE_HINT.sub("", sql)
+    return OFFSET_FETCH.sub(r"LIMIT \2 OFFSET \1", sql)
+
+
+# Helper function to get the database path out of a "Database=<path>" connection string
+def database_path(conn_str: str) -> str:
+    for part in conn_str.split(";"):
+        (key, _, value) = part.partition("=")
+        if key.strip().lower() == "database" and value.strip():
+            return value.strip()
+    raise ValueError(f"No Database=<path> in connection string: {conn_str}")
+
+
+def _open(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+    conn.create_function("FLOOR", 1, lambda value: None if value is None else math.floor(value), deterministic=True)
+    return conn
+
+
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._conn.cursor()
+        self.fast_executemany = False
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, sql, *params):
+        # pyodbc accepts both execute(sql, [a, b]) and execute(sql, a, b)
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self._cursor.execute(translate(sql), tuple(params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate(sql), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    # Like pyodbc, leaving the block commits unless it raised (or the connection is in autocommit)
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and not self.connection.autocommit:
+            self.connection.commit()
+        self.close()
+
+
+class Connection:
+    def __init__(self, path, autocommit=False):
+        self.autocommit = autocommit
+        self._conn = _open(path)
+        if autocommit:
+            self._conn.isolation_level = None
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        self.close()
+
+
+def connect(conn_str, autocommit=False, **kwargs):
+    return Connection(database_path(conn_str), autocommit=autocommit)
+
+
+# Create the tables of the migrations in a (new) SQLite database
+def create_schema(path: str) -> None:
+    conn = _open(path)
+    try:
+        for statement in SCHEMA_STATEMENTS:
+            conn.execute(statement)
+        conn.commit()
+        check_schema(conn)
+    finally:
+        conn.close()
+
+
+CREATE_TABLE = re.compile(r"\bCREATE\s+TABLE\s+(?:dbo\.)?(\w+)\s*\((.*?)\)\s*;", re.IGNORECASE | re.DOTALL)
+ADD_COLUMN = re.compile(r"\bALTER\s+TABLE\s+(?:dbo\.)?(\w+)\s+ADD\s+(\w+)", re.IGNORECASE)
+CREATE_INDEX = re.compile(r"\bCREATE\s+(?:UNIQUE\s+)?(?:NONCLUSTERED\s+|CLUSTERED\s+)?INDEX\s+(\w+)\s+ON\s+(?:dbo\.)?(\w+)\s*\(([^)]*)\)",
+                          re.IGNORECASE)
+
+
+# Helper function to read the tables (with their columns) and indexes (with their key columns) the
+# migrations create. Only the statements the migrations use are understood, see database/migrations
+def migration_schema(migrations_dir: str = MIGRATIONS_DIR) -> tuple[dict, dict]:
+    tables = {}
+    indexes = {}
+    for name in sorted(name for name in os.listdir(migrations_dir) if re.match(r"^\d+_.*\.sql$", name)):
+        with open(os.path.join(migrations_dir, name), encoding="utf-8") as f:
+            script = re.sub(r"--[^\n]*", "", f.read())
+
+        for (table, body) in CREATE_TABLE.findall(script):
+            # Column definitions only, the table constraints are not mirrored
+            definitions = [part.strip() for part in re.split(r",(?![^(]*\))", body) if part.strip()]
+            tables[table.lower()] = {definition.split()[0].lower() for definition in definitions
+                                     if not definition.upper().startswith("CONSTRAINT")}
+        for (table, column) in ADD_COLUMN.findall(script):
+            tables.setdefault(table.lower(), set()).add(column.lower())
+        for (index, table, columns) in CREATE_INDEX.findall(script):
+            indexes[index.lower()] = (table.lower(), [column.strip().split()[0].lower() for column in columns.split(",")])
+    return (tables, indexes)
+
+
+def check_schema(conn: sqlite3.Connection, migrations_dir: str = MIGRATIONS_DIR) -> None:
+    """
+    Compare the SQLite schema with the migrations: every table needs the same columns, every index
+    the same table and leading key columns (SQLite has no INCLUDE, the included columns may be keys).
+
+    Raises:
+        RuntimeError: When SCHEMA_STATEMENTS is out of date, with the differences
+    """
+    (tables, indexes) = migration_schema(migrations_dir)
+    problems = []
+
+    for (table, columns) in sorted(tables.items()):
+        sqlite_columns = {row[1].lower() for row in conn.execute(f"PRAGMA table_xinfo({table})")}
+        if not sqlite_columns:
+            problems.append(f"table {table} is missing")
+        elif sqlite_columns != columns:
+            problems.append(f"columns of {table} differ: migrations {sorted(columns)}, SQLite {sorted(sqlite_columns)}")
+
+    sqlite_indexes = {row[0].lower(): row[1].lower() for row in conn.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'")}
+    for (index, (table, keys)) in sorted(indexes.items()):
+        if sqlite_indexes.get(index) != table:
+            problems.append(f"index {index} on {table} is missing")
+            continue
+        sqlite_keys = [row[2].lower() for row in conn.execute(f"PRAGMA index_info({index})")]
+        if sqlite_keys[:len(keys)] != keys:
+            problems.append(f"keys of index {index} differ: migrations {keys}, SQLite {sqlite_keys}")
+
+    if problems:
+        raise RuntimeError("SCHEMA_STATEMENTS does not match database/migrations: " + "; ".join(problems))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+PIPELINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[0:0] = [PIPELINE_DIR, os.path.join(os.path.dirname(PIPELINE_DIR), "opencvanalyzerbloblocal")]
@@ -0,0 +1,31 @@
+from proccess2 import CLIP_SECONDS, ROI_LENGTH_M
+from run_pipeline import boundary_vehicles, check_boundary_over_count
+
+SPEED_KMH = 36.0
+CROSSING_S = ROI_LENGTH_M / (SPEED_KMH / 3.6)
+
+
+def vehicle(time_entered: float) -> dict:
+    return {"lane": "in", "vehicleType": "car", "speed": SPEED_KMH, "timeEntered": time_entered, "speeding": 0}
+
+
+GROUND_TRUTH = [
+    vehicle(10.0),
+    vehicle(CLIP_SECONDS - CROSSING_S / 2),  # inside the ROI at the first cut
+    vehicle(CLIP_SECONDS + 1.0),
+    vehicle(2 * CLIP_SECONDS - 0.1),  # inside the ROI at the second cut
+    vehicle(3 * CLIP_SECONDS - 0.1),  # after the end of the video
+]
+
+
+def test_boundary_vehicles_are_inside_a_roi_at_a_cut():
+    assert boundary_vehicles(GROUND_TRUTH, 3 * CLIP_SECONDS) == [GROUND_TRUTH[1], GROUND_TRUTH[3]]
+
+
+def test_over_count_is_flagged_beyond_the_boundary_vehicles():
+    def check(detected: int) -> dict:
+        return check_boundary_over_count({"expected": len(GROUND_TRUTH), "detected": detected}, GROUND_TRUTH, 3 * CLIP_SECONDS)
+
+    assert check(len(GROUND_TRUTH) - 1)["over_count"] == 0
+    assert not check(len(GROUND_TRUTH) + 2)["over_count_flagged"]
+    assert check(len(GROUND_TRUTH) + 3)["over_count_flagged"]
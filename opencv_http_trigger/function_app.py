@@ -1,14 +1,18 @@
+import json
 import logging
 import os
 import tempfile
 from azure.storage.blob import BlobServiceClient
 import azure.functions as func
 from proccess2 import analyse_clip
+from instrumentation import METRICS, PROFILER, export_metrics
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
+METRICS.set_app("opencv_http_trigger")
 
 
 @app.route(route="opecv_http_trigger")
+@PROFILER.profiled("opecv_http_trigger")
 def opecv_http_trigger(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request.')
 
@@ -34,7 +38,9 @@ def opecv_http_trigger(req: func.HttpRequest) -> func.HttpResponse:
 
         # Download the specified file
         blob_client = container_client.get_blob_client(filename)
-        video_bytes = blob_client.download_blob().readall()
+        with METRICS.timer("blob_download_seconds", container="output-segments"):
+            video_bytes = blob_client.download_blob().readall()
+        METRICS.inc("blob_download_bytes_total", len(video_bytes), container="output-segments")
 
         # Save to temp file
         temp_dir = tempfile.gettempdir()
@@ -49,19 +55,23 @@ def opecv_http_trigger(req: func.HttpRequest) -> func.HttpResponse:
         csv_output_path = os.path.join(temp_dir, csv_name)
 
         # Run your analysis
-        analyse_clip(video_path, csv_output_path, show_video=False)
+        with METRICS.timer("analyse_clip_seconds"):
+            analyse_clip(video_path, csv_output_path, show_video=False)
         logging.info(f"CSV generated: {csv_output_path}")
 
         # Upload result to Intermediate-results
         output_container = blob_service_client.get_container_client("Intermediate-results")
-        with open(csv_output_path, "rb") as data:
-            output_container.upload_blob(name=csv_name, data=data, overwrite=True)
+        with METRICS.timer("blob_upload_seconds", container="Intermediate-results"):
+            with open(csv_output_path, "rb") as data:
+                output_container.upload_blob(name=csv_name, data=data, overwrite=True)
+        METRICS.inc("blob_upload_bytes_total", os.path.getsize(csv_output_path), container="Intermediate-results")
         logging.info(f"CSV uploaded as: {csv_name}")
 
         return func.HttpResponse(f"Success: Processed and uploaded {csv_name}", status_code=200)
 
     except Exception as e:
         logging.error(f"Error: {e}")
+        METRICS.inc("invocation_errors_total", function="opecv_http_trigger")
         return func.HttpResponse(f"Error processing file: {str(e)}", status_code=500)
 
     finally:
@@ -70,4 +80,22 @@ def opecv_http_trigger(req: func.HttpRequest) -> func.HttpResponse:
             os.remove(video_path)
             os.remove(csv_output_path)
         except Exception as cleanup_err:
-            logging.warning(f"Cleanup failed: {cleanup_err}")
\ No newline at end of file
+            logging.warning(f"Cleanup failed: {cleanup_err}")
+
+
+# Metrics of this worker in Prometheus text format (?format=json for a JSON snapshot)
+@app.route(route="metrics", auth_level=func.AuthLevel.FUNCTION)
+def metrics(req: func.HttpRequest) -> func.HttpResponse:
+    (body, mimetype) = export_metrics(req.params.get("format", "prometheus"))
+    return func.HttpResponse(body, mimetype=mimetype)
+
+
+# Profiling status and summary of the last profiled request (?arm=N profiles the next N requests)
+@app.route(route="profile", auth_level=func.AuthLevel.FUNCTION)
+def profile(req: func.HttpRequest) -> func.HttpResponse:
+    if req.params.get("arm"):
+        try:
+            PROFILER.arm(int(req.params.get("arm")))
+        except ValueError:
+            return func.HttpResponse("'arm' must be a non-negative integer.", status_code=400)
+    return func.HttpResponse(json.dumps(PROFILER.status()), mimetype="application/json")
@@ -2,6 +2,8 @@ import cv2
 import pandas as pd
 from ultralytics import YOLO
 import os
+import time
+from instrumentation import METRICS
 
 def analyse_clip(video_path, csv_output_path, show_video=False):
     """
@@ -98,7 +100,9 @@ def analyse_clip(video_path, csv_output_path, show_video=False):
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     
     while True:
+        decode_started = time.perf_counter()
         ret, frame = cap.read()
+        METRICS.observe("analysis_decode_seconds", time.perf_counter() - decode_started, mode="clip")
         if not ret:
             break
         
@@ -106,7 +110,10 @@ def analyse_clip(video_path, csv_output_path, show_video=False):
         if frame_count % 100 == 0:
             print(f"Processing frame {frame_count}/{total_frames}")
 
+        inference_started = time.perf_counter()
         results = model.track(frame, persist=True, conf=0.5, verbose=False)
+        crossing_started = time.perf_counter()
+        METRICS.observe("analysis_inference_seconds", crossing_started - inference_started, mode="clip")
 
         if results[0].boxes is not None and results[0].boxes.id is not None:
             for box, cls_id_tensor, track_id_tensor in zip(results[0].boxes.xyxy, results[0].boxes.cls, results[0].boxes.id):
@@ -194,6 +201,9 @@ def analyse_clip(video_path, csv_output_path, show_video=False):
 
                 last_positions[track_id] = (cx, cy)
 
+        METRICS.observe("analysis_crossing_seconds", time.perf_counter() - crossing_started, mode="clip")
+        METRICS.inc("analysis_frames_total", mode="clip")
+
         # Draw ROIs and exit lines (only if showing video)
         if show_video:
             cv2.rectangle(frame, (roi_left[0], roi_left[1]), (roi_left[0] + roi_left[2], roi_left[1] + roi_left[3]), (0, 255, 255), 2)
@@ -0,0 +1,411 @@
+"""
+Reproducible throughput benchmarks of the analysis engine (proccess2 / multistream).
+
+Every scenario (resolution x traffic density) is rendered once as a deterministic synthetic video
+(see synthetic_video.py) and analysed in each mode:
+
+    clip          analyse_clip, as run by the blob trigger
+    checkpoint    analyse_clip with checkpoints to a local directory
+    live          analyse_stream on the file (frames are only dropped if the detector is slower than the video)
+    backpressure  analyse_stream with the detector slowed below the source frame rate, so processing
+                  falls behind and frames are dropped to stay within the latency budget
+    multistream   analyse_streams on several copies of the video with batched detection
+
+Each run happens in its own process so peak RSS is per run. Per run the results hold frames/s,
+per-stage latency percentiles (inference = tracker call, crossing = LaneCrossingCounter.update,
+decode = everything between two frames: read/decode, checkpoint writes, queue waits), peak RSS and
+the agreement of the vehicle counts and speeds with the ground truth.
+
+Usage (from opencvanalyzerbloblocal):
+    python benchmarks/run_benchmarks.py                               # full matrix -> benchmarks/results/<time>.json
+    python benchmarks/run_benchmarks.py --quick --modes clip live backpressure
+    python benchmarks/run_benchmarks.py --output new.json --compare benchmarks/results/baseline.json
+    python benchmarks/run_benchmarks.py --detector yolo               # real YOLOv8n (counts are not meaningful
+                                                                      # on synthetic boxes, throughput is)
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+# instrumentation is vendored into the app on deploy, import the shared copy
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(BENCHMARK_DIR)), "shared"))
+
+import cv2
+import numpy as np
+import proccess2
+from synthetic_video import ensure_video, make_scenario, scenario_name
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MODES = ("clip", "checkpoint", "live", "backpressure", "multistream")
+RESOLUTIONS = ((1280, 720), (1920, 1080))
+DENSITIES = (6, 30)  # vehicles per minute, both lanes together
+
+# --quick: one resolution, denser traffic so every scenario still has 10+ vehicles to compare
+QUICK_DURATION_S = 30
+QUICK_DENSITIES = (30, 60)
+
+# Scenarios with fewer ground truth vehicles give agreement figures that say little
+MIN_GROUND_TRUTH_VEHICLES = 10
+
+# Detector rate of the backpressure mode, as a fraction of the source frame rate
+BACKPRESSURE_DETECTOR_SPEED = 0.5
+
+CHECKPOINT_INTERVAL = 150
+MULTISTREAM_CAMERAS = 4
+
+# A record matches a ground truth vehicle of the same lane within this many seconds of timeEntered
+MATCH_TOLERANCE_S = 0.5
+
+# Relative frames/s drop reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.10
+
+
+class StageTimer:
+    """
+    Times the tracker calls and LaneCrossingCounter.update of the engine, the time between the end
+    of one frame's crossing logic and the next tracker call is counted as decode.
+    """
+
+    def __init__(self):
+        self.samples = {"decode": [], "inference": [], "crossing": []}
+        self._last_frame_end = None
+
+    def start_frame(self):
+        now = time.perf_counter()
+        if self._last_frame_end is not None:
+            self.samples["decode"].append(now - self._last_frame_end)
+        return now
+
+    def end_frame(self):
+        self._last_frame_end = time.perf_counter()
+
+    def wrap_tracker(self, tracker):
+        timer = self
+
+        class TimedTracker:
+            names = tracker.names
+
+            def __getattr__(self, name):
+                return getattr(tracker, name)
+
+            def track(self, frame):
+                started = timer.start_frame()
+                boxes = tracker.track(frame)
+                timer.samples["inference"].append(time.perf_counter() - started)
+                return boxes
+
+            def track_batch(self, camera_ids, frames):
+                started = timer.start_frame()
+                batch_boxes = tracker.track_batch(camera_ids, frames)
+                # Per frame cost of the batch
+                timer.samples["inference"].extend([(time.perf_counter() - started) / len(frames)] * len(frames))
+                return batch_boxes
+
+        return TimedTracker()
+
+    def patch_crossing(self):
+        timer = self
+        original_update = proccess2.LaneCrossingCounter.update
+
+        def timed_update(counter, boxes, frame_pos):
+            started = time.perf_counter()
+            new_records = original_update(counter, boxes, frame_pos)
+            timer.samples["crossing"].append(time.perf_counter() - started)
+            timer.end_frame()
+            return new_records
+
+        proccess2.LaneCrossingCounter.update = timed_update
+
+
+class ThrottledTracker:
+    """Makes every tracker call take at least min_call_s, a detector slower than the source."""
+
+    def __init__(self, tracker, min_call_s: float):
+        self.tracker = tracker
+        self.min_call_s = min_call_s
+        self.names = tracker.names
+
+    def __getattr__(self, name):
+        return getattr(self.tracker, name)
+
+    def track(self, frame):
+        started = time.perf_counter()
+        boxes = self.tracker.track(frame)
+        remaining = self.min_call_s - (time.perf_counter() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+        return boxes
+
+
+def percentiles_ms(samples: list) -> dict:
+    if not samples:
+        return {}
+    values = np.array(samples) * 1000.0
+    return {"count": len(samples), "mean": round(float(values.mean()), 3),
+            **{f"p{q}": round(float(np.percentile(values, q)), 3) for q in (50, 95, 99)},
+            "max": round(float(values.max()), 3)}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# Helper function to match analyzer records to the ground truth, greedily by lane and closest timeEntered
+def compare_with_ground_truth(records: list, ground_truth: list) -> dict:
+    matched = []
+    false_positives = 0
+    for lane in ("in", "out"):
+        expected = sorted((v for v in ground_truth if v["lane"] == lane), key=lambda v: v["timeEntered"])
+        used = set()
+        for record in sorted((r for r in records if r["lane"] == lane), key=lambda r: r["timeEntered"]):
+            candidates = [(abs(v["timeEntered"] - record["timeEntered"]), i) for i, v in enumerate(expected)
+                          if i not in used and abs(v["timeEntered"] - record["timeEntered"]) <= MATCH_TOLERANCE_S]
+            if not candidates:
+                false_positives += 1
+                continue
+            (_, i) = min(candidates)
+            used.add(i)
+            matched.append((expected[i], record))
+
+    speed_errors = [abs(record["speed"] - truth["speed"]) for (truth, record) in matched]
+    expected_count = len(ground_truth)
+    return {
+        "expected": expected_count,
+        "detected": len(records),
+        "matched": len(matched),
+        "missed": expected_count - len(matched),
+        "false_positives": false_positives,
+        "count_agreement_pct": round(100.0 * len(matched) / expected_count, 2) if expected_count else None,
+        "speed_mae_kmh": round(float(np.mean(speed_errors)), 2) if speed_errors else None,
+        "speed_max_error_kmh": round(float(np.max(speed_errors)), 2) if speed_errors else None,
+        "speed_mape_pct": round(float(np.mean([abs(r["speed"] - t["speed"]) / t["speed"] for (t, r) in matched])) * 100, 2)
+                          if matched else None,
+        "type_agreement_pct": round(100.0 * sum(t["vehicleType"] == r["vehicleType"] for (t, r) in matched) / len(matched), 2)
+                              if matched else None,
+        "speeding_agreement_pct": round(100.0 * sum(t["speeding"] == r["speeding"] for (t, r) in matched) / len(matched), 2)
+                                  if matched else None,
+    }
+
+
+def make_tracker(detector: str, batched: bool):
+    if detector == "yolo":
+        if batched:
+            from multistream import BatchedYoloTracker
+            return BatchedYoloTracker()
+        return proccess2.YoloTracker()
+
+    from synthetic_tracker import SyntheticBatchedTracker, SyntheticTracker
+    return SyntheticBatchedTracker() if batched else SyntheticTracker()
+
+
+# Runs one (scenario, mode) in the current process and returns its result dict
+def run_single(spec: dict) -> dict:
+    mode = spec["mode"]
+    video_path = spec["video_path"]
+    with open(spec["ground_truth_path"]) as f:
+        ground_truth = json.load(f)["ground_truth"]
+
+    timer = StageTimer()
+    timer.patch_crossing()
+    tracker = make_tracker(spec["detector"], batched=(mode == "multistream"))
+    if mode == "backpressure":
+        capture = cv2.VideoCapture(video_path)
+        source_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        capture.release()
+        tracker = ThrottledTracker(tracker, 1.0 / (source_fps * BACKPRESSURE_DETECTOR_SPEED))
+    tracker = timer.wrap_tracker(tracker)
+    work_dir = tempfile.mkdtemp(prefix="analyzer-bench-")
+    extra = {}
+    frames = 0
+    per_camera_records = {}
+
+    try:
+        # The engine prints progress, keep stdout for the result
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            started = time.perf_counter()
+
+            if mode in ("clip", "checkpoint"):
+                store = None
+                if mode == "checkpoint":
+                    from checkpoint import LocalCheckpointStore
+                    store = LocalCheckpointStore(os.path.join(work_dir, "checkpoints"))
+                df = proccess2.analyse_clip(video_path, os.path.join(work_dir, "out.csv"), tracker=tracker,
+                                            checkpoint_store=store, checkpoint_interval=CHECKPOINT_INTERVAL)
+                per_camera_records["cam0"] = df.to_dict("records")
+                frames = len(timer.samples["inference"])
+
+            elif mode in ("live", "backpressure"):
+                records = []
+                stats = proccess2.analyse_stream(video_path, on_record=lambda r: records.append(dict(zip(proccess2.COLUMNS, r))),
+                                                 latency_budget_s=spec["latency_budget_s"], tracker=tracker)
+                per_camera_records["cam0"] = records
+                frames = stats.frames_processed
+                extra = {"frames_read": stats.frames_read, "frames_dropped": stats.frames_dropped,
+                         "drop_pct": round(100.0 * stats.frames_dropped / stats.frames_read, 2) if stats.frames_read else None,
+                         "max_lag_s": round(stats.max_lag_s, 3), "max_emit_latency_s": round(stats.max_emit_latency_s, 3)}
+
+            elif mode == "multistream":
+                from multistream import MULTI_COLUMNS, CameraSource, analyse_streams
+                cameras = [CameraSource(f"cam{i}", video_path) for i in range(spec["cameras"])]
+                (records, stats) = analyse_streams(cameras, tracker=tracker)
+                for camera_id, camera_records in records.items():
+                    per_camera_records[camera_id] = [dict(zip(MULTI_COLUMNS, r)) for r in camera_records]
+                frames = sum(camera["frames_processed"] for camera in stats["cameras"].values())
+                extra = {"cameras": spec["cameras"], "avg_batch_size": stats["avg_batch_size"],
+                         "per_camera_fps": {camera_id: camera["processing_fps"] for camera_id, camera in stats["cameras"].items()}}
+
+            else:
+                raise ValueError(f"Unknown mode: {mode}")
+
+            elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Agreement summed over cameras (every camera sees the same video)
+    agreements = [compare_with_ground_truth(records, ground_truth) for records in per_camera_records.values()]
+    agreement = agreements[0] if len(agreements) == 1 else {
+        "cameras": len(agreements),
+        "min_count_agreement_pct": min(a["count_agreement_pct"] or 0 for a in agreements),
+        "max_speed_mae_kmh": max(a["speed_mae_kmh"] or 0 for a in agreements),
+        "per_camera": agreements,
+    }
+
+    return {
+        "scenario": spec["scenario_name"],
+        "mode": mode,
+        "detector": spec["detector"],
+        "frames": frames,
+        "elapsed_s": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else None,
+        "stages_ms": {stage: percentiles_ms(samples) for stage, samples in timer.samples.items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "agreement": agreement,
+        **extra,
+    }
+
+
+def run_in_subprocess(spec: dict) -> dict:
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", json.dumps(spec)],
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"scenario": spec["scenario_name"], "mode": spec["mode"], "detector": spec["detector"],
+                "error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def environment_info() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=BENCHMARK_DIR).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor(),
+            "cpu_count": os.cpu_count(), "opencv": cv2.__version__, "numpy": np.__version__, "git_commit": commit}
+
+
+def run_key(run: dict) -> tuple:
+    return (run["scenario"], run["mode"], run["detector"])
+
+
+# Helper function to print the frames/s change of every run against a baseline, returns the regressions
+def compare_results(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    baseline_runs = {run_key(run): run for run in baseline["runs"] if "fps" in run}
+    regressions = []
+    for run in results["runs"]:
+        previous = baseline_runs.get(run_key(run))
+        if previous is None or "fps" not in run:
+            continue
+        change = (run["fps"] - previous["fps"]) / previous["fps"] if previous["fps"] else 0.0
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(run_key(run))
+        print(f"{run['scenario']:<45} {run['mode']:<12} {previous['fps']:>9.1f} -> {run['fps']:>9.1f} fps ({change:+.1%}){flag}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the analysis engine on synthetic traffic videos.")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--detector", choices=("synthetic", "yolo"), default="synthetic")
+    parser.add_argument("--duration", type=int, default=60, help="Seconds of video per scenario")
+    parser.add_argument("--quick", action="store_true",
+                        help=f"{QUICK_DURATION_S} s videos at 1280x720 only, {' and '.join(map(str, QUICK_DENSITIES))} vehicles/min")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cameras", type=int, default=MULTISTREAM_CAMERAS, help="Streams of the multistream mode")
+    parser.add_argument("--latency-budget", type=float, default=2.0, help="Latency budget of the live and backpressure modes")
+    parser.add_argument("--video-dir", default=os.path.join(BENCHMARK_DIR, "videos"))
+    parser.add_argument("--output", help="Results JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Baseline results JSON to compare frames/s against")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_single(json.loads(args.worker))))
+        return 0
+
+    resolutions = RESOLUTIONS[:1] if args.quick else RESOLUTIONS
+    densities = QUICK_DENSITIES if args.quick else DENSITIES
+    duration = QUICK_DURATION_S if args.quick else args.duration
+
+    results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment_info(), "runs": []}
+    for (width, height) in resolutions:
+        for density in densities:
+            scenario = make_scenario(width, height, duration_s=duration, vehicles_per_minute=density, seed=args.seed)
+            (video_path, ground_truth) = ensure_video(scenario, args.video_dir)
+            print(f"{scenario_name(scenario)}: {len(ground_truth)} vehicles")
+            if len(ground_truth) < MIN_GROUND_TRUTH_VEHICLES:
+                print(f"  warning: fewer than {MIN_GROUND_TRUTH_VEHICLES} vehicles, use a longer --duration for meaningful agreement figures")
+
+            for mode in args.modes:
+                spec = {"mode": mode, "detector": args.detector, "scenario_name": scenario_name(scenario),
+                        "video_path": video_path, "ground_truth_path": os.path.splitext(video_path)[0] + ".json",
+                        "cameras": args.cameras, "latency_budget_s": args.latency_budget}
+                run = run_in_subprocess(spec)
+                run["scenario_config"] = scenario
+                results["runs"].append(run)
+
+                if "error" in run:
+                    print(f"  {mode:<12} failed: {run['error']}")
+                else:
+                    agreement = run["agreement"]
+                    count_pct = agreement.get("count_agreement_pct", agreement.get("min_count_agreement_pct"))
+                    dropped = f"  dropped {run['drop_pct']}% (max lag {run['max_lag_s']} s)" if "drop_pct" in run else ""
+                    print(f"  {mode:<12} {run['fps']:>9.1f} fps  inference p95 {run['stages_ms']['inference'].get('p95', 0):.2f} ms"
+                          f"  peak RSS {run['peak_rss_mb']} MB  count agreement {count_pct}%{dropped}")
+
+    output = args.output or os.path.join(BENCHMARK_DIR, "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f))
+        if regressions:
+            print(f"{len(regressions)} run(s) regressed by more than {REGRESSION_THRESHOLD:.0%}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Colour-based detector + centroid tracker for the synthetic benchmark videos.
+
+Implements the tracker interfaces of the analyzer (track / get_state / restore_state for
+analyse_clip and analyse_stream, track_batch for multistream) without a model, so the benchmarks
+measure the engine itself and the vehicle counts can be checked against the ground truth.
+"""
+import cv2
+import numpy as np
+
+# (class id, lower BGR, upper BGR) of the synthetic vehicle colours, with room for JPEG artefacts
+CLASS_COLOR_RANGES = [
+    (2, (0, 140, 0), (120, 255, 120)),     # car
+    (7, (150, 0, 0), (255, 140, 120)),     # truck
+]
+
+MIN_AREA = 400
+
+# Largest centroid move between two frames still matched to the same track
+MAX_MATCH_DISTANCE = 60
+
+# Frames a track survives without being matched
+MAX_TRACK_AGE = 10
+
+
+class SyntheticTracker:
+    names = {2: "car", 7: "truck"}
+
+    def __init__(self):
+        self.next_id = 1
+        self.tracks = {}  # track_id -> (cls_id, cx, cy, frames since last match)
+
+    def detect(self, frame) -> list:
+        detections = []
+        for (cls_id, lower, upper) in CLASS_COLOR_RANGES:
+            mask = cv2.inRange(frame, np.array(lower, dtype=np.uint8), np.array(upper, dtype=np.uint8))
+            (contours, _) = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            for contour in contours:
+                (x, y, w, h) = cv2.boundingRect(contour)
+                if w * h >= MIN_AREA:
+                    detections.append((x, y, x + w, y + h, cls_id, (x + w / 2, y + h / 2)))
+        return detections
+
+    def track(self, frame) -> list:
+        detections = self.detect(frame)
+        unmatched = dict(self.tracks)
+        boxes = []
+
+        # Greedy nearest-centroid matching, closest pairs first
+        pairs = sorted(
+            ((float(np.hypot(cx - t_cx, cy - t_cy)), i, track_id)
+             for i, (_, _, _, _, cls_id, (cx, cy)) in enumerate(detections)
+             for track_id, (t_cls, t_cx, t_cy, _) in unmatched.items() if t_cls == cls_id),
+            key=lambda pair: pair[0])
+        assigned = {}
+        for (distance, i, track_id) in pairs:
+            if distance > MAX_MATCH_DISTANCE:
+                break
+            if i not in assigned and track_id in unmatched:
+                assigned[i] = track_id
+                del unmatched[track_id]
+
+        tracks = {}
+        for i, (x1, y1, x2, y2, cls_id, (cx, cy)) in enumerate(detections):
+            track_id = assigned.get(i)
+            if track_id is None:
+                track_id = self.next_id
+                self.next_id += 1
+            tracks[track_id] = (cls_id, float(cx), float(cy), 0)
+            boxes.append((x1, y1, x2, y2, cls_id, track_id))
+
+        for track_id, (cls_id, cx, cy, age) in unmatched.items():
+            if age + 1 < MAX_TRACK_AGE:
+                tracks[track_id] = (cls_id, cx, cy, age + 1)
+
+        self.tracks = tracks
+        return boxes
+
+    def get_state(self) -> dict:
+        return {"next_id": self.next_id, "tracks": dict(self.tracks)}
+
+    def restore_state(self, state: dict, frame) -> None:
+        self.next_id = state["next_id"]
+        self.tracks = dict(state["tracks"])
+
+
+class SyntheticBatchedTracker:
+    """One SyntheticTracker per camera behind the track_batch interface of multistream."""
+
+    names = SyntheticTracker.names
+
+    def __init__(self):
+        self.trackers = {}
+
+    def track_batch(self, camera_ids, frames) -> list:
+        return [self.trackers.setdefault(camera_id, SyntheticTracker()).track(frame)
+                for camera_id, frame in zip(camera_ids, frames)]
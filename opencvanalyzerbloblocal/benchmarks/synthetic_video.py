@@ -0,0 +1,188 @@
+"""
+Deterministic synthetic traffic videos for the analyzer benchmarks.
+
+Cars (green) and trucks (blue) drive through the analyzer ROIs at known speeds: "out" vehicles go
+down through ROI_LEFT, "in" vehicles go up through ROI_RIGHT. Arrivals, speeds, types and the
+background texture all come from one seeded random generator, so the same scenario always gives
+the same video and the same ground truth.
+
+The pixel speed of a vehicle is chosen so that it needs exactly the time of its nominal speed to
+cover ROI_LENGTH_M between entering the ROI and crossing the exit line (half the ROI height).
+"""
+import json
+import math
+import os
+import random
+import cv2
+import numpy as np
+from proccess2 import CAR_LIMIT, ROI_LEFT, ROI_LENGTH_M, ROI_RIGHT, TRUCK_LIMIT
+
+# (B, G, R) fill colour and (width, height) of each vehicle type, see synthetic_tracker.py
+VEHICLE_STYLES = {
+    "car": {"color": (40, 200, 40), "size": (60, 44)},
+    "truck": {"color": (210, 70, 40), "size": (84, 96)},
+}
+
+# Nominal speed ranges in km/h
+SPEED_RANGES = {"car": (50.0, 135.0), "truck": (45.0, 105.0)}
+
+# Lane -> (ROI, direction of travel in y)
+LANES = {"out": (ROI_LEFT, 1), "in": (ROI_RIGHT, -1)}
+
+# Pixels driven before entering and after leaving the ROI
+APPROACH_PX = 120
+
+# Minimum bumper-to-bumper gap between two vehicles of the same lane
+MIN_GAP_PX = 24
+
+
+def scenario_name(scenario: dict) -> str:
+    return (f"synthetic_{scenario['width']}x{scenario['height']}_{scenario['vehicles_per_minute']}vpm"
+            f"_{scenario['duration_s']}s_seed{scenario['seed']}")
+
+
+def make_scenario(width=1280, height=720, fps=30, duration_s=60, vehicles_per_minute=12, truck_ratio=0.2, seed=0) -> dict:
+    if width < ROI_RIGHT[0] + ROI_RIGHT[2] or height < ROI_LEFT[1] + ROI_LEFT[3] + APPROACH_PX:
+        raise ValueError(f"{width}x{height} does not contain the analyzer ROIs")
+    return {"width": width, "height": height, "fps": fps, "duration_s": duration_s,
+            "vehicles_per_minute": vehicles_per_minute, "truck_ratio": truck_ratio, "seed": seed}
+
+
+# Helper function to get the y centre of a vehicle at a frame (frame positions start at 1, as in the analyzer)
+def vehicle_y(vehicle: dict, frame_pos: int) -> float:
+    return vehicle["start_y"] + vehicle["direction"] * (frame_pos - vehicle["spawn_frame"]) * vehicle["px_per_frame"]
+
+
+def _lane_path(roi: tuple, direction: int, height: int) -> tuple:
+    if direction > 0:
+        return (roi[1] - APPROACH_PX, min(height, roi[1] + roi[3] + APPROACH_PX))
+    return (roi[1] + roi[3] + APPROACH_PX, max(0, roi[1] - APPROACH_PX))
+
+
+# Helper function to check that a new vehicle never gets closer than MIN_GAP_PX to the one ahead of it.
+# Both move linearly, so checking the ends of the frames they share is enough
+def _keeps_gap(ahead: dict, vehicle: dict) -> bool:
+    first = vehicle["spawn_frame"]
+    last = min(ahead["end_frame"], vehicle["end_frame"])
+    if last < first:
+        return True
+    min_distance = (ahead["size"][1] + vehicle["size"][1]) / 2 + MIN_GAP_PX
+    return all(abs(vehicle_y(ahead, f) - vehicle_y(vehicle, f)) >= min_distance for f in (first, last))
+
+
+def plan_vehicles(scenario: dict) -> list:
+    rng = random.Random(scenario["seed"])
+    fps = scenario["fps"]
+    total_frames = int(scenario["duration_s"] * fps)
+    lane_rate = scenario["vehicles_per_minute"] / 60.0 / len(LANES)  # vehicles per second per lane
+
+    vehicles = []
+    for lane, (roi, direction) in LANES.items():
+        (start_y, end_y) = _lane_path(roi, direction, scenario["height"])
+        arrival_s = 0.0
+        ahead = None
+        while True:
+            arrival_s += rng.expovariate(lane_rate)
+            vehicle_type = "truck" if rng.random() < scenario["truck_ratio"] else "car"
+            speed = round(rng.uniform(*SPEED_RANGES[vehicle_type]), 1)
+            x_jitter = rng.uniform(-roi[2] / 4, roi[2] / 4)
+
+            # Frames from entering the ROI until crossing its middle line
+            crossing_frames = ROI_LENGTH_M / (speed / 3.6) * fps
+            px_per_frame = (roi[3] / 2) / crossing_frames
+
+            vehicle = {
+                "lane": lane, "vehicleType": vehicle_type, "speed": speed,
+                "direction": direction, "px_per_frame": px_per_frame, "start_y": start_y,
+                "center_x": roi[0] + roi[2] / 2 + x_jitter, "size": VEHICLE_STYLES[vehicle_type]["size"],
+                "spawn_frame": int(arrival_s * fps) + 1,
+            }
+            travel_frames = int(math.ceil(abs(end_y - start_y) / px_per_frame))
+
+            # Hold the vehicle back until it keeps its distance from the one ahead
+            while True:
+                vehicle["end_frame"] = vehicle["spawn_frame"] + travel_frames
+                if ahead is None or _keeps_gap(ahead, vehicle):
+                    break
+                vehicle["spawn_frame"] += 5
+            arrival_s = (vehicle["spawn_frame"] - 1) / fps
+
+            # Only vehicles that fully cross the exit line within the video are part of the ground truth
+            if vehicle["end_frame"] > total_frames:
+                break
+
+            entry_y = roi[1] if direction > 0 else roi[1] + roi[3]
+            entry_frame = vehicle["spawn_frame"] + math.ceil(abs(entry_y - start_y) / px_per_frame)
+            vehicle["timeEntered"] = round(entry_frame / fps, 2)
+            vehicle["speeding"] = int(speed > (CAR_LIMIT if vehicle_type == "car" else TRUCK_LIMIT))
+            vehicles.append(vehicle)
+            ahead = vehicle
+
+    vehicles.sort(key=lambda vehicle: vehicle["spawn_frame"])
+    return vehicles
+
+
+def _background(scenario: dict) -> np.ndarray:
+    rng = np.random.default_rng(scenario["seed"])
+    frame = np.full((scenario["height"], scenario["width"], 3), 78, dtype=np.int16)
+    frame += rng.normal(0, 8, size=frame.shape).astype(np.int16)
+    # Smooth road texture: some decode work per frame without bloating the MJPG files
+    frame = cv2.GaussianBlur(np.clip(frame, 0, 255).astype(np.uint8), (9, 9), 0)
+
+    # Lane dividers
+    for x in (ROI_LEFT[0] - 20, ROI_LEFT[0] + ROI_LEFT[2] + 20, ROI_RIGHT[0] - 20, ROI_RIGHT[0] + ROI_RIGHT[2] + 20):
+        for y in range(0, scenario["height"], 60):
+            cv2.line(frame, (x, y), (x, y + 30), (220, 220, 220), 3)
+    return frame
+
+
+def render_video(scenario: dict, vehicles: list, video_path: str) -> None:
+    fps = scenario["fps"]
+    total_frames = int(scenario["duration_s"] * fps)
+    background = _background(scenario)
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (scenario["width"], scenario["height"]))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open video writer for {video_path}")
+
+    try:
+        for frame_pos in range(1, total_frames + 1):
+            frame = background.copy()
+            for vehicle in vehicles:
+                if vehicle["spawn_frame"] <= frame_pos <= vehicle["end_frame"]:
+                    (w, h) = vehicle["size"]
+                    cx = int(round(vehicle["center_x"]))
+                    cy = int(round(vehicle_y(vehicle, frame_pos)))
+                    color = VEHICLE_STYLES[vehicle["vehicleType"]]["color"]
+                    cv2.rectangle(frame, (cx - w // 2, cy - h // 2), (cx + w // 2, cy + h // 2), color, -1)
+                    cv2.rectangle(frame, (cx - w // 2, cy - h // 2), (cx + w // 2, cy + h // 2), (20, 20, 20), 2)
+            writer.write(frame)
+    finally:
+        writer.release()
+
+
+def ensure_video(scenario: dict, video_dir: str) -> tuple[str, list]:
+    """
+    Generate (or reuse) the video and ground truth of a scenario.
+
+    The file name ends with _part1 so the analyzer's clip offset is zero.
+
+    Returns:
+        tuple: (video path, ground truth records as dicts with lane, vehicleType, speed, timeEntered, speeding)
+    """
+    os.makedirs(video_dir, exist_ok=True)
+    base = os.path.join(video_dir, scenario_name(scenario) + "_part1")
+    video_path = base + ".avi"
+    truth_path = base + ".json"
+
+    if os.path.exists(video_path) and os.path.exists(truth_path):
+        with open(truth_path) as f:
+            return (video_path, json.load(f)["ground_truth"])
+
+    vehicles = plan_vehicles(scenario)
+    render_video(scenario, vehicles, video_path)
+    ground_truth = [{key: vehicle[key] for key in ("lane", "vehicleType", "speed", "timeEntered", "speeding")}
+                    for vehicle in vehicles]
+    with open(truth_path, "w") as f:
+        json.dump({"scenario": scenario, "ground_truth": ground_truth}, f, indent=1)
+
+    return (video_path, ground_truth)
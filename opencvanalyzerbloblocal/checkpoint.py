@@ -0,0 +1,164 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from instrumentation import METRICS
+
+# Frames analysed between two checkpoints (0 disables checkpointing)
+ANALYSIS_CHECKPOINT_INTERVAL = int(os.getenv("ANALYSIS_CHECKPOINT_INTERVAL", "300"))
+
+# Checkpoints go to this blob container when set (survive a move to another host), else to a local directory
+ANALYSIS_CHECKPOINT_CONTAINER = os.getenv("ANALYSIS_CHECKPOINT_CONTAINER")
+ANALYSIS_CHECKPOINT_DIR = os.getenv("ANALYSIS_CHECKPOINT_DIR", os.path.join(tempfile.gettempdir(), "analysis-checkpoints"))
+
+# Bumped whenever the layout of the saved state changes, older checkpoints are then ignored
+CHECKPOINT_VERSION = 2
+
+# Bytes of the video hashed into the checkpoint key
+KEY_HASH_BYTES = 1024 * 1024
+
+
+class LocalCheckpointStore:
+    """Checkpoints as files in a local directory, written atomically."""
+
+    def __init__(self, directory: str = ANALYSIS_CHECKPOINT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def load(self, key: str):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, data: bytes) -> None:
+        # Write to a temporary file first so a crash never leaves a truncated checkpoint behind
+        temp_path = self._path(key) + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self._path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class BlobCheckpointStore:
+    """Checkpoints as block blobs in a storage container."""
+
+    def __init__(self, conn_str: str, container_name: str = ANALYSIS_CHECKPOINT_CONTAINER):
+        from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+        from azure.storage.blob import BlobServiceClient
+
+        self._not_found = ResourceNotFoundError
+        self.container_client = BlobServiceClient.from_connection_string(conn_str).get_container_client(container_name)
+        try:
+            self.container_client.create_container()
+        except ResourceExistsError:
+            pass
+
+    def load(self, key: str):
+        try:
+            return self.container_client.download_blob(key).readall()
+        except self._not_found:
+            return None
+
+    def save(self, key: str, data: bytes) -> None:
+        # A single put is atomic, readers see either the previous or the new checkpoint
+        self.container_client.upload_blob(name=key, data=data, overwrite=True)
+
+    def delete(self, key: str) -> None:
+        try:
+            self.container_client.delete_blob(key)
+        except self._not_found:
+            pass
+
+
+class CheckpointWriter:
+    """
+    Saves the checkpoints of one video on a background thread, so the analysis loop only pays for
+    serialising the state, not for the upload. Only the newest checkpoint is written: one submitted
+    while the previous upload still runs replaces any older one that is waiting.
+
+    A failed save is logged and skipped, the next checkpoint (or a restart from an older one) covers it.
+    """
+
+    def __init__(self, store, key: str):
+        self.store = store
+        self.key = key
+        self._lock = threading.Lock()
+        self._pending = None
+        self._thread = None
+
+    def submit(self, data: bytes) -> None:
+        with self._lock:
+            self._pending = data
+            if self._thread is None:
+                # The thread exits once nothing is pending, an abandoned writer leaves nothing running
+                self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+                self._thread.start()
+
+    def flush(self) -> None:
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                (data, self._pending) = (self._pending, None)
+                if data is None:
+                    self._thread = None
+                    return
+            try:
+                with METRICS.timer("analysis_checkpoint_write_seconds"):
+                    self.store.save(self.key, data)
+                METRICS.inc("analysis_checkpoint_bytes_total", len(data))
+            except Exception as e:
+                METRICS.inc("analysis_checkpoint_errors_total")
+                logging.warning(f"Checkpoint {self.key} not saved: {e}")
+
+
+# Helper function to build the checkpoint store configured through the environment
+def checkpoint_store_from_env():
+    if ANALYSIS_CHECKPOINT_CONTAINER:
+        return BlobCheckpointStore(os.getenv("AzureWebJobsStorage"), ANALYSIS_CHECKPOINT_CONTAINER)
+    return LocalCheckpointStore(ANALYSIS_CHECKPOINT_DIR)
+
+
+# Helper function to derive a checkpoint key that stays the same across retries of the same video
+# (name, size and a hash of the first MiB, the temp path itself changes between hosts)
+def checkpoint_key(video_path: str) -> str:
+    digest = hashlib.sha1()
+    with open(video_path, "rb") as f:
+        digest.update(f.read(KEY_HASH_BYTES))
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    return f"{name}-{os.path.getsize(video_path)}-{digest.hexdigest()[:16]}.ckpt"
+
+
+def dump_state(state: dict) -> bytes:
+    return pickle.dumps({"version": CHECKPOINT_VERSION, **state}, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+# Checkpoints are only ever written by this module to our own storage, so unpickling them is trusted
+def load_state(data: bytes):
+    if data is None:
+        return None
+    try:
+        state = pickle.loads(data)
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable checkpoint: {e}")
+        return None
+    if not isinstance(state, dict) or state.get("version") != CHECKPOINT_VERSION:
+        logging.warning("Ignoring checkpoint of another version")
+        return None
+    return state
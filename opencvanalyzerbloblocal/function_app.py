@@ -1,11 +1,49 @@
+import json
 import logging
+import math
 import os
 import tempfile
+import threading
+import urllib.parse
+import urllib.request
 from azure.storage.blob import BlobServiceClient
 import azure.functions as func
-from proccess2 import analyse_clip 
+import cv2
+import pandas as pd
+from proccess2 import COLUMNS, analyse_clip, clip_time_offset
+from checkpoint import ANALYSIS_CHECKPOINT_INTERVAL, checkpoint_key, checkpoint_store_from_env
+from instrumentation import METRICS, PROFILER, export_metrics
+from multistream import CameraSource, analyse_streams
+from scheduler import (ANALYSIS_MAX_CONCURRENCY, ANALYSIS_WAKE_QUEUE_NAME, get_job_queue, normalize_priority, run_batch_worker,
+                       run_worker)
+
+SEGMENTS_CONTAINER = "output-segments"
+CSV_CONTAINER = "output-csv"
+
+# Ingestion worker endpoint (intermediateWorker /api/process) called after every analysed segment, unset to skip
+INGESTION_URL = os.getenv("INGESTION_URL")
+INGESTION_CONTAINER = os.getenv("INGESTION_CONTAINER", "intermediate-results")
+INGESTION_TIMEOUT_S = 60
+
+# Segments a worker thread analyses together with one batched model (multistream), each holding a
+# concurrency slot. 1 analyses every segment on its own with analyse_clip (and checkpoints)
+ANALYSIS_BATCH_SEGMENTS = max(1, int(os.getenv("ANALYSIS_BATCH_SEGMENTS", "1")))
+
+# Workers are started by the wake messages of the job queue (queue trigger, runs on every instance the host scales
+# out to, extensions.queues in host.json sets how many per instance). The timer runs as a singleton on one
+# instance: it sweeps up jobs no wake message announces (lease of a crashed worker expired, local queue backend)
+# with enough threads to fill the concurrency slots
+ANALYSIS_WORKER_SCHEDULE = os.getenv("ANALYSIS_WORKER_SCHEDULE", "*/10 * * * * *")
+ANALYSIS_WORKER_THREADS = int(os.getenv("ANALYSIS_WORKER_THREADS", str(math.ceil(ANALYSIS_MAX_CONCURRENCY / ANALYSIS_BATCH_SEGMENTS))))
+
+# functionTimeout of host.json. A job is only leased when it is expected to end before the time budget,
+# which leaves a margin for the upload and the ingestion call
+FUNCTION_TIMEOUT_S = 600
+ANALYSIS_WORKER_TIME_BUDGET_S = float(os.getenv("ANALYSIS_WORKER_TIME_BUDGET_S", str(FUNCTION_TIMEOUT_S - 60)))
+ANALYSIS_JOB_EXPECTED_S = float(os.getenv("ANALYSIS_JOB_EXPECTED_S", "180"))
 
 app = func.FunctionApp()
+METRICS.set_app("opencvanalyzerbloblocal")
 
 @app.blob_trigger(arg_name="myblob", path="output-segments/{name}",
                                connection="auebprojectvideo_STORAGE") 
@@ -14,40 +52,233 @@ def open_cv_analyzer(myblob: func.InputStream):
                 f"Name: {myblob.name}"
                 f"Blob Size: {myblob.length} bytes")
 
-     # Save video blob to temporary file
-    temp_dir = tempfile.gettempdir()
-    video_path = os.path.join(temp_dir, myblob.name)
+    # The segment is only queued here, the analysis workers lease it with the global concurrency cap
+    blob_name = myblob.name.split("/", 1)[1] if myblob.name.startswith(SEGMENTS_CONTAINER + "/") else myblob.name
+    priority = normalize_priority((myblob.metadata or {}).get("priority"))
+    job_id = get_job_queue().enqueue(blob_name, priority)
+    logging.info(f"Queued analysis job {job_id} for {blob_name} ({priority})")
 
-    temp_path = os.path.join(os.getenv("TEMP", "/tmp"), myblob.name)
 
-    with open(temp_path, "wb") as f:
-        f.write(myblob.read())
+# Analysis worker: leases queued segments until the queue is empty, the cap is reached or the time budget is spent
+@app.queue_trigger(arg_name="msg", queue_name=ANALYSIS_WAKE_QUEUE_NAME, connection="AzureWebJobsStorage")
+@PROFILER.profiled("analysis_worker_wake")
+def analysis_worker_wake(msg: func.QueueMessage) -> None:
+    # Never raises: a retried wake message would only start another worker, the job itself is retried by the queue
+    try:
+        counts = drain_job_queue(1)
+    except Exception as e:
+        logging.error(f"Analysis worker failed: {e}")
+        return
+    logging.info(f"Analysis worker finished: {counts}")
 
-    logging.info(f"Video saved locally to: {temp_path}")
 
-    # Output CSV path
-    csv_name = os.path.splitext(myblob.name)[0] + ".csv"
+# Sweep of the jobs no wake message announces, see ANALYSIS_WORKER_SCHEDULE
+@app.timer_trigger(schedule=ANALYSIS_WORKER_SCHEDULE, arg_name="timer", run_on_startup=False, use_monitor=False)
+@PROFILER.profiled("analysis_worker")
+def analysis_worker(timer: func.TimerRequest) -> None:
+    counts = drain_job_queue(ANALYSIS_WORKER_THREADS)
+    logging.info(f"Analysis worker finished: {counts}, queue: {json.dumps(get_job_queue().stats())}")
+
+
+# Queue a segment that is already in storage, e.g. a live segment (?blob=<name>&priority=live)
+@app.route(route="jobs/enqueue", auth_level=func.AuthLevel.FUNCTION)
+def enqueue_job(req: func.HttpRequest) -> func.HttpResponse:
+    blob_name = req.params.get("blob")
+    if not blob_name:
+        return func.HttpResponse("Please pass a 'blob' name in the query string.", status_code=400)
+
+    priority = normalize_priority(req.params.get("priority"))
+    job_id = get_job_queue().enqueue(blob_name, priority)
+    return func.HttpResponse(json.dumps({"job_id": job_id, "blob": blob_name, "priority": priority}), mimetype="application/json")
+
+
+# Queue depth per priority, running jobs and job latencies, for autoscaling decisions
+@app.route(route="jobs/stats", auth_level=func.AuthLevel.FUNCTION)
+def job_stats(req: func.HttpRequest) -> func.HttpResponse:
+    return func.HttpResponse(json.dumps(get_job_queue().stats()), mimetype="application/json")
+
+
+# Metrics of this worker in Prometheus text format (?format=json for a JSON snapshot)
+@app.route(route="metrics", auth_level=func.AuthLevel.FUNCTION)
+def metrics(req: func.HttpRequest) -> func.HttpResponse:
+    (body, mimetype) = export_metrics(req.params.get("format", "prometheus"))
+    return func.HttpResponse(body, mimetype=mimetype)
+
+
+# Profiling status and summary of the last profiled invocation (?arm=N profiles the next N invocations)
+@app.route(route="profile", auth_level=func.AuthLevel.FUNCTION)
+def profile(req: func.HttpRequest) -> func.HttpResponse:
+    if req.params.get("arm"):
+        try:
+            PROFILER.arm(int(req.params.get("arm")))
+        except ValueError:
+            return func.HttpResponse("'arm' must be a non-negative integer.", status_code=400)
+    return func.HttpResponse(json.dumps(PROFILER.status()), mimetype="application/json")
+
+
+
+#=== HELPER FUNCTIONS ===
+
+# Helper function to run worker threads on the job queue until they find nothing to lease, returns the job outcomes
+def drain_job_queue(threads: int) -> dict:
+    job_queue = get_job_queue()
+    results = []
+
+    def work():
+        if ANALYSIS_BATCH_SEGMENTS > 1:
+            results.append(run_batch_worker(job_queue, run_analysis_batch, ANALYSIS_BATCH_SEGMENTS,
+                                            ANALYSIS_WORKER_TIME_BUDGET_S, expected_job_s=ANALYSIS_JOB_EXPECTED_S))
+        else:
+            results.append(run_worker(job_queue, run_analysis_job, ANALYSIS_WORKER_TIME_BUDGET_S,
+                                      expected_job_s=ANALYSIS_JOB_EXPECTED_S))
+
+    worker_threads = [threading.Thread(target=work, name=f"analysis-worker-{i}") for i in range(threads)]
+    for thread in worker_threads:
+        thread.start()
+    for thread in worker_threads:
+        thread.join()
+
+    return {outcome: sum(result[outcome] for result in results) for outcome in ("completed", "retried", "dead_lettered", "abandoned")}
+
+
+# Helper function to run one analysis job: download the segment, analyse it, upload the CSV and trigger ingestion
+def run_analysis_job(job) -> None:
+    temp_dir = tempfile.gettempdir()
+    temp_path = os.path.join(os.getenv("TEMP", "/tmp"), job.blob_name)
+    csv_name = os.path.splitext(job.blob_name)[0] + ".csv"
     csv_output_path = os.path.join(temp_dir, csv_name)
 
+    blob_service_client = BlobServiceClient.from_connection_string(os.getenv("AzureWebJobsStorage"))
+    segments_client = BlobServiceClient.from_connection_string(os.getenv("auebprojectvideo_STORAGE") or os.getenv("AzureWebJobsStorage"))
+
+    # Retries of this job resume from the last checkpoint instead of frame zero
+    checkpoint_store = checkpoint_store_from_env() if ANALYSIS_CHECKPOINT_INTERVAL > 0 else None
+
     try:
-        analyse_clip(temp_path, csv_output_path, show_video=False)
+        download_segment(segments_client, job.blob_name, temp_path)
+
+        with METRICS.timer("analyse_clip_seconds"):
+            analyse_clip(temp_path, csv_output_path, show_video=False, checkpoint_store=checkpoint_store)
         logging.info(f"CSV generated: {csv_output_path}")
 
-        # Upload CSV to output-csv container
-        conn_str = os.getenv("AzureWebJobsStorage")
-        blob_service_client = BlobServiceClient.from_connection_string(conn_str)
-        container_client = blob_service_client.get_container_client("output-csv")
-        with open(csv_output_path, "rb") as data:
-            container_client.upload_blob(name=csv_name, data=data, overwrite=True)
+        publish_results(job, blob_service_client, csv_name, csv_output_path)
 
-        logging.info(f"CSV uploaded to 'output-csv' container as '{csv_name}'")
+        if checkpoint_store:
+            checkpoint_store.delete(checkpoint_key(temp_path))
 
-    except Exception as e:
-        logging.error(f"Error during analysis or upload: {e}")
+    except Exception:
+        METRICS.inc("invocation_errors_total", function="analysis_worker")
+        # Failing the job makes the queue retry it later (resuming from the checkpoint)
+        raise
     finally:
         # Clean up temp files
-        try:
-            os.remove(temp_path)
-            os.remove(csv_output_path)
-        except Exception as cleanup_err:
-            logging.warning(f"Cleanup failed: {cleanup_err}")
\ No newline at end of file
+        for path in (temp_path, csv_output_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as cleanup_err:
+                logging.warning(f"Cleanup failed: {cleanup_err}")
+
+
+# Helper function to run a batch of analysis jobs as the cameras of one multi-stream analysis (one model,
+# batched detection), returns {job_id: exception or None}. A segment that cannot be downloaded or opened
+# only fails its own job. There are no checkpoints, a retried job is analysed from frame zero.
+def run_analysis_batch(jobs) -> dict:
+    temp_dir = tempfile.gettempdir()
+    blob_service_client = BlobServiceClient.from_connection_string(os.getenv("AzureWebJobsStorage"))
+    segments_client = BlobServiceClient.from_connection_string(os.getenv("auebprojectvideo_STORAGE") or os.getenv("AzureWebJobsStorage"))
+
+    errors = {}
+    cameras = []
+    temp_paths = []
+    try:
+        for job in jobs:
+            temp_path = os.path.join(os.getenv("TEMP", "/tmp"), job.blob_name)
+            temp_paths.append(temp_path)
+            try:
+                download_segment(segments_client, job.blob_name, temp_path)
+                capture = cv2.VideoCapture(temp_path)
+                opened = capture.isOpened()
+                capture.release()
+                if not opened:
+                    raise ValueError(f"Could not open video file: {temp_path}")
+            except Exception as e:
+                errors[job.job_id] = e
+                continue
+            cameras.append(CameraSource(job.job_id, temp_path, time_offset=clip_time_offset(temp_path)))
+
+        if cameras:
+            with METRICS.timer("analyse_streams_seconds"):
+                (records, stats) = analyse_streams(cameras)
+            logging.info(f"Analysed {len(cameras)} segments together: {json.dumps(stats)}")
+
+        for job in jobs:
+            if job.job_id in errors:
+                continue
+            csv_name = os.path.splitext(job.blob_name)[0] + ".csv"
+            csv_output_path = os.path.join(temp_dir, csv_name)
+            temp_paths.append(csv_output_path)
+            try:
+                # Same CSV as analyse_clip writes, without the cameraId column
+                pd.DataFrame([record[1:] for record in records[job.job_id]], columns=COLUMNS).to_csv(csv_output_path, index=False)
+                publish_results(job, blob_service_client, csv_name, csv_output_path)
+                errors[job.job_id] = None
+            except Exception as e:
+                errors[job.job_id] = e
+
+    except Exception as e:
+        for job in jobs:
+            errors.setdefault(job.job_id, e)
+    finally:
+        for path in temp_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as cleanup_err:
+                logging.warning(f"Cleanup failed: {cleanup_err}")
+
+    failed = sum(1 for error in errors.values() if error is not None)
+    if failed:
+        METRICS.inc("invocation_errors_total", failed, function="analysis_worker")
+    return errors
+
+
+# Helper function to download a segment to a local file
+def download_segment(segments_client, blob_name: str, temp_path: str) -> None:
+    with METRICS.timer("blob_download_seconds", container=SEGMENTS_CONTAINER):
+        with open(temp_path, "wb") as f:
+            f.write(segments_client.get_blob_client(container=SEGMENTS_CONTAINER, blob=blob_name).download_blob().readall())
+    METRICS.inc("blob_download_bytes_total", os.path.getsize(temp_path), container=SEGMENTS_CONTAINER)
+    logging.info(f"Video saved locally to: {temp_path}")
+
+
+# Helper function to upload the CSV of a job to the output-csv container and trigger its ingestion
+def publish_results(job, blob_service_client, csv_name: str, csv_output_path: str) -> None:
+    # A job whose lease expired runs on another worker now, only one of both may publish the results
+    job.ensure_leased()
+
+    # Upload CSV to output-csv container
+    container_client = blob_service_client.get_container_client(CSV_CONTAINER)
+    with METRICS.timer("blob_upload_seconds", container=CSV_CONTAINER):
+        with open(csv_output_path, "rb") as data:
+            container_client.upload_blob(name=csv_name, data=data, overwrite=True)
+    METRICS.inc("blob_upload_bytes_total", os.path.getsize(csv_output_path), container=CSV_CONTAINER)
+    logging.info(f"CSV uploaded to '{CSV_CONTAINER}' container as '{csv_name}'")
+
+    if INGESTION_URL:
+        job.ensure_leased()
+        trigger_ingestion(blob_service_client, csv_name, csv_output_path)
+
+
+# Helper function to hand a finished CSV to the ingestion worker (intermediateWorker reads it from its own container)
+def trigger_ingestion(blob_service_client, csv_name: str, csv_path: str) -> None:
+    with open(csv_path, "rb") as data:
+        blob_service_client.get_container_client(INGESTION_CONTAINER).upload_blob(name=csv_name, data=data, overwrite=True)
+
+    url = f"{INGESTION_URL}{'&' if '?' in INGESTION_URL else '?'}{urllib.parse.urlencode({'filename': csv_name})}"
+    with METRICS.timer("ingestion_trigger_seconds"):
+        # Non-2xx answers raise HTTPError, the job then fails and is retried
+        with urllib.request.urlopen(url, timeout=INGESTION_TIMEOUT_S) as response:
+            logging.info(f"Ingestion of {csv_name}: {response.read().decode('utf-8', errors='replace')}")
@@ -0,0 +1,93 @@
+import argparse
+import csv
+import json
+import sys
+import threading
+import time
+from alert_dispatcher import get_alert_dispatcher
+from proccess2 import COLUMNS, analyse_stream, LiveStats
+
+# Command line runner of the live mode, e.g.
+#   python live_monitor.py rtsp://camera/stream --csv live.csv --alert-url https://<alert-logger>/api/alert/list
+#   python live_monitor.py recording.mp4 --follow      (file that is still being written)
+
+# Seconds spent on exit delivering the alerts still queued, the rest is spooled and sent by the next run
+ALERT_SHUTDOWN_TIMEOUT_S = 15.0
+
+
+# Helper function to get the list endpoint of the alert logger, the single-alert endpoint is accepted for compatibility
+def alert_list_url(alert_url: str) -> str:
+    return alert_url.rstrip("/") + "/list" if alert_url.rstrip("/").endswith("/api/alert") else alert_url
+
+
+# Helper function to build the alert of a record, the same fields the ingestion worker sends
+def record_alert(record) -> dict:
+    return {"vehicleId": record[0], "timeEntered": record[1], "speed": record[2], "vehicleType": record[3]}
+
+
+# Helper function to print the lag and drop counters every few seconds
+def start_stats_reporter(stats: LiveStats, interval_s: float, stop_event: threading.Event) -> None:
+    def report_loop():
+        while not stop_event.wait(interval_s):
+            print(f"Stats: {json.dumps(stats.as_dict())}", file=sys.stderr)
+
+    threading.Thread(target=report_loop, name="stats-reporter", daemon=True).start()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Analyse a live video stream and emit vehicle records as they happen.")
+    parser.add_argument("source", help="RTSP/HTTP URL, named pipe or (growing) video file")
+    parser.add_argument("--csv", help="Append the records to this CSV file (default: print them as JSON lines)")
+    parser.add_argument("--alert-url", help="Post speeding alerts to this alert logger endpoint (/api/alert/list)")
+    parser.add_argument("--latency-budget", type=float, default=2.0, help="Seconds of lag before frames are dropped")
+    parser.add_argument("--stride", type=int, default=1, help="Only analyse every n-th frame")
+    parser.add_argument("--follow", action="store_true", help="Keep reading a file that is still being written")
+    parser.add_argument("--idle-timeout", type=float, default=10.0, help="Stop following after this many idle seconds")
+    parser.add_argument("--stats-interval", type=float, default=10.0, help="Seconds between stats reports")
+    args = parser.parse_args(argv)
+
+    csv_file = None
+    csv_writer = None
+    if args.csv:
+        csv_file = open(args.csv, "a", newline="")
+        csv_writer = csv.writer(csv_file)
+        if csv_file.tell() == 0:
+            csv_writer.writerow(COLUMNS)
+
+    def on_record(record):
+        if csv_writer:
+            csv_writer.writerow(record)
+            csv_file.flush()
+        else:
+            print(json.dumps(dict(zip(COLUMNS, record))), flush=True)
+
+    # Alerts are batched and retried in the background by the same dispatcher as the ingestion worker uses
+    alerts = get_alert_dispatcher(alert_list_url(args.alert_url)) if args.alert_url else None
+
+    def on_alert(record):
+        alerts.enqueue([record_alert(record)])
+
+    stats = LiveStats()
+    stop_event = threading.Event()
+    start_stats_reporter(stats, args.stats_interval, stop_event)
+
+    started = time.monotonic()
+    try:
+        analyse_stream(args.source, on_record=on_record, on_alert=on_alert if alerts else None,
+                       latency_budget_s=args.latency_budget, frame_stride=max(1, args.stride), follow=args.follow,
+                       idle_timeout_s=args.idle_timeout, stop_event=stop_event, stats=stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        if csv_file:
+            csv_file.close()
+        if alerts and not alerts.flush_or_spool(ALERT_SHUTDOWN_TIMEOUT_S):
+            print(f"Undelivered alerts spooled to {alerts.spool_dir}, the next run sends them", file=sys.stderr)
+
+    print(f"Finished after {time.monotonic() - started:.1f}s: {json.dumps(stats.as_dict())}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
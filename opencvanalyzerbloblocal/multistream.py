@@ -0,0 +1,274 @@
+import os
+import queue
+import threading
+import time
+import cv2
+import pandas as pd
+from instrumentation import METRICS
+from proccess2 import COLUMNS, ROI_LEFT, ROI_RIGHT, LaneCrossingCounter
+
+# Output columns of the multi-camera records
+MULTI_COLUMNS = ['cameraId'] + COLUMNS
+
+# Frames decoded ahead per camera, bounds memory when inference is the bottleneck
+DECODE_QUEUE_SIZE = 4
+
+# Largest number of frames sent to the detector in one call
+MAX_BATCH_SIZE = 16
+
+
+class CameraSource:
+    """
+    One camera (or segment) of a multi-stream run, with its own ROI geometry.
+
+    Args:
+        camera_id (str): Id written to the cameraId column of the records
+        source (str): Video file, RTSP/HTTP URL or named pipe
+        roi_left (tuple): (x, y, width, height) of the "out" lane ROI
+        roi_right (tuple): (x, y, width, height) of the "in" lane ROI
+        time_offset (float): Seconds added to every timeEntered
+    """
+
+    def __init__(self, camera_id, source, roi_left=ROI_LEFT, roi_right=ROI_RIGHT, time_offset=0.0):
+        self.camera_id = camera_id
+        self.source = source
+        self.roi_left = roi_left
+        self.roi_right = roi_right
+        self.time_offset = time_offset
+
+
+class BatchedYoloTracker:
+    """
+    One YOLOv8 model shared by all cameras: the frames of a tick go through a single batched
+    predict call, then each camera's detections update that camera's own tracker.
+
+    Mirrors YOLO.track (same tracker config, tracker frame rate and box/id/class layout) so a camera
+    gets the same tracks as when it is analysed alone. Ultralytics numbers tracks with one global
+    counter, so each camera's counter is swapped in around its tracker update: track ids start at 1
+    per camera like in a standalone run, and only (cameraId, track id) is unique across cameras.
+
+    Args:
+        weights (str): YOLO weights file
+        conf (float): Minimum detection confidence
+        tracker_cfg (str): Ultralytics tracker config (botsort.yaml or bytetrack.yaml)
+    """
+
+    def __init__(self, weights='yolov8n.pt', conf=0.5, tracker_cfg='botsort.yaml'):
+        # Imported here so analyse_streams runs without ultralytics when given another tracker
+        import yaml
+        from ultralytics import YOLO
+        from ultralytics.trackers.basetrack import BaseTrack
+        from ultralytics.trackers.track import TRACKER_MAP
+        from ultralytics.utils import IterableSimpleNamespace
+        from ultralytics.utils.checks import check_yaml
+
+        self._base_track = BaseTrack
+        self._tracker_map = TRACKER_MAP
+        self.model = YOLO(weights)
+        self.conf = conf
+        self.names = self.model.names
+        with open(check_yaml(tracker_cfg), errors="ignore") as f:
+            self.tracker_args = IterableSimpleNamespace(**yaml.safe_load(f))
+        self.trackers = {}
+        self.track_counts = {}
+
+    def _tracker(self, camera_id):
+        if camera_id not in self.trackers:
+            self.trackers[camera_id] = self._tracker_map[self.tracker_args.tracker_type](args=self.tracker_args, frame_rate=30)
+        return self.trackers[camera_id]
+
+    def track_batch(self, camera_ids, frames):
+        """
+        Returns:
+            list: For each frame, its (x1, y1, x2, y2, cls_id, track_id) tuples
+        """
+        results = self.model.predict(frames, conf=self.conf, verbose=False)
+
+        batch_boxes = []
+        for camera_id, frame, result in zip(camera_ids, frames, results):
+            detections = result.boxes.cpu().numpy()
+            tracks = []
+            if len(detections):
+                self._base_track._count = self.track_counts.get(camera_id, 0)
+                tracks = self._tracker(camera_id).update(detections, frame)
+                self.track_counts[camera_id] = self._base_track._count
+
+            # Track rows: x1, y1, x2, y2, track_id, score, cls, detection index
+            batch_boxes.append([(int(track[0]), int(track[1]), int(track[2]), int(track[3]), int(track[6]), int(track[4]))
+                                for track in tracks])
+        return batch_boxes
+
+
+class _FrameReader(threading.Thread):
+    """Decodes one camera in the background (OpenCV releases the GIL while decoding)."""
+
+    def __init__(self, camera):
+        super().__init__(name=f"decode-{camera.camera_id}", daemon=True)
+        self.camera = camera
+        self.frames = queue.Queue(maxsize=DECODE_QUEUE_SIZE)
+        self.stop_event = threading.Event()
+        self.cap = cv2.VideoCapture(camera.source)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise ValueError(f"Could not open source of camera {camera.camera_id}: {camera.source}")
+
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if not self.fps or self.fps != self.fps or self.fps > 1000:
+            self.fps = 30.0
+
+    def run(self):
+        frame_pos = 0
+        try:
+            while not self.stop_event.is_set():
+                with METRICS.timer("analysis_decode_seconds", mode="multistream"):
+                    ret, frame = self.cap.read()
+                if not ret:
+                    break
+                frame_pos += 1
+                self.frames.put((frame_pos, frame))
+        finally:
+            self.cap.release()
+            self.frames.put(None)
+
+
+class CameraStats:
+    """Per-camera throughput counters of a multi-stream run."""
+
+    def __init__(self, fps):
+        self.source_fps = fps
+        self.frames_processed = 0
+        self.records_emitted = 0
+        self.decode_wait_s = 0.0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def as_dict(self):
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return {
+            "source_fps": self.source_fps,
+            "frames_processed": self.frames_processed,
+            "records_emitted": self.records_emitted,
+            "decode_wait_s": round(self.decode_wait_s, 3),
+            "elapsed_s": round(elapsed, 3),
+            "processing_fps": round(self.frames_processed / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+def analyse_streams(cameras, on_record=None, max_batch_size=MAX_BATCH_SIZE, max_frames=None, stop_event=None, tracker=None):
+    """
+    Analyse several cameras at once with a single model.
+
+    Every camera is decoded by its own reader thread. Each tick takes the next frame of every camera
+    that still has frames and runs them through one batched detector call. Tracking, ROI geometry
+    and lane state stay separate per camera.
+
+    Args:
+        cameras (list): CameraSource of every stream
+        on_record (callable): Called with every new record ([cameraId, vehicleId, timeEntered, speed, vehicleType, lane, speeding])
+        max_batch_size (int): Largest number of frames per detector call
+        max_frames (int): Stop every camera after this many frames (default: until its source ends)
+        stop_event (threading.Event): Set it to stop the analysis from another thread
+        tracker: Batched detector + tracker with a track_batch(camera_ids, frames) method (default: a new BatchedYoloTracker)
+
+    Returns:
+        tuple: (records per camera id, stats dict with per-camera throughput and batch counters)
+    """
+    if len({camera.camera_id for camera in cameras}) != len(cameras):
+        raise ValueError("Camera ids must be unique")
+
+    if tracker is None:
+        tracker = BatchedYoloTracker()
+
+    readers = {}
+    try:
+        for camera in cameras:
+            readers[camera.camera_id] = _FrameReader(camera)
+    except Exception:
+        # The readers opened so far never started, their captures are not released by run()
+        for reader in readers.values():
+            reader.cap.release()
+        raise
+
+    counters = {camera.camera_id: LaneCrossingCounter(readers[camera.camera_id].fps, camera.time_offset,
+                                                      camera.roi_left, camera.roi_right) for camera in cameras}
+    camera_stats = {camera_id: CameraStats(reader.fps) for camera_id, reader in readers.items()}
+    batches = 0
+    batched_frames = 0
+    inference_s = 0.0
+    started = time.monotonic()
+
+    for reader in readers.values():
+        reader.start()
+
+    active = list(readers)
+    try:
+        while active and (stop_event is None or not stop_event.is_set()):
+            tick = []
+            for camera_id in list(active):
+                wait_start = time.monotonic()
+                item = readers[camera_id].frames.get()
+                camera_stats[camera_id].decode_wait_s += time.monotonic() - wait_start
+
+                if item is None or (max_frames is not None and item[0] > max_frames):
+                    active.remove(camera_id)
+                    camera_stats[camera_id].finished_at = time.monotonic()
+                    readers[camera_id].stop_event.set()
+                    continue
+                tick.append((camera_id, item[0], item[1]))
+
+            for start in range(0, len(tick), max_batch_size):
+                chunk = tick[start:start + max_batch_size]
+                inference_start = time.monotonic()
+                batch_boxes = tracker.track_batch([camera_id for (camera_id, _, _) in chunk], [frame for (_, _, frame) in chunk])
+                inference_s += time.monotonic() - inference_start
+                METRICS.observe("analysis_inference_seconds", time.monotonic() - inference_start, mode="multistream")
+                METRICS.inc("analysis_frames_total", len(chunk), mode="multistream")
+                batches += 1
+                batched_frames += len(chunk)
+
+                for (camera_id, frame_pos, _), boxes in zip(chunk, batch_boxes):
+                    with METRICS.timer("analysis_crossing_seconds", mode="multistream"):
+                        new_records = counters[camera_id].update(boxes, frame_pos)
+                    camera_stats[camera_id].frames_processed += 1
+                    camera_stats[camera_id].records_emitted += len(new_records)
+                    if on_record is not None:
+                        for record in new_records:
+                            on_record([camera_id] + record)
+    finally:
+        for reader in readers.values():
+            reader.stop_event.set()
+            # Unblock a reader waiting on a full queue so it can exit
+            while reader.is_alive():
+                try:
+                    reader.frames.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    records = {camera_id: [[camera_id] + record for record in counter.vehicle_data] for camera_id, counter in counters.items()}
+    stats = {
+        "cameras": {camera_id: camera_stat.as_dict() for camera_id, camera_stat in camera_stats.items()},
+        "batches": batches,
+        "avg_batch_size": round(batched_frames / batches, 2) if batches else 0.0,
+        "inference_s": round(inference_s, 3),
+        "elapsed_s": round(time.monotonic() - started, 3),
+    }
+    return (records, stats)
+
+
+def analyse_clips(cameras, output_dir, **kwargs):
+    """
+    Analyse several clips at once and write one CSV per camera (<output_dir>/<cameraId>.csv).
+
+    Returns:
+        tuple: (CSV path per camera id, stats dict of analyse_streams)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    (records, stats) = analyse_streams(cameras, **kwargs)
+
+    csv_paths = {}
+    for camera_id, camera_records in records.items():
+        csv_paths[camera_id] = os.path.join(output_dir, f"{camera_id}.csv")
+        pd.DataFrame(camera_records, columns=MULTI_COLUMNS).to_csv(csv_paths[camera_id], index=False)
+        print(f"Camera {camera_id}: {len(camera_records)} vehicles, {stats['cameras'][camera_id]['processing_fps']} frames/s")
+
+    return (csv_paths, stats)
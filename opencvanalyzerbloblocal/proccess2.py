@@ -1,214 +1,414 @@
 import cv2
 import pandas as pd
-from ultralytics import YOLO
 import os
 import re
+import time
+from checkpoint import ANALYSIS_CHECKPOINT_INTERVAL, CheckpointWriter, checkpoint_key, dump_state, load_state
+from instrumentation import METRICS
 
-def analyse_clip(video_path, csv_output_path, show_video=False):
+# Define ROIs (x, y, width, height)
+ROI_LEFT = (150, 400, 400, 140)
+ROI_RIGHT = (730, 400, 400, 140)
+
+# Real ROI length in meters
+ROI_LENGTH_M = 10.0
+
+# Maximum allowed speed to dismiss vehicles (e.g., glitch)
+MAX_SPEED_THRESHOLD_CAR = 300.0
+MAX_SPEED_THRESHOLD_TRUCK = 200.0
+
+# Speed limits
+CAR_LIMIT = 90.0
+TRUCK_LIMIT = 80.0
+
+# Alerts are raised above this speed, whatever the vehicle type. Same rule (and variable) as the
+# ingestion worker (intermediateWorker), so live and batch analysis alert on the same vehicles
+ALERT_SPEED_KMH = float(os.getenv("ALERT_SPEED_KMH", "130"))
+
+# Minimum time in frames to consider a valid crossing
+MIN_TIME_FRAMES = 5
+
+# Length of the segments cut by the VideoSegmenter, used for the relative time of each clip
+CLIP_SECONDS = 120
+
+# Output columns
+COLUMNS = ['vehicleId', 'timeEntered', 'speed', 'vehicleType', 'lane', 'speeding']
+
+# Bumped whenever the saved tracker fields change. Checkpoints of another version (or of another
+# ultralytics release, whose track objects may differ) are ignored and the clip restarts from frame zero
+TRACKER_STATE_VERSION = 1
+
+# Track lists of an ultralytics BYTETracker / BOTSORT that are saved in a checkpoint
+TRACK_LISTS = ("tracked_stracks", "lost_stracks", "removed_stracks")
+
+
+class YoloTracker:
+    """
+    YOLOv8 detector + tracker returning one (x1, y1, x2, y2, cls_id, track_id) tuple per tracked box.
+
+    Args:
+        weights (str): YOLO weights file
+        conf (float): Minimum detection confidence
+    """
+
+    def __init__(self, weights='yolov8n.pt', conf=0.5):
+        # Imported here so the engine (and the synthetic trackers of the benchmarks) runs without ultralytics
+        from ultralytics import YOLO
+        from ultralytics.trackers.basetrack import BaseTrack
+
+        self._base_track = BaseTrack
+        self.model = YOLO(weights)
+        self.conf = conf
+        self.names = self.model.names
+
+    def track(self, frame):
+        results = self.model.track(frame, persist=True, conf=self.conf, verbose=False)
+
+        boxes = []
+        if results[0].boxes is not None and results[0].boxes.id is not None:
+            for box, cls_id_tensor, track_id_tensor in zip(results[0].boxes.xyxy, results[0].boxes.cls, results[0].boxes.id):
+                x1, y1, x2, y2 = map(int, box)
+                boxes.append((x1, y1, x2, y2, int(cls_id_tensor), int(track_id_tensor)))
+        return boxes
+
+    @property
+    def state_version(self):
+        import ultralytics
+        return f"{TRACKER_STATE_VERSION}/ultralytics-{ultralytics.__version__}"
+
+    def get_state(self):
+        """
+        Save the frame counter and the tracks of each tracker, not the tracker objects themselves:
+        their config, Kalman filter, camera motion (GMC) and ReID model are rebuilt on restore.
+        """
+        predictor = self.model.predictor
+        trackers = getattr(predictor, "trackers", None) if predictor is not None else None
+        if trackers is None:
+            return {"trackers": None, "track_count": self._base_track._count}
+
+        saved = []
+        for tracker in trackers:
+            state = {"frame_id": tracker.frame_id}
+            for name in TRACK_LISTS:
+                # The Kalman filter is shared with the tracker, every other track field is plain data
+                state[name] = [(type(track), {field: value for (field, value) in vars(track).items() if field != "kalman_filter"})
+                               for track in getattr(tracker, name)]
+            saved.append(state)
+        return {"trackers": saved, "track_count": self._base_track._count}
+
+    def restore_state(self, state, frame):
+        """
+        Put a saved state back. `frame` must be the last frame analysed before the state was saved:
+        the predictor and its trackers are only created by a track call, which is run on that frame, so
+        camera motion compensation (GMC) keeps it as its previous frame, as in an uninterrupted run.
+        The tracks this call creates are then replaced by the saved ones.
+        """
+        if state["trackers"] is not None:
+            self.model.track(frame, persist=True, conf=self.conf, verbose=False)
+            for (tracker, saved) in zip(self.model.predictor.trackers, state["trackers"]):
+                tracker.frame_id = saved["frame_id"]
+                for name in TRACK_LISTS:
+                    setattr(tracker, name, [self._restore_track(tracker, track_type, fields) for (track_type, fields) in saved[name]])
+        self._base_track._count = state["track_count"]
+
+    @staticmethod
+    def _restore_track(tracker, track_type, fields):
+        track = track_type.__new__(track_type)
+        vars(track).update(fields)
+        track.kalman_filter = tracker.kalman_filter
+        return track
+
+
+class LaneCrossingCounter:
+    """
+    Crossing logic of one camera: turns tracked boxes into vehicle records.
+
+    A vehicle is timed from the frame it enters a lane ROI until its centre crosses the lane's
+    exit line, the speed follows from the ROI length. Each lane keeps its own entry frames.
+
+    Args:
+        fps (float): Frame rate of the source, used to turn frames into seconds
+        time_offset (float): Seconds added to every timeEntered (start of the clip in the full video)
+        roi_left (tuple): (x, y, width, height) of the "out" lane ROI
+        roi_right (tuple): (x, y, width, height) of the "in" lane ROI
+    """
+
+    def __init__(self, fps, time_offset=0.0, roi_left=ROI_LEFT, roi_right=ROI_RIGHT):
+        self.fps = fps
+        self.time_offset = time_offset
+        self.roi_left = roi_left
+        self.roi_right = roi_right
+
+        # Exit lines
+        self.line_y_left = roi_left[1] + roi_left[3] // 2
+        self.line_y_right = roi_right[1] + roi_right[3] // 2
+
+        # Tracking dictionaries
+        self.entry_frames_left = {}
+        self.counted_left = set()
+
+        self.entry_frames_right = {}
+        self.counted_right = set()
+
+        self.dismissed_vehicles = set()
+        self.last_positions = {}
+
+        # Output storage
+        self.vehicle_data = []
+
+        # Boxes that went through the whole crossing logic in the last update (for drawing)
+        self.visible_boxes = []
+
+    @staticmethod
+    def crossed_line(prev_y, curr_y, line_y):
+        return (prev_y < line_y <= curr_y) or (prev_y > line_y >= curr_y)
+
+    @staticmethod
+    def inside(roi, cx, cy):
+        return roi[0] <= cx <= roi[0] + roi[2] and roi[1] <= cy <= roi[1] + roi[3]
+
+    def update(self, boxes, frame_pos):
+        """
+        Process the tracked boxes of one frame.
+
+        Args:
+            boxes (list): (x1, y1, x2, y2, cls_id, track_id) tuples
+            frame_pos (int): Position of the frame in the source (1 for the first frame)
+
+        Returns:
+            list: New vehicle records ([vehicleId, timeEntered, speed, vehicleType, lane, speeding])
+        """
+        new_records = []
+        self.visible_boxes = []
+
+        for (x1, y1, x2, y2, cls_id, track_id) in boxes:
+            if cls_id not in [2, 5, 7]:
+                continue
+            if cls_id == 5:
+                cls_id = 7  # Treat bus as truck
+
+            if track_id in self.dismissed_vehicles:
+                continue
+
+            cx = (x1 + x2) // 2
+            cy = (y1 + y2) // 2
+
+            prev_pos = self.last_positions.get(track_id, (cx, cy))
+
+            # LEFT
+            if not self._update_lane(track_id, cls_id, cx, cy, prev_pos, frame_pos, self.roi_left, self.line_y_left,
+                                     self.entry_frames_left, self.counted_left, "out", new_records):
+                continue
+
+            # RIGHT
+            if not self._update_lane(track_id, cls_id, cx, cy, prev_pos, frame_pos, self.roi_right, self.line_y_right,
+                                     self.entry_frames_right, self.counted_right, "in", new_records):
+                continue
+
+            self.visible_boxes.append((x1, y1, x2, y2, cls_id, track_id))
+            self.last_positions[track_id] = (cx, cy)
+
+        self.vehicle_data.extend(new_records)
+        return new_records
+
+    # Returns False if the vehicle was dismissed and the rest of the frame logic must be skipped
+    def _update_lane(self, track_id, cls_id, cx, cy, prev_pos, frame_pos, roi, line_y, entry_frames, counted, lane, new_records):
+        if self.inside(roi, cx, cy) and track_id not in entry_frames:
+            entry_frames[track_id] = frame_pos
+
+        if track_id in entry_frames and track_id not in counted:
+            if self.crossed_line(prev_pos[1], cy, line_y):
+                exit_frame = frame_pos
+                time_frames = exit_frame - entry_frames[track_id]
+                if time_frames > MIN_TIME_FRAMES:
+                    speed = (ROI_LENGTH_M / (time_frames / self.fps)) * 3.6
+                    if speed > (MAX_SPEED_THRESHOLD_CAR if cls_id == 2 else MAX_SPEED_THRESHOLD_TRUCK):
+                        self.dismissed_vehicles.add(track_id)
+                        entry_frames.pop(track_id, None)
+                        print(f"Vehicle ID {track_id} dismissed - unrealistic speed: {speed:.1f} km/h")
+                        return False
+
+                    vehicle_type = "car" if cls_id == 2 else "truck"
+                    speeding = int((speed > CAR_LIMIT) if cls_id == 2 else (speed > TRUCK_LIMIT))
+                    time_seconds = (entry_frames[track_id] / self.fps) + self.time_offset
+                    new_records.append([track_id, round(time_seconds, 2), round(speed, 1), vehicle_type, lane, speeding])
+                    counted.add(track_id)
+                else:
+                    print(f"Vehicle ID {track_id} dismissed - too short time: {time_frames} frames")
+                    self.dismissed_vehicles.add(track_id)
+                    entry_frames.pop(track_id, None)
+                    return False
+
+        return True
+
+    def draw(self, frame, names):
+        for (x1, y1, x2, y2, cls_id, track_id) in self.visible_boxes:
+            label = f"{names[cls_id]} ID:{track_id}"
+            color = (0, 255, 0) if cls_id == 2 else (255, 0, 0)
+
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(frame, label, (x1, y1 - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+        # Draw ROIs and exit lines
+        roi_left, roi_right = self.roi_left, self.roi_right
+        cv2.rectangle(frame, (roi_left[0], roi_left[1]), (roi_left[0] + roi_left[2], roi_left[1] + roi_left[3]), (0, 255, 255), 2)
+        cv2.line(frame, (roi_left[0], self.line_y_left), (roi_left[0] + roi_left[2], self.line_y_left), (0, 0, 255), 2)
+
+        cv2.rectangle(frame, (roi_right[0], roi_right[1]), (roi_right[0] + roi_right[2], roi_right[1] + roi_right[3]), (255, 0, 255), 2)
+        cv2.line(frame, (roi_right[0], self.line_y_right), (roi_right[0] + roi_right[2], self.line_y_right), (0, 255, 255), 2)
+
+        # Display total counts and dismissed count
+        cv2.putText(frame, f"Left ROI Count: {len(self.counted_left)}", (20, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+        cv2.putText(frame, f"Right ROI Count: {len(self.counted_right)}", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 255), 2)
+        cv2.putText(frame, f"Dismissed: {len(self.dismissed_vehicles)}", (20, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+
+
+def clip_time_offset(video_path):
+    """
+    Get the start of a segment in the full video from the number at the end of its file name
+    (e.g. video_part3.mp4 starts at 2 * CLIP_SECONDS).
+    """
+    # Get the base name without extension
+    base = os.path.splitext(video_path)[0] #videos_clips_csvs/10s_clips/clip_0
+
+    # Use regex to find the number at the end of the base name
+    match = re.search(r'(\d+)$', base)
+    if match:
+        clip_number = int(match.group(1))
+        print("Clip number:", clip_number)
+        return (clip_number - 1) * CLIP_SECONDS
+
+    print("No number found in file name.")
+    return 0.0
+
+
+# Helper function to position a capture so the next read returns frame frame_pos + 1
+def seek_to_frame(cap, video_path, frame_pos):
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_pos:
+        return cap
+
+    # The container does not support exact seeking, decode forward from the start instead
+    cap.release()
+    cap = cv2.VideoCapture(video_path)
+    for _ in range(frame_pos):
+        if not cap.grab():
+            break
+    return cap
+
+
+def analyse_clip(video_path, csv_output_path, show_video=False, tracker=None, checkpoint_store=None,
+                 checkpoint_interval=ANALYSIS_CHECKPOINT_INTERVAL):
     """
     Analyze a video clip for vehicle detection, speed calculation, and traffic monitoring.
-    
+
+    With a checkpoint store the analysis state (frame position, tracker state, lane state and records)
+    is saved every `checkpoint_interval` frames, and a new call on the same video resumes from the
+    last checkpoint with the same output as an uninterrupted run. The final state is kept until the
+    caller deletes it (see checkpoint.checkpoint_key), so a retry after a failed upload skips the video.
+
     Args:
         video_path (str): Path to the input video file
         csv_output_path (str): Path where the CSV file will be saved
         show_video (bool): Whether to display the video during processing (default: False)
-    
+        tracker: Detector + tracker with a track(frame) method (default: a new YoloTracker)
+        checkpoint_store: LocalCheckpointStore / BlobCheckpointStore to save and resume from (default: None)
+        checkpoint_interval (int): Frames between two checkpoints (default: ANALYSIS_CHECKPOINT_INTERVAL)
+
     Returns:
         pd.DataFrame: DataFrame containing vehicle data with columns:
                      ['Id', 'timeEntered', 'speed', 'vehicleType', 'lane', 'speeding']
     """
-    
+
     # Validate input paths
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video file not found: {video_path}")
-    
+
     # Create output directory if it doesn't exist
     output_dir = os.path.dirname(csv_output_path)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    
-    # Get the last character of the file name in order to set correct relative time
-    # Get the base name without extension
-    base = os.path.splitext(video_path)[0] #videos_clips_csvs/10s_clips/clip_0
 
-    # Use regex to find the number at the end of the base name
-    match = re.search(r'(\d+)$', base)
-    if match:
-        clip_number = int(match.group(1))
-        print("Clip number:", clip_number)
-    else:
-        print("No number found in file name.")
+    # Get the number at the end of the file name in order to set correct relative time
+    time_offset = clip_time_offset(video_path)
 
     # Load YOLOv8 model
-    model = YOLO('yolov8n.pt')
+    if tracker is None:
+        tracker = YoloTracker()
 
     # Open video file
     cap = cv2.VideoCapture(video_path)
-    
+
     if not cap.isOpened():
         raise ValueError(f"Could not open video file: {video_path}")
 
-    # Define ROIs (x, y, width, height)
-    roi_left = (150, 400, 400, 140)
-    roi_right = (730, 400, 400, 140)
-
-    # Exit lines
-    line_y_left = roi_left[1] + roi_left[3] // 2
-    line_y_right = roi_right[1] + roi_right[3] // 2
-
-    # Real ROI length in meters
-    roi_length_m = 10.0
-
-    # Maximum allowed speed to dismiss vehicles (e.g., glitch)
-    MAX_SPEED_THRESHOLD_CAR = 300.0
-    MAX_SPEED_THRESHOLD_TRUCK = 200.0
-
-    # Speed limits
-    CAR_LIMIT = 90.0
-    TRUCK_LIMIT = 80.0
-
-    # Minimum time in frames to consider a valid crossing
-    MIN_TIME_FRAMES = 5
-
     # Get FPS
     fps = cap.get(cv2.CAP_PROP_FPS)
     if fps == 0:
         fps = 30.0
 
-    # Tracking dictionaries
-    entry_frames_left = {}
-    exit_frames_left = {}
-    counted_left = set()
-
-    entry_frames_right = {}
-    exit_frames_right = {}
-    counted_right = set()
-
-    dismissed_vehicles = set()
-    last_positions = {}
-
-    # Output storage
-    columns = ['vehicleId', 'timeEntered', 'speed', 'vehicleType', 'lane', 'speeding']
-    vehicle_data = []
-
-    def crossed_line(prev_y, curr_y, line_y):
-        return (prev_y < line_y <= curr_y) or (prev_y > line_y >= curr_y)
+    counter = LaneCrossingCounter(fps, time_offset)
 
     print(f"Processing video: {video_path}")
     print(f"FPS: {fps}")
-    
+
     frame_count = 0
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
-    while True:
-        ret, frame = cap.read()
+
+    # Checkpointing needs the tracker state, trackers without get_state always start from frame zero
+    checkpointing = checkpoint_store is not None and checkpoint_interval > 0 and hasattr(tracker, "get_state")
+    key = checkpoint_key(video_path) if checkpointing else None
+    tracker_version = getattr(tracker, "state_version", None)
+    writer = CheckpointWriter(checkpoint_store, key) if checkpointing else None
+    finished = False
+
+    # Resume from the last checkpoint of this video
+    state = load_state(checkpoint_store.load(key)) if checkpointing else None
+    if state is not None and state["tracker_version"] != tracker_version:
+        print(f"Ignoring checkpoint of tracker version {state['tracker_version']} (now {tracker_version})")
+        state = None
+    if state is not None and state["fps"] == fps:
+        counter = state["counter"]
+        frame_count = state["frame_count"]
+        finished = state["finished"]
+        print(f"Resuming from checkpoint at frame {frame_count}/{total_frames}")
+        if not finished:
+            # Re-read the last analysed frame for the tracker restore, the loop then goes on with the next one
+            cap = seek_to_frame(cap, video_path, frame_count - 1)
+            with METRICS.timer("analysis_decode_seconds", mode="clip"):
+                ret, frame = cap.read()
+            if not ret:
+                raise ValueError(f"Could not read frame {frame_count} of {video_path} to resume from")
+            tracker.restore_state(state["tracker"], frame)
+
+    while not finished:
+        with METRICS.timer("analysis_decode_seconds", mode="clip"):
+            ret, frame = cap.read()
         if not ret:
             break
-        
+
         frame_count += 1
         if frame_count % 100 == 0:
             print(f"Processing frame {frame_count}/{total_frames}")
 
-        results = model.track(frame, persist=True, conf=0.5, verbose=False)
-
-        if results[0].boxes is not None and results[0].boxes.id is not None:
-            for box, cls_id_tensor, track_id_tensor in zip(results[0].boxes.xyxy, results[0].boxes.cls, results[0].boxes.id):
-                cls_id = int(cls_id_tensor)
-                track_id = int(track_id_tensor)
-
-                if cls_id not in [2, 5, 7]:
-                    continue
-                if cls_id == 5:
-                    cls_id = 7  # Treat bus as truck
-
-                if track_id in dismissed_vehicles:
-                    continue
-
-                x1, y1, x2, y2 = map(int, box)
-                cx = (x1 + x2) // 2
-                cy = (y1 + y2) // 2
-
-                inside_left = roi_left[0] <= cx <= roi_left[0] + roi_left[2] and roi_left[1] <= cy <= roi_left[1] + roi_left[3]
-                inside_right = roi_right[0] <= cx <= roi_right[0] + roi_right[2] and roi_right[1] <= cy <= roi_right[1] + roi_right[3]
-
-                prev_pos = last_positions.get(track_id, (cx, cy))
-
-                # LEFT
-                if inside_left and track_id not in entry_frames_left:
-                    entry_frames_left[track_id] = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-
-                if track_id in entry_frames_left and track_id not in counted_left:
-                    if crossed_line(prev_pos[1], cy, line_y_left):
-                        exit_frame = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-                        time_frames = exit_frame - entry_frames_left[track_id]
-                        if time_frames > MIN_TIME_FRAMES:
-                            speed = (roi_length_m / (time_frames / fps)) * 3.6
-                            if speed > (MAX_SPEED_THRESHOLD_CAR if cls_id == 2 else MAX_SPEED_THRESHOLD_TRUCK):
-                                dismissed_vehicles.add(track_id)
-                                entry_frames_left.pop(track_id, None)
-                                print(f"Vehicle ID {track_id} dismissed - unrealistic speed: {speed:.1f} km/h")
-                                continue
-
-                            vehicle_type = "car" if cls_id == 2 else "truck"
-                            speeding = int((speed > CAR_LIMIT) if cls_id == 2 else (speed > TRUCK_LIMIT))
-                            time_seconds = (entry_frames_left[track_id] / fps) + (clip_number-1)*120
-                            vehicle_data.append([track_id, round(time_seconds, 2), round(speed, 1), vehicle_type, "out", speeding])
-                            counted_left.add(track_id)
-                        else:
-                            print(f"Vehicle ID {track_id} dismissed - too short time: {time_frames} frames")
-                            dismissed_vehicles.add(track_id)
-                            entry_frames_left.pop(track_id, None)
-                            continue
-
-                # RIGHT
-                if inside_right and track_id not in entry_frames_right:
-                    entry_frames_right[track_id] = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-
-                if track_id in entry_frames_right and track_id not in counted_right:
-                    if crossed_line(prev_pos[1], cy, line_y_right):
-                        exit_frame = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-                        time_frames = exit_frame - entry_frames_right[track_id]
-                        if time_frames > MIN_TIME_FRAMES:
-                            speed = (roi_length_m / (time_frames / fps)) * 3.6
-                            if speed > (MAX_SPEED_THRESHOLD_CAR if cls_id == 2 else MAX_SPEED_THRESHOLD_TRUCK):
-                                dismissed_vehicles.add(track_id)
-                                entry_frames_right.pop(track_id, None)
-                                print(f"Vehicle ID {track_id} dismissed - unrealistic speed: {speed:.1f} km/h")
-                                continue
-
-                            vehicle_type = "car" if cls_id == 2 else "truck"
-                            speeding = int((speed > CAR_LIMIT) if cls_id == 2 else (speed > TRUCK_LIMIT))
-                            time_seconds = (entry_frames_right[track_id] / fps) + (clip_number-1)*120
-                            vehicle_data.append([track_id, round(time_seconds, 2), round(speed, 1), vehicle_type, "in", speeding])
-                            counted_right.add(track_id)
-                        else:
-                            print(f"Vehicle ID {track_id} dismissed - too short time: {time_frames} frames")
-                            dismissed_vehicles.add(track_id)
-                            entry_frames_right.pop(track_id, None)
-                            continue
-
-                # Draw bounding box (only if showing video)
-                if show_video:
-                    label = f"{model.names[cls_id]} ID:{track_id}"
-                    color = (0, 255, 0) if cls_id == 2 else (255, 0, 0)
-
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                    cv2.putText(frame, label, (x1, y1 - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-
-                last_positions[track_id] = (cx, cy)
-
-        # Draw ROIs and exit lines (only if showing video)
+        with METRICS.timer("analysis_inference_seconds", mode="clip"):
+            boxes = tracker.track(frame)
+        with METRICS.timer("analysis_crossing_seconds", mode="clip"):
+            new_records = counter.update(boxes, int(cap.get(cv2.CAP_PROP_POS_FRAMES)))
+        METRICS.inc("analysis_frames_total", mode="clip")
+        if new_records:
+            METRICS.inc("analysis_records_total", len(new_records), mode="clip")
+
+        # The state is serialised here (the counter and tracker keep changing), the upload runs on the writer thread
+        if checkpointing and frame_count % checkpoint_interval == 0:
+            with METRICS.timer("analysis_checkpoint_seconds"):
+                writer.submit(dump_state({"fps": fps, "frame_count": frame_count, "counter": counter,
+                                          "tracker": tracker.get_state(), "tracker_version": tracker_version,
+                                          "finished": False}))
+
+        # Draw boxes, ROIs and exit lines (only if showing video)
         if show_video:
-            cv2.rectangle(frame, (roi_left[0], roi_left[1]), (roi_left[0] + roi_left[2], roi_left[1] + roi_left[3]), (0, 255, 255), 2)
-            cv2.line(frame, (roi_left[0], line_y_left), (roi_left[0] + roi_left[2], line_y_left), (0, 0, 255), 2)
-
-            cv2.rectangle(frame, (roi_right[0], roi_right[1]), (roi_right[0] + roi_right[2], roi_right[1] + roi_right[3]), (255, 0, 255), 2)
-            cv2.line(frame, (roi_right[0], line_y_right), (roi_right[0] + roi_right[2], line_y_right), (0, 255, 255), 2)
-
-            # Display total counts and dismissed count
-            cv2.putText(frame, f"Left ROI Count: {len(counted_left)}", (20, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-            cv2.putText(frame, f"Right ROI Count: {len(counted_right)}", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 255), 2)
-            cv2.putText(frame, f"Dismissed: {len(dismissed_vehicles)}", (20, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+            counter.draw(frame, tracker.names)
 
             # Display live video
             cv2.imshow("Vehicle Monitor", frame)
@@ -219,15 +419,178 @@ def analyse_clip(video_path, csv_output_path, show_video=False):
     if show_video:
         cv2.destroyAllWindows()
 
+    if checkpointing and not finished:
+        # Wait for the last periodic checkpoint so it cannot overwrite the final one
+        writer.flush()
+        checkpoint_store.save(key, dump_state({"fps": fps, "frame_count": frame_count, "counter": counter,
+                                               "tracker": None, "tracker_version": tracker_version, "finished": True}))
+
     # Convert to DataFrame
-    df = pd.DataFrame(vehicle_data, columns=columns)
-    
+    df = pd.DataFrame(counter.vehicle_data, columns=COLUMNS)
+
     # Save to CSV
     df.to_csv(csv_output_path, index=False)
-    
+
     print(f"\nAnalysis complete!")
     print(f"Total vehicles detected: {len(df)}")
-    print(f"Left lane vehicles: {len(counted_left)}")
-    print(f"Right lane vehicles: {len(counted_right)}")
-    print(f"Dismissed vehicles: {len(dismissed_vehicles)}")
-    print(f"Results saved to: {csv_output_path}")
\ No newline at end of file
+    print(f"Left lane vehicles: {len(counter.counted_left)}")
+    print(f"Right lane vehicles: {len(counter.counted_right)}")
+    print(f"Dismissed vehicles: {len(counter.dismissed_vehicles)}")
+    print(f"Results saved to: {csv_output_path}")
+
+    return df
+
+
+class LiveStats:
+    """
+    Counters of a live analysis, updated while it runs (safe to read from another thread).
+
+    frames_read counts every frame pulled from the source, frames_dropped the ones skipped to stay
+    within the latency budget. lag_s is how far processing is behind the source's real-time clock.
+    """
+
+    def __init__(self):
+        self.frames_read = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.records_emitted = 0
+        self.alerts_emitted = 0
+        self.lag_s = 0.0
+        self.max_lag_s = 0.0
+        self.max_emit_latency_s = 0.0
+        self.reconnects = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def open_capture(source, start_frame=0):
+    """
+    Open a live source: an RTSP/HTTP URL, a named pipe (FIFO) or a local file that is still being written.
+    """
+    cap = cv2.VideoCapture(source)
+    if start_frame and cap.isOpened():
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    return cap
+
+
+def analyse_stream(source, on_record=None, on_alert=None, latency_budget_s=2.0, frame_stride=1, follow=False,
+                   poll_interval_s=0.5, idle_timeout_s=10.0, time_offset=0.0, max_frames=None, stop_event=None,
+                   tracker=None, stats=None):
+    """
+    Analyze a live source continuously, emitting vehicle records as soon as vehicles cross their exit line.
+
+    Frames are compared against the source's real-time clock (frame index / fps since the first frame).
+    When processing falls more than `latency_budget_s` behind, frames are only grabbed (not retrieved or
+    tracked) until it catches up, so results stay within the budget instead of drifting further behind.
+    With the FFmpeg backend grab() still decodes the frame, dropping saves the colour conversion and copy
+    of retrieve() and the inference, not the decoding.
+    Speeds stay correct because the crossing logic counts source frames, including the dropped ones.
+
+    Args:
+        source (str): RTSP/HTTP URL, named pipe or (growing) local video file
+        on_record (callable): Called with every new record ([vehicleId, timeEntered, speed, vehicleType, lane, speeding])
+        on_alert (callable): Called with every new record faster than ALERT_SPEED_KMH
+        latency_budget_s (float): Maximum lag behind the source before frames are dropped
+        frame_stride (int): Only run detection on every n-th frame (1 = every frame)
+        follow (bool): Keep polling the source at end of stream (a file that is still being written)
+        poll_interval_s (float): Wait between polls when following a source
+        idle_timeout_s (float): Stop following after this long without new frames
+        time_offset (float): Seconds added to every timeEntered
+        max_frames (int): Stop after this many source frames (default: run until the stream ends)
+        stop_event (threading.Event): Set it to stop the analysis from another thread
+        tracker: Detector + tracker with a track(frame) method (default: a new YoloTracker)
+        stats (LiveStats): Counters to update (default: a new LiveStats)
+
+    Returns:
+        LiveStats: Lag, drop and emission counters of the run
+    """
+    stats = stats if stats is not None else LiveStats()
+    if tracker is None:
+        tracker = YoloTracker()
+
+    cap = open_capture(source)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open stream: {source}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or fps != fps or fps > 1000:
+        fps = 30.0
+
+    counter = LaneCrossingCounter(fps, time_offset)
+    frame_index = 0
+    started_at = None
+    idle_since = None
+
+    try:
+        while stop_event is None or not stop_event.is_set():
+            if max_frames is not None and frame_index >= max_frames:
+                break
+
+            with METRICS.timer("analysis_decode_seconds", mode="live"):
+                grabbed = cap.grab()
+            if not grabbed:
+                if not follow:
+                    break
+
+                # End of what has been written so far: wait, reopen and continue after the last frame
+                now = time.monotonic()
+                idle_since = idle_since or now
+                if now - idle_since > idle_timeout_s:
+                    break
+                time.sleep(poll_interval_s)
+                cap.release()
+                cap = open_capture(source, frame_index)
+                continue
+
+            # Frames again after reopening an idle source (a poll without new frames is not a reconnect)
+            if idle_since is not None:
+                stats.reconnects += 1
+            grabbed_at = time.monotonic()
+            idle_since = None
+            frame_index += 1
+            stats.frames_read += 1
+            if started_at is None:
+                started_at = grabbed_at - 1 / fps
+
+            # How far behind the source's real-time clock processing is
+            stats.lag_s = max(0.0, (grabbed_at - started_at) - frame_index / fps)
+            stats.max_lag_s = max(stats.max_lag_s, stats.lag_s)
+            METRICS.set_gauge("live_lag_seconds", stats.lag_s)
+
+            if stats.lag_s > latency_budget_s or (frame_index - 1) % frame_stride != 0:
+                stats.frames_dropped += 1
+                METRICS.inc("live_frames_dropped_total")
+                continue
+
+            with METRICS.timer("analysis_decode_seconds", mode="live"):
+                ret, frame = cap.retrieve()
+            if not ret:
+                stats.frames_dropped += 1
+                METRICS.inc("live_frames_dropped_total")
+                continue
+
+            with METRICS.timer("analysis_inference_seconds", mode="live"):
+                boxes = tracker.track(frame)
+            with METRICS.timer("analysis_crossing_seconds", mode="live"):
+                new_records = counter.update(boxes, frame_index)
+            stats.frames_processed += 1
+            METRICS.inc("analysis_frames_total", mode="live")
+
+            if new_records:
+                METRICS.inc("analysis_records_total", len(new_records), mode="live")
+            for record in new_records:
+                stats.records_emitted += 1
+                if on_record is not None:
+                    on_record(record)
+                if record[2] > ALERT_SPEED_KMH:
+                    stats.alerts_emitted += 1
+                    if on_alert is not None:
+                        on_alert(record)
+
+            if new_records:
+                stats.max_emit_latency_s = max(stats.max_emit_latency_s, time.monotonic() - grabbed_at + stats.lag_s)
+    finally:
+        cap.release()
+
+    return stats
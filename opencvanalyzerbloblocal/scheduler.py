@@ -0,0 +1,668 @@
+import contextlib
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from instrumentation import METRICS
+
+# Job priorities, leased in this order (segments of live sources before backfills of recorded video)
+PRIORITIES = ("live", "backfill")
+DEFAULT_PRIORITY = "backfill"
+
+# "azure" (Storage queues, shared by every instance) or "local" (SQLite file, shared by the processes of one machine)
+ANALYSIS_QUEUE_BACKEND = os.getenv("ANALYSIS_QUEUE_BACKEND", "azure")
+ANALYSIS_QUEUE_NAME = os.getenv("ANALYSIS_QUEUE_NAME", "analysis-jobs")
+ANALYSIS_QUEUE_DB = os.getenv("ANALYSIS_QUEUE_DB", os.path.join(tempfile.gettempdir(), "analysis-jobs.sqlite"))
+
+# Jobs analysed at the same time across all workers, every analysis holds a YOLO model and a decoder
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "2"))
+
+# Seconds a leased job stays invisible to other workers, extended by the heartbeat while the job runs
+ANALYSIS_VISIBILITY_TIMEOUT_S = int(os.getenv("ANALYSIS_VISIBILITY_TIMEOUT_S", "300"))
+
+# Leases of a job before it is dead-lettered (same as the retry count of the former blob trigger)
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "5"))
+
+# Exponential backoff of a failed job before it becomes visible again
+RETRY_MIN_BACKOFF_S = 5.0
+RETRY_MAX_BACKOFF_S = 60.0
+
+# Lease of a concurrency slot blob (Azure allows 15-60 s), renewed by the heartbeat
+SLOT_LEASE_S = 60
+HEARTBEAT_INTERVAL_S = min(20.0, ANALYSIS_VISIBILITY_TIMEOUT_S / 3.0)
+
+# Queue of the wake messages that start a worker on any instance (queue trigger of the analyzer app)
+ANALYSIS_WAKE_QUEUE_NAME = f"{ANALYSIS_QUEUE_NAME}-wake"
+
+# Markers of queued Azure jobs older than this are stale (default time-to-live of a queue message)
+JOB_MARKER_TTL_S = 7 * 24 * 3600
+
+# Finished jobs kept for the latency stats
+STATS_WINDOW_JOBS = 1000
+JOB_RETENTION_S = 24 * 3600
+
+
+class LeaseLostError(Exception):
+    """The lease of a running job expired, another worker may already run the same job."""
+
+
+class Job:
+    """One leased segment analysis job."""
+
+    def __init__(self, job_id, blob_name, priority, attempts, enqueued_at, payload=None, receipt=None):
+        self.job_id = job_id
+        self.blob_name = blob_name
+        self.priority = priority
+        self.attempts = attempts
+        self.enqueued_at = enqueued_at
+        self.payload = payload or {}
+        self.leased_at = time.time()
+        # Backend handle of the lease (lease id / queue message and slot)
+        self.receipt = receipt
+        # Set by the backend on lease and on every heartbeat, and by JobHeartbeat when a heartbeat fails
+        self.lease_expires_at = None
+        self.lease_lost = False
+
+    # Raises LeaseLostError when the job no longer holds its lease, call it before any side effect
+    def ensure_leased(self) -> None:
+        if self.lease_lost or (self.lease_expires_at is not None and time.time() >= self.lease_expires_at):
+            raise LeaseLostError(f"Lease of analysis job {self.job_id} ({self.blob_name}) was lost")
+
+
+# Helper function to validate a requested priority, unknown values fall back to the default
+def normalize_priority(priority: str) -> str:
+    priority = (priority or DEFAULT_PRIORITY).lower()
+    return priority if priority in PRIORITIES else DEFAULT_PRIORITY
+
+
+# Helper function to get the backoff before the next attempt of a failed job
+def retry_backoff_s(attempts: int) -> float:
+    return min(RETRY_MAX_BACKOFF_S, RETRY_MIN_BACKOFF_S * 2 ** max(0, attempts - 1))
+
+
+# Helper function to summarize latency samples (seconds) as nearest-rank percentiles
+def latency_summary(samples: list) -> dict:
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+
+    def percentile(q):
+        return round(ordered[max(0, math.ceil(q / 100.0 * len(ordered)) - 1)], 3)
+
+    return {"count": len(ordered), "p50": percentile(50), "p95": percentile(95), "max": round(ordered[-1], 3)}
+
+
+def _record_lease(job: Job) -> None:
+    if job.attempts == 1 and job.enqueued_at:
+        METRICS.observe("analysis_job_wait_seconds", max(0.0, job.leased_at - job.enqueued_at), priority=job.priority)
+
+
+# Helper function to publish the queue depth and running jobs as gauges (scraped for autoscaling)
+def _record_stats(stats: dict) -> dict:
+    for (priority, depth) in stats["depth"].items():
+        METRICS.set_gauge("analysis_queue_depth", depth, priority=priority)
+    METRICS.set_gauge("analysis_jobs_in_flight", stats["in_flight"])
+    return stats
+
+
+class LocalJobQueue:
+    """
+    Job queue in a SQLite file, shared by every worker process of one machine.
+
+    lease() hands out the oldest visible job of the highest priority, unless max_concurrency jobs are
+    already leased: the job then stays queued (backpressure). A lease is lost when it is not extended
+    within the visibility timeout (crashed worker) and the job becomes visible for another worker.
+    Jobs are dead-lettered after max_attempts leases.
+    """
+
+    def __init__(self, path: str = ANALYSIS_QUEUE_DB, max_concurrency: int = ANALYSIS_MAX_CONCURRENCY,
+                 visibility_timeout_s: int = ANALYSIS_VISIBILITY_TIMEOUT_S, max_attempts: int = ANALYSIS_MAX_ATTEMPTS):
+        self.path = path
+        self.max_concurrency = max_concurrency
+        self.visibility_timeout_s = visibility_timeout_s
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id           TEXT     PRIMARY KEY,
+                    blob_name        TEXT     NOT NULL,
+                    priority         INTEGER  NOT NULL,
+                    payload          TEXT,
+                    state            TEXT     NOT NULL,
+                    attempts         INTEGER  NOT NULL DEFAULT 0,
+                    enqueued_at      REAL     NOT NULL,
+                    visible_at       REAL     NOT NULL,
+                    first_leased_at  REAL,
+                    leased_at        REAL,
+                    finished_at      REAL,
+                    lease_id         TEXT,
+                    last_error       TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS IX_jobs_ready ON jobs (state, priority, enqueued_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS IX_jobs_blob ON jobs (blob_name, state)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+
+    # Takes the write lock up front, two workers can never lease the same job
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def enqueue(self, blob_name: str, priority: str = DEFAULT_PRIORITY, payload: dict = None) -> str:
+        priority_rank = PRIORITIES.index(normalize_priority(priority))
+        now = time.time()
+        with self._transaction() as conn:
+            # A blob queued twice (repeated trigger) stays one job, at the higher of both priorities
+            row = conn.execute("SELECT job_id, priority FROM jobs WHERE blob_name = ? AND state IN ('queued', 'leased')",
+                               (blob_name,)).fetchone()
+            if row is not None:
+                if priority_rank < row[1]:
+                    conn.execute("UPDATE jobs SET priority = ? WHERE job_id = ?", (priority_rank, row[0]))
+                return row[0]
+
+            job_id = uuid.uuid4().hex
+            conn.execute("INSERT INTO jobs (job_id, blob_name, priority, payload, state, enqueued_at, visible_at) "
+                         "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                         (job_id, blob_name, priority_rank, json.dumps(payload or {}), now, now))
+        METRICS.inc("analysis_jobs_enqueued_total", priority=PRIORITIES[priority_rank])
+        return job_id
+
+    def lease(self):
+        now = time.time()
+        with self._transaction() as conn:
+            (in_flight,) = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'leased' AND visible_at > ?", (now,)).fetchone()
+            if in_flight >= self.max_concurrency:
+                METRICS.inc("analysis_jobs_throttled_total")
+                return None
+
+            while True:
+                # Queued jobs and jobs whose lease expired
+                row = conn.execute("SELECT job_id, blob_name, priority, payload, attempts, enqueued_at FROM jobs "
+                                   "WHERE state IN ('queued', 'leased') AND visible_at <= ? "
+                                   "ORDER BY priority, enqueued_at LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    return None
+
+                (job_id, blob_name, priority_rank, payload, attempts, enqueued_at) = row
+                if attempts >= self.max_attempts:
+                    conn.execute("UPDATE jobs SET state = 'dead', finished_at = ?, lease_id = NULL, "
+                                 "last_error = COALESCE(last_error, 'lease expired') WHERE job_id = ?", (now, job_id))
+                    METRICS.inc("analysis_jobs_total", outcome="dead_lettered")
+                    logging.error(f"Analysis job {job_id} ({blob_name}) dead-lettered after {attempts} attempts")
+                    continue
+
+                lease_id = uuid.uuid4().hex
+                conn.execute("UPDATE jobs SET state = 'leased', attempts = attempts + 1, lease_id = ?, leased_at = ?, "
+                             "first_leased_at = COALESCE(first_leased_at, ?), visible_at = ? WHERE job_id = ?",
+                             (lease_id, now, now, now + self.visibility_timeout_s, job_id))
+                break
+
+        job = Job(job_id, blob_name, PRIORITIES[priority_rank], attempts + 1, enqueued_at, json.loads(payload or "{}"), lease_id)
+        job.lease_expires_at = now + self.visibility_timeout_s
+        _record_lease(job)
+        return job
+
+    # Extend the lease of a running job, False if the lease was lost (expired and taken by another worker)
+    def heartbeat(self, job: Job) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE jobs SET visible_at = ? WHERE job_id = ? AND lease_id = ? AND state = 'leased' "
+                                  "AND visible_at > ?", (now + self.visibility_timeout_s, job.job_id, job.receipt, now))
+            if cursor.rowcount != 1:
+                return False
+        job.lease_expires_at = now + self.visibility_timeout_s
+        return True
+
+    # Give up a job whose lease was lost: the row already belongs to the next lease, nothing to release
+    def abandon(self, job: Job) -> None:
+        pass
+
+    def complete(self, job: Job) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE jobs SET state = 'done', finished_at = ?, lease_id = NULL, last_error = NULL "
+                                  "WHERE job_id = ? AND lease_id = ?", (now, job.job_id, job.receipt))
+            conn.execute("DELETE FROM jobs WHERE state = 'done' AND finished_at < ?", (now - JOB_RETENTION_S,))
+            return cursor.rowcount == 1
+
+    # Release a failed job for a later attempt (or dead-letter it), returns its new state
+    def fail(self, job: Job, error: str) -> str:
+        now = time.time()
+        state = "dead" if job.attempts >= self.max_attempts else "queued"
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET state = ?, visible_at = ?, finished_at = ?, lease_id = NULL, last_error = ? "
+                         "WHERE job_id = ? AND lease_id = ?",
+                         (state, now + retry_backoff_s(job.attempts), now if state == "dead" else None, error[:2000],
+                          job.job_id, job.receipt))
+        return state
+
+    def stats(self) -> dict:
+        now = time.time()
+        conn = self._connect()
+        try:
+            depth = {priority: 0 for priority in PRIORITIES}
+            for (priority_rank, count) in conn.execute("SELECT priority, COUNT(*) FROM jobs WHERE state IN ('queued', 'leased') "
+                                                       "AND visible_at <= ? GROUP BY priority", (now,)):
+                depth[PRIORITIES[priority_rank]] = count
+            (delayed,) = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND visible_at > ?", (now,)).fetchone()
+            (in_flight,) = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'leased' AND visible_at > ?", (now,)).fetchone()
+            (dead,) = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'dead'").fetchone()
+            (oldest,) = conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE state = 'queued'").fetchone()
+            finished = conn.execute("SELECT enqueued_at, first_leased_at, leased_at, finished_at FROM jobs WHERE state = 'done' "
+                                    "ORDER BY finished_at DESC LIMIT ?", (STATS_WINDOW_JOBS,)).fetchall()
+        finally:
+            conn.close()
+
+        return _record_stats({
+            "backend": "local",
+            "max_concurrency": self.max_concurrency,
+            "in_flight": in_flight,
+            "depth": depth,
+            "delayed_retries": delayed,
+            "dead_lettered": dead,
+            "oldest_queued_age_s": round(now - oldest, 3) if oldest else None,
+            "latency_s": {
+                "wait": latency_summary([first_leased - enqueued for (enqueued, first_leased, _, _) in finished]),
+                "run": latency_summary([done - leased for (_, _, leased, done) in finished]),
+                "total": latency_summary([done - enqueued for (enqueued, _, _, done) in finished]),
+            },
+        })
+
+
+class AzureJobQueue:
+    """
+    Job queue on Azure Storage queues, shared by every instance of the app.
+
+    Each priority has its own queue (<name>-live, <name>-backfill), lease() reads them in priority
+    order with the native message visibility timeout. Dead-lettered jobs go to <name>-deadletter.
+    The global concurrency cap is a set of max_concurrency slot blobs in the <name>-slots container:
+    a worker holds a lease on one of them while its job runs, no free slot means no lease.
+    Queued and running jobs have a marker blob (named after the segment) in <name>-pending, so a
+    segment queued again while its job is pending is not analysed twice.
+
+    Every queued job and every retry (visible once its backoff is over) posts a message to <name>-wake,
+    whose queue trigger runs a worker on whichever instance the host picks, so the workers scale out
+    with the backlog while the slots keep the global cap.
+    """
+
+    def __init__(self, conn_str: str, name: str = ANALYSIS_QUEUE_NAME, max_concurrency: int = ANALYSIS_MAX_CONCURRENCY,
+                 visibility_timeout_s: int = ANALYSIS_VISIBILITY_TIMEOUT_S, max_attempts: int = ANALYSIS_MAX_ATTEMPTS):
+        from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+        from azure.storage.blob import BlobServiceClient
+        from azure.storage.queue import QueueClient, TextBase64EncodePolicy
+
+        self.max_concurrency = max_concurrency
+        self.visibility_timeout_s = visibility_timeout_s
+        self.max_attempts = max_attempts
+        self._lease_error = HttpResponseError
+        self._exists_error = ResourceExistsError
+        self._not_found_error = ResourceNotFoundError
+
+        self.queues = {priority: QueueClient.from_connection_string(conn_str, f"{name}-{priority}") for priority in PRIORITIES}
+        self.dead_letter_queue = QueueClient.from_connection_string(conn_str, f"{name}-deadletter")
+        # Queue triggers expect Base64 messages
+        self.wake_queue = QueueClient.from_connection_string(conn_str, f"{name}-wake", message_encode_policy=TextBase64EncodePolicy())
+        for queue_client in list(self.queues.values()) + [self.dead_letter_queue, self.wake_queue]:
+            try:
+                queue_client.create_queue()
+            except ResourceExistsError:
+                pass
+
+        blob_service_client = BlobServiceClient.from_connection_string(conn_str)
+        self.slots_container = blob_service_client.get_container_client(f"{name}-slots")
+        self.markers_container = blob_service_client.get_container_client(f"{name}-pending")
+        for container_client in (self.slots_container, self.markers_container):
+            try:
+                container_client.create_container()
+            except ResourceExistsError:
+                pass
+
+    # Helper function to start a worker once the job is visible, a lost wake only delays the job until the timer sweep
+    def _wake(self, job_id: str, delay_s: float = 0) -> None:
+        try:
+            self.wake_queue.send_message(json.dumps({"job_id": job_id}), visibility_timeout=int(math.ceil(delay_s)))
+        except Exception as e:
+            logging.warning(f"Could not wake a worker for analysis job {job_id}: {e}")
+
+    # Helper function to read the marker of the queued / running job of a blob, None if there is none
+    def _read_marker(self, blob_name: str):
+        try:
+            return json.loads(self.markers_container.download_blob(blob_name).readall())
+        except self._not_found_error:
+            return None
+
+    def _delete_marker(self, job_id: str, blob_name: str) -> None:
+        try:
+            marker = self._read_marker(blob_name)
+            if marker is not None and marker.get("job_id") == job_id:
+                self.markers_container.delete_blob(blob_name)
+        except self._not_found_error:
+            pass
+        except Exception as e:
+            # Only delays a later enqueue of the same blob until the marker expires
+            logging.warning(f"Could not delete the marker of analysis job {job_id}: {e}")
+
+    # A blob queued twice (repeated trigger) stays one job. Messages cannot move between queues, so unlike
+    # LocalJobQueue the job keeps the priority it was first queued with
+    def enqueue(self, blob_name: str, priority: str = DEFAULT_PRIORITY, payload: dict = None) -> str:
+        priority = normalize_priority(priority)
+        marker = self._read_marker(blob_name)
+        # Markers past the time-to-live of their message are overwritten
+        if marker is not None and time.time() - marker.get("enqueued_at", 0) <= JOB_MARKER_TTL_S:
+            return marker["job_id"]
+
+        job_id = uuid.uuid4().hex
+        enqueued_at = time.time()
+        message = {"job_id": job_id, "blob_name": blob_name, "enqueued_at": enqueued_at, "payload": payload or {}}
+        sent = self.queues[priority].send_message(json.dumps(message))
+
+        # The message is sent before the marker is written, a crash in between leaves a job without marker (run
+        # once more) instead of a marker without job (blob never queued again)
+        try:
+            self.markers_container.upload_blob(name=blob_name, overwrite=marker is not None,
+                                               data=json.dumps({"job_id": job_id, "priority": priority, "enqueued_at": enqueued_at}))
+        except self._exists_error:
+            # Another trigger queued the same blob meanwhile
+            self.queues[priority].delete_message(sent)
+            return (self._read_marker(blob_name) or {}).get("job_id", job_id)
+
+        METRICS.inc("analysis_jobs_enqueued_total", priority=priority)
+        self._wake(job_id)
+        return job_id
+
+    # Helper function to take a free concurrency slot, None when every slot is leased
+    def _acquire_slot(self):
+        for index in random.sample(range(self.max_concurrency), self.max_concurrency):
+            blob_client = self.slots_container.get_blob_client(f"slot-{index}")
+            try:
+                blob_client.upload_blob(b"", overwrite=False)
+            except self._exists_error:
+                pass
+            try:
+                return blob_client.acquire_lease(lease_duration=SLOT_LEASE_S)
+            except self._lease_error:
+                continue
+        return None
+
+    def _dead_letter(self, queue_client, message, error: str) -> None:
+        content = json.loads(message.content)
+        content["last_error"] = error
+        self.dead_letter_queue.send_message(json.dumps(content))
+        self._delete_marker(content.get("job_id"), content.get("blob_name"))
+        queue_client.delete_message(message)
+        METRICS.inc("analysis_jobs_total", outcome="dead_lettered")
+        logging.error(f"Analysis job {content.get('job_id')} ({content.get('blob_name')}) dead-lettered: {error}")
+
+    def lease(self):
+        slot = self._acquire_slot()
+        if slot is None:
+            METRICS.inc("analysis_jobs_throttled_total")
+            return None
+
+        for priority in PRIORITIES:
+            queue_client = self.queues[priority]
+            while True:
+                message = queue_client.receive_message(visibility_timeout=self.visibility_timeout_s)
+                if message is None:
+                    break
+                # Delivered max_attempts times already: the previous workers crashed or timed out
+                if message.dequeue_count > self.max_attempts:
+                    self._dead_letter(queue_client, message, "lease expired")
+                    continue
+
+                content = json.loads(message.content)
+                job = Job(content["job_id"], content["blob_name"], priority, message.dequeue_count, content.get("enqueued_at"),
+                          content.get("payload"), {"queue": queue_client, "message": message, "slot": slot})
+                job.lease_expires_at = job.leased_at + min(self.visibility_timeout_s, SLOT_LEASE_S)
+                _record_lease(job)
+                return job
+
+        slot.release()
+        return None
+
+    def heartbeat(self, job: Job) -> bool:
+        receipt = job.receipt
+        now = time.time()
+        try:
+            # A new pop receipt is returned on every update, the old one is invalid afterwards
+            receipt["message"] = receipt["queue"].update_message(receipt["message"], visibility_timeout=self.visibility_timeout_s)
+            receipt["slot"].renew()
+        except Exception as e:
+            logging.warning(f"Lost the lease of analysis job {job.job_id}: {e}")
+            return False
+        job.lease_expires_at = now + min(self.visibility_timeout_s, SLOT_LEASE_S)
+        return True
+
+    # Give up a job whose lease was lost: the message belongs to the next lease, only the slot is freed
+    def abandon(self, job: Job) -> None:
+        self._release_slot(job)
+
+    def complete(self, job: Job) -> bool:
+        receipt = job.receipt
+        try:
+            # Marker first: a marker left behind would keep the blob from ever being queued again
+            self._delete_marker(job.job_id, job.blob_name)
+            receipt["queue"].delete_message(receipt["message"])
+            return True
+        except self._lease_error as e:
+            logging.warning(f"Could not delete analysis job {job.job_id}: {e}")
+            return False
+        finally:
+            self._release_slot(job)
+
+    def fail(self, job: Job, error: str) -> str:
+        receipt = job.receipt
+        try:
+            if job.attempts >= self.max_attempts:
+                self._dead_letter(receipt["queue"], receipt["message"], error)
+                return "dead"
+            backoff_s = int(retry_backoff_s(job.attempts))
+            receipt["queue"].update_message(receipt["message"], visibility_timeout=backoff_s)
+            self._wake(job.job_id, backoff_s)
+            return "queued"
+        finally:
+            self._release_slot(job)
+
+    def _release_slot(self, job: Job) -> None:
+        try:
+            job.receipt["slot"].release()
+        except Exception:
+            # An expired slot lease is free already
+            pass
+
+    def stats(self) -> dict:
+        depth = {priority: self.queues[priority].get_queue_properties().approximate_message_count for priority in PRIORITIES}
+        in_flight = sum(1 for blob in self.slots_container.list_blobs() if blob.lease.state == "leased")
+        latency = {name: histogram for name, histogram in
+                   ((h["name"], {"count": h["count"], "p50": h["p50"], "p95": h["p95"], "max": h["max"]})
+                    for h in METRICS.snapshot()["histograms"]) if name.startswith("analysis_job_")}
+
+        return _record_stats({
+            "backend": "azure",
+            "max_concurrency": self.max_concurrency,
+            "in_flight": in_flight,
+            # Approximate counts, they include the messages of running jobs
+            "depth": depth,
+            "dead_lettered": self.dead_letter_queue.get_queue_properties().approximate_message_count,
+            # Storage queues keep no history, the latencies are the ones seen by this instance
+            "latency_s": latency,
+        })
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+# Helper function to get the job queue configured through the environment (one per process)
+def get_job_queue():
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            if ANALYSIS_QUEUE_BACKEND == "local":
+                _job_queue = LocalJobQueue(ANALYSIS_QUEUE_DB)
+            else:
+                _job_queue = AzureJobQueue(os.getenv("AzureWebJobsStorage"), ANALYSIS_QUEUE_NAME)
+        return _job_queue
+
+
+class JobHeartbeat(threading.Thread):
+    """Keeps extending the lease of a running job until stopped."""
+
+    def __init__(self, job_queue, job: Job, interval_s: float = HEARTBEAT_INTERVAL_S):
+        super().__init__(name=f"heartbeat-{job.job_id[:8]}", daemon=True)
+        self.job_queue = job_queue
+        self.job = job
+        self.interval_s = interval_s
+        self.lease_lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_s):
+            try:
+                extended = self.job_queue.heartbeat(self.job)
+            except Exception as e:
+                logging.warning(f"Heartbeat of analysis job {self.job.job_id} failed: {e}")
+                extended = False
+            if not extended:
+                self.lease_lost = True
+                self.job.lease_lost = True
+                return
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+# Helper function to complete, fail or abandon a job after its handler ran (error: None on success)
+def _settle_job(job_queue, job: Job, heartbeat: JobHeartbeat, error: Exception) -> str:
+    heartbeat.stop()
+    if isinstance(error, LeaseLostError):
+        # The job is visible to (or already run by) another worker, it must not be failed or completed here
+        logging.warning(f"Abandoned analysis job {job.job_id}: {error}")
+        job_queue.abandon(job)
+        return "abandoned"
+
+    if error is not None:
+        logging.error(f"Analysis job {job.job_id} ({job.blob_name}) failed: {error}")
+        try:
+            return "dead_lettered" if job_queue.fail(job, str(error)) == "dead" else "retried"
+        except Exception as fail_error:
+            # The lease expired meanwhile, the job becomes visible again on its own
+            logging.warning(f"Could not release analysis job {job.job_id}: {fail_error}")
+            job_queue.abandon(job)
+            return "abandoned"
+
+    if job_queue.complete(job):
+        return "completed"
+    # Another worker took the job over after the lease was lost, it will write the same output
+    logging.warning(f"Analysis job {job.job_id} finished after its lease was lost")
+    return "retried"
+
+
+def run_worker(job_queue, handler, time_budget_s: float, stop_event: threading.Event = None,
+               expected_job_s: float = 0.0) -> dict:
+    """
+    Lease and run jobs one after the other until no job can be leased (queue empty or concurrency
+    cap reached) or the time budget is spent. A job is only leased when it is expected to finish
+    within the budget, using the longer of expected_job_s and the longest job run so far.
+
+    Args:
+        job_queue: LocalJobQueue / AzureJobQueue
+        handler (callable): Runs one Job, raises to fail it. It should call job.ensure_leased()
+            before side effects that must not happen twice
+        time_budget_s (float): Seconds within which every leased job should finish
+        stop_event (threading.Event): Set it to stop leasing from another thread
+        expected_job_s (float): Expected duration of one job
+
+    Returns:
+        dict: Number of completed, retried, dead-lettered and abandoned (lease lost) jobs
+    """
+    return run_batch_worker(job_queue, lambda jobs: {jobs[0].job_id: _run_handler(handler, jobs[0])}, 1,
+                            time_budget_s, stop_event, expected_job_s)
+
+
+# Helper function to run a single-job handler, returning its exception instead of raising it
+def _run_handler(handler, job: Job) -> Exception:
+    try:
+        with METRICS.timer("analysis_job_run_seconds", priority=job.priority):
+            handler(job)
+    except Exception as e:
+        return e
+    return None
+
+
+def run_batch_worker(job_queue, batch_handler, batch_size: int, time_budget_s: float,
+                     stop_event: threading.Event = None, expected_job_s: float = 0.0) -> dict:
+    """
+    Like run_worker, but leases up to batch_size jobs at a time (each one takes a concurrency slot)
+    and runs them together, e.g. as the cameras of one multi-stream analysis.
+
+    Args:
+        job_queue: LocalJobQueue / AzureJobQueue
+        batch_handler (callable): Runs a list of Jobs, returns {job_id: exception or None}. Jobs
+            missing from the result, or all of them when it raises, are failed
+        batch_size (int): Largest number of jobs run together
+        time_budget_s (float): Seconds within which every leased batch should finish
+        stop_event (threading.Event): Set it to stop leasing from another thread
+        expected_job_s (float): Expected duration of one batch
+
+    Returns:
+        dict: Number of completed, retried, dead-lettered and abandoned (lease lost) jobs
+    """
+    counts = {"completed": 0, "retried": 0, "dead_lettered": 0, "abandoned": 0}
+    started = time.monotonic()
+    longest_job_s = expected_job_s
+
+    while time.monotonic() - started + longest_job_s < time_budget_s and (stop_event is None or not stop_event.is_set()):
+        jobs = []
+        heartbeats = []
+        while len(jobs) < batch_size:
+            job = job_queue.lease()
+            if job is None:
+                break
+            logging.info(f"Leased analysis job {job.job_id} ({job.blob_name}, {job.priority}, attempt {job.attempts})")
+            heartbeat = JobHeartbeat(job_queue, job)
+            heartbeat.start()
+            jobs.append(job)
+            heartbeats.append(heartbeat)
+        if not jobs:
+            break
+
+        job_started = time.monotonic()
+        try:
+            errors = batch_handler(jobs)
+        except Exception as e:
+            errors = {job.job_id: e for job in jobs}
+
+        for (job, heartbeat) in zip(jobs, heartbeats):
+            error = errors.get(job.job_id, RuntimeError("Job not run by the batch handler"))
+            outcome = _settle_job(job_queue, job, heartbeat, error)
+            counts[outcome] += 1
+            METRICS.inc("analysis_jobs_total", outcome=outcome)
+
+        longest_job_s = max(longest_job_s, time.monotonic() - job_started)
+
+    return counts
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[0:0] = [APP_DIR, os.path.join(APP_DIR, "benchmarks")]
+
+
+# Short synthetic clip with its ground truth, see benchmarks/synthetic_video.py
+@pytest.fixture(scope="session")
+def synthetic_clip(tmp_path_factory) -> tuple[str, list]:
+    from synthetic_video import ensure_video, make_scenario
+
+    return ensure_video(make_scenario(duration_s=10, vehicles_per_minute=60), str(tmp_path_factory.mktemp("videos")))
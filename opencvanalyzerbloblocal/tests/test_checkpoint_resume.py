@@ -0,0 +1,185 @@
+import hashlib
+import threading
+
+import pytest
+
+import proccess2
+from checkpoint import LocalCheckpointStore, checkpoint_key, load_state
+from synthetic_tracker import MAX_MATCH_DISTANCE, MAX_TRACK_AGE, SyntheticTracker
+
+CHECKPOINT_INTERVAL = 50
+CRASH_AT_FRAME = 140
+RESUMED_AT_FRAME = 100
+
+DETECTOR = SyntheticTracker()
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+# Helper function to make a tracker fail on its n-th track call, like a host that dies mid-clip
+def crash_after(tracker, frames: int):
+    track = tracker.track
+    calls = [0]
+
+    def crashing_track(frame):
+        calls[0] += 1
+        if calls[0] > frames:
+            raise SimulatedCrash()
+        return track(frame)
+
+    tracker.track = crashing_track
+    return tracker
+
+
+def frame_digest(frame):
+    return hashlib.sha1(frame.tobytes()).hexdigest()[:16] if frame is not None else None
+
+
+class FakeTrack:
+    def __init__(self, track_id, cls_id, cx, cy, kalman_filter):
+        self.track_id = track_id
+        self.cls_id = cls_id
+        self.cx = cx
+        self.cy = cy
+        self.age = 0
+        self.kalman_filter = kalman_filter
+
+
+class FakeTracker:
+    """
+    Stand-in of an ultralytics BOTSORT: tracks colour detections and, like its camera motion
+    compensation (GMC), compares every frame with the previous one, logging (previous, current) digests.
+    """
+
+    def __init__(self, base_track, gmc_log):
+        self.base_track = base_track
+        self.gmc_log = gmc_log
+        self.kalman_filter = object()
+        self.frame_id = 0
+        self.tracked_stracks = []
+        self.lost_stracks = []
+        self.removed_stracks = []
+        self.prev_frame = None
+
+    def update(self, frame) -> list:
+        self.frame_id += 1
+        self.gmc_log.append((frame_digest(self.prev_frame), frame_digest(frame)))
+        self.prev_frame = frame
+
+        unmatched = self.tracked_stracks + self.lost_stracks
+        tracked = []
+        for (x1, y1, x2, y2, cls_id, (cx, cy)) in DETECTOR.detect(frame):
+            candidates = [track for track in unmatched if track.cls_id == cls_id
+                          and ((track.cx - cx) ** 2 + (track.cy - cy) ** 2) ** 0.5 <= MAX_MATCH_DISTANCE]
+            if candidates:
+                track = min(candidates, key=lambda t: (t.cx - cx) ** 2 + (t.cy - cy) ** 2)
+                unmatched.remove(track)
+                (track.cx, track.cy, track.age) = (cx, cy, 0)
+            else:
+                self.base_track._count += 1
+                track = FakeTrack(self.base_track._count, cls_id, cx, cy, self.kalman_filter)
+            tracked.append((track, (x1, y1, x2, y2)))
+
+        for track in unmatched:
+            track.age += 1
+        self.tracked_stracks = [track for (track, _) in tracked]
+        self.lost_stracks = [track for track in unmatched if track.age < MAX_TRACK_AGE]
+        self.removed_stracks = [track for track in unmatched if track.age >= MAX_TRACK_AGE]
+        return [(box, track.cls_id, track.track_id) for (track, box) in tracked]
+
+
+class FakeBoxes:
+    def __init__(self, tracked: list):
+        self.xyxy = [box for (box, _, _) in tracked]
+        self.cls = [cls_id for (_, cls_id, _) in tracked]
+        self.id = [track_id for (_, _, track_id) in tracked] if tracked else None
+
+
+class FakeResult:
+    def __init__(self, tracked: list):
+        self.boxes = FakeBoxes(tracked)
+
+
+class FakePredictor:
+    def __init__(self, trackers: list):
+        self.trackers = trackers
+
+
+class FakeModel:
+    """YOLO model whose predictor and trackers are created by the first track call, as in ultralytics."""
+
+    names = SyntheticTracker.names
+
+    def __init__(self, base_track, gmc_log):
+        self.base_track = base_track
+        self.gmc_log = gmc_log
+        self.predictor = None
+        self.inference_calls = 0
+
+    def track(self, frame, persist=True, conf=0.5, verbose=False):
+        self.inference_calls += 1
+        if self.predictor is None:
+            self.predictor = FakePredictor([FakeTracker(self.base_track, self.gmc_log)])
+        return [FakeResult(self.predictor.trackers[0].update(frame))]
+
+
+class FakeYoloTracker(proccess2.YoloTracker):
+    """The YoloTracker state handling on top of FakeModel, ultralytics is not needed."""
+
+    state_version = "test"
+
+    def __init__(self):
+        self.gmc_log = []
+        # BaseTrack._count is a class attribute in ultralytics, every run gets its own here
+        self._base_track = type("BaseTrack", (), {"_count": 0})
+        self.model = FakeModel(self._base_track, self.gmc_log)
+        self.conf = 0.5
+        self.names = self.model.names
+
+
+def wait_for_checkpoint_writers() -> None:
+    for thread in threading.enumerate():
+        if thread.name == "checkpoint-writer":
+            thread.join()
+
+
+# Helper function to analyse a clip with a crash after CRASH_AT_FRAME and a resumed second run
+def interrupted_run(video_path, tmp_path, new_tracker) -> tuple:
+    store = LocalCheckpointStore(str(tmp_path / "checkpoints"))
+    with pytest.raises(SimulatedCrash):
+        proccess2.analyse_clip(video_path, str(tmp_path / "crashed.csv"), tracker=crash_after(new_tracker(), CRASH_AT_FRAME),
+                               checkpoint_store=store, checkpoint_interval=CHECKPOINT_INTERVAL)
+    wait_for_checkpoint_writers()
+    assert load_state(store.load(checkpoint_key(video_path)))["frame_count"] == RESUMED_AT_FRAME
+
+    tracker = new_tracker()
+    df = proccess2.analyse_clip(video_path, str(tmp_path / "resumed.csv"), tracker=tracker,
+                                checkpoint_store=store, checkpoint_interval=CHECKPOINT_INTERVAL)
+    return (df, tracker)
+
+
+@pytest.mark.parametrize("new_tracker", [SyntheticTracker, FakeYoloTracker], ids=["synthetic", "yolo-state"])
+def test_resumed_clip_gives_the_records_of_an_uninterrupted_run(synthetic_clip, tmp_path, new_tracker):
+    (video_path, _) = synthetic_clip
+    expected = proccess2.analyse_clip(video_path, str(tmp_path / "full.csv"), tracker=new_tracker())
+    assert len(expected) >= 3
+
+    (resumed, _) = interrupted_run(video_path, tmp_path, new_tracker)
+
+    assert resumed.values.tolist() == expected.values.tolist()
+
+
+def test_resume_warms_the_tracker_up_on_the_last_analysed_frame(synthetic_clip, tmp_path):
+    (video_path, _) = synthetic_clip
+    full = FakeYoloTracker()
+    proccess2.analyse_clip(video_path, str(tmp_path / "full.csv"), tracker=full)
+
+    (_, resumed) = interrupted_run(video_path, tmp_path, FakeYoloTracker)
+
+    # The restore runs the model once on frame RESUMED_AT_FRAME, then the loop continues with the next frame:
+    # from there on the camera motion compensation sees the same (previous, current) frame pairs
+    assert resumed.gmc_log[0] == (None, full.gmc_log[RESUMED_AT_FRAME - 1][1])
+    assert resumed.gmc_log[1:] == full.gmc_log[RESUMED_AT_FRAME:]
+    assert resumed.model.inference_calls == full.model.inference_calls - RESUMED_AT_FRAME + 1
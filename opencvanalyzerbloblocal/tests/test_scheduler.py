@@ -0,0 +1,168 @@
+import json
+
+import pytest
+
+import scheduler
+from scheduler import AzureJobQueue, Job, LeaseLostError, LocalJobQueue, retry_backoff_s, run_worker
+
+VISIBILITY_TIMEOUT_S = 30
+
+
+class FakeClock:
+    """Stands in for the time module of the scheduler, the tests move it forward."""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler, "time", clock)
+    return clock
+
+
+# Two queues on the same database, like the worker processes of one machine
+@pytest.fixture
+def queues(tmp_path, clock):
+    def new_queue(**kwargs):
+        options = {"max_concurrency": 2, "visibility_timeout_s": VISIBILITY_TIMEOUT_S, "max_attempts": 3, **kwargs}
+        return LocalJobQueue(str(tmp_path / "jobs.sqlite"), **options)
+
+    return new_queue
+
+
+def test_each_job_is_claimed_by_one_worker(queues):
+    (first, second) = (queues(max_concurrency=5), queues(max_concurrency=5))
+    for name in ("a.mp4", "b.mp4"):
+        first.enqueue(name)
+
+    leased = [first.lease(), second.lease()]
+
+    assert sorted(job.blob_name for job in leased) == ["a.mp4", "b.mp4"]
+    assert first.lease() is None and second.lease() is None
+
+
+def test_repeated_enqueue_keeps_one_job_at_the_higher_priority(queues):
+    queue = queues()
+    queue.enqueue("backfill.mp4")
+    job_id = queue.enqueue("live.mp4")
+
+    assert queue.enqueue("live.mp4", "live") == job_id
+    assert [queue.lease().blob_name, queue.lease().blob_name] == ["live.mp4", "backfill.mp4"]
+
+
+def test_concurrency_cap_holds_across_workers(queues):
+    (first, second) = (queues(), queues())
+    for name in ("a.mp4", "b.mp4", "c.mp4"):
+        first.enqueue(name)
+
+    running = [first.lease(), second.lease()]
+    assert second.lease() is None
+    assert first.stats()["in_flight"] == 2
+    assert first.stats()["depth"]["backfill"] == 1
+
+    assert first.complete(running[0])
+    assert second.lease().blob_name == "c.mp4"
+
+
+def test_expired_lease_is_requeued_for_another_worker(queues, clock):
+    (first, second) = (queues(), queues())
+    first.enqueue("a.mp4")
+    job = first.lease()
+    assert first.heartbeat(job)
+
+    clock.advance(VISIBILITY_TIMEOUT_S + 1)
+    with pytest.raises(LeaseLostError):
+        job.ensure_leased()
+    assert not first.heartbeat(job)
+
+    retry = second.lease()
+    assert (retry.job_id, retry.attempts) == (job.job_id, 2)
+    # The first worker can no longer settle the job, the second one does
+    assert not first.complete(job)
+    assert second.complete(retry)
+    assert first.lease() is None
+
+
+def test_expired_leases_count_as_attempts_until_dead_letter(queues, clock):
+    queue = queues()
+    queue.enqueue("a.mp4")
+    for _ in range(3):
+        assert queue.lease() is not None
+        clock.advance(VISIBILITY_TIMEOUT_S + 1)
+
+    assert queue.lease() is None
+    assert queue.stats()["dead_lettered"] == 1
+
+
+def test_failed_job_is_retried_after_its_backoff_then_dead_lettered(queues, clock):
+    queue = queues(max_attempts=2)
+    queue.enqueue("a.mp4")
+
+    assert queue.fail(queue.lease(), "decode error") == "queued"
+    assert queue.lease() is None
+    assert queue.stats()["delayed_retries"] == 1
+
+    clock.advance(retry_backoff_s(1))
+    job = queue.lease()
+    assert job.attempts == 2
+    assert queue.fail(job, "decode error") == "dead"
+    clock.advance(retry_backoff_s(2))
+    assert queue.lease() is None
+    assert queue.stats()["dead_lettered"] == 1
+
+
+def test_worker_completes_and_retries_jobs(queues):
+    queue = queues()
+    for name in ("good.mp4", "bad.mp4"):
+        queue.enqueue(name)
+
+    def handler(job):
+        if job.blob_name == "bad.mp4":
+            raise ValueError("unreadable segment")
+
+    counts = run_worker(queue, handler, time_budget_s=60)
+
+    assert counts == {"completed": 1, "retried": 1, "dead_lettered": 0, "abandoned": 0}
+    assert queue.stats()["delayed_retries"] == 1
+
+
+class FakeQueueClient:
+    def __init__(self):
+        self.sent = []
+        self.updated = []
+
+    def send_message(self, content, visibility_timeout=None):
+        self.sent.append((json.loads(content), visibility_timeout))
+
+    def update_message(self, message, visibility_timeout=None):
+        self.updated.append((message, visibility_timeout))
+        return message
+
+
+class FakeSlot:
+    def release(self):
+        pass
+
+
+def test_azure_retry_wakes_a_worker_once_its_backoff_is_over():
+    queue = AzureJobQueue.__new__(AzureJobQueue)
+    queue.max_attempts = 3
+    queue.wake_queue = FakeQueueClient()
+    job_queue = FakeQueueClient()
+    job = Job("job-1", "a.mp4", "backfill", 2, None, receipt={"queue": job_queue, "message": "message", "slot": FakeSlot()})
+
+    assert queue.fail(job, "decode error") == "queued"
+
+    assert job_queue.updated == [("message", int(retry_backoff_s(2)))]
+    assert queue.wake_queue.sent == [({"job_id": "job-1"}, int(retry_backoff_s(2)))]
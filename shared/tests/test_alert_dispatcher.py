@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+import alert_dispatcher
+from alert_dispatcher import AlertDispatcher
+
+APP_URL = "http://alert-logger/api/alert/list"
+
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.text = ""
+
+
+class FakeAlertLogger:
+    """Stands in for the session of a dispatcher: records the delivered alerts, can be down or slow."""
+
+    def __init__(self):
+        self.received = []
+        self.down = False
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def post(self, url, data=None, timeout=None):
+        self.release.wait(10)
+        if self.down:
+            raise requests.ConnectionError("alert logger down")
+        with self._lock:
+            self.received.extend(json.loads(data))
+        return FakeResponse(200)
+
+    def received_ids(self) -> list:
+        with self._lock:
+            return sorted(alert["vehicleId"] for alert in self.received)
+
+
+def make_alerts(first: int, count: int) -> list:
+    return [{"vehicleId": vehicle_id, "timeEntered": float(vehicle_id), "speed": 150.0, "vehicleType": "car"}
+            for vehicle_id in range(first, first + count)]
+
+
+def spooled_ids(spool_dir: str) -> list:
+    ids = []
+    for name in os.listdir(spool_dir):
+        if name.endswith(".json"):
+            with open(os.path.join(spool_dir, name)) as f:
+                ids.extend(alert["vehicleId"] for alert in json.load(f))
+    return sorted(ids)
+
+
+def wait_until(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def new_dispatcher(tmp_path):
+    # Dispatchers with a fast flush interval, all sharing one spool directory (like restarts of one host)
+    def create(sink: FakeAlertLogger, batch_size: int = 5) -> AlertDispatcher:
+        dispatcher = AlertDispatcher(APP_URL, batch_size=batch_size, flush_interval=0.05, spool_dir=str(tmp_path / "spool"))
+        dispatcher.session = sink
+        return dispatcher
+
+    return create
+
+
+def test_flush_delivers_in_batches(new_dispatcher):
+    sink = FakeAlertLogger()
+    dispatcher = new_dispatcher(sink)
+
+    dispatcher.enqueue(make_alerts(0, 12))
+
+    assert dispatcher.flush_or_spool(5.0)
+    assert sink.received_ids() == list(range(12))
+    assert dispatcher.stats["batches_sent"] == 3
+    assert dispatcher.spooled_batches() == 0
+
+
+def test_flush_timeout_spools_the_undelivered_alerts(new_dispatcher, tmp_path):
+    sink = FakeAlertLogger()
+    sink.release.clear()
+    dispatcher = new_dispatcher(sink)
+
+    dispatcher.enqueue(make_alerts(0, 12))
+
+    # The first batch hangs in the POST, it is spooled along with everything still queued
+    assert not dispatcher.flush_or_spool(0.2)
+    assert spooled_ids(str(tmp_path / "spool")) == list(range(12))
+
+    # The hanging POST succeeds after all: its spooled copy is removed, the rest stays for the retry
+    sink.release.set()
+    assert wait_until(lambda: dispatcher.spooled_batches() == 0)
+    assert sorted(set(sink.received_ids())) == list(range(12))
+
+
+def test_spool_is_replayed_after_a_restart(new_dispatcher, monkeypatch, tmp_path):
+    sink = FakeAlertLogger()
+    sink.down = True
+    dispatcher = new_dispatcher(sink)
+
+    dispatcher.enqueue(make_alerts(0, 7))
+    assert dispatcher.flush_or_spool(5.0)
+    assert spooled_ids(str(tmp_path / "spool")) == list(range(7))
+
+    # A new host process finds the spool of the previous one and sends it without new alerts coming in
+    sink.down = False
+    monkeypatch.setattr(alert_dispatcher, "_dispatchers", {})
+    monkeypatch.setattr(alert_dispatcher, "AlertDispatcher", lambda app_url: new_dispatcher(sink))
+    restarted = alert_dispatcher.get_alert_dispatcher(APP_URL)
+
+    assert restarted is not dispatcher
+    assert wait_until(lambda: restarted.spooled_batches() == 0)
+    assert sink.received_ids() == list(range(7))
+
+
+def test_concurrent_enqueue_and_flush_lose_no_alert(new_dispatcher):
+    sink = FakeAlertLogger()
+    slow_post = sink.post
+
+    def post(url, data=None, timeout=None):
+        time.sleep(0.02)
+        return slow_post(url, data=data, timeout=timeout)
+
+    dispatcher = new_dispatcher(sink)
+    dispatcher.session.post = post
+
+    # Like concurrent ingestion requests: each enqueues its alerts and gives the sink a short time to take them
+    def request(first: int) -> None:
+        for offset in range(0, 50, 10):
+            dispatcher.enqueue(make_alerts(first + offset, 10))
+            dispatcher.flush_or_spool(0.01)
+
+    threads = [threading.Thread(target=request, args=(i * 100,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    expected = sorted(i * 100 + j for i in range(4) for j in range(50))
+    assert dispatcher.flush(10.0)
+    assert wait_until(lambda: dispatcher.spooled_batches() == 0)
+    assert sorted(set(sink.received_ids())) == expected
@@ -0,0 +1,15 @@
+import vendor
+
+
+def test_vendored_copies_match_shared():
+    assert vendor.main(["--check"]) == 0
+
+
+def test_check_reports_a_stale_copy(tmp_path, monkeypatch, capsys):
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "instrumentation.py").write_text("# stale\n")
+    monkeypatch.setattr(vendor, "REPO_ROOT", str(tmp_path))
+    monkeypatch.setattr(vendor, "SHARED_MODULES", {"instrumentation.py": ["app"]})
+
+    assert vendor.main(["--check"]) == 1
+    assert "app/instrumentation.py" in capsys.readouterr().err
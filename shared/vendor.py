@@ -0,0 +1,70 @@
+"""
+Copy the shared modules into the app directories that import them.
+
+Every function app is deployed from its own directory, so a module used by several apps has to
+sit next to each app's entry module. The copies are committed, so every app deploys and runs from
+a fresh checkout as is; shared/ holds the copy that is edited. After changing a shared module run
+this script and commit the updated copies, shared/tests/test_vendored_copies.py fails until then.
+
+Usage:
+    python shared/vendor.py                  # copy into every app
+    python shared/vendor.py analytics        # copy into one app
+    python shared/vendor.py --check          # fail if a vendored copy is missing or out of date
+"""
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+SHARED_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SHARED_DIR)
+
+# Shared module -> app directories that import it
+SHARED_MODULES = {
+    "instrumentation.py": ["VideoSegmenter", "alert-logger", "analytics", "intermediateWorker",
+                           "opencv_http_trigger", "opencvanalyzerbloblocal"],
+    "alert_dispatcher.py": ["intermediateWorker", "opencvanalyzerbloblocal"],
+}
+
+
+# Helper function to list the (source, target) paths to vendor, optionally for some apps only
+def vendored_files(apps: list = None) -> list:
+    files = []
+    for (module, app_dirs) in SHARED_MODULES.items():
+        for app_dir in app_dirs:
+            if apps and app_dir not in apps:
+                continue
+            files.append((os.path.join(SHARED_DIR, module), os.path.join(REPO_ROOT, app_dir, module)))
+    return files
+
+
+def main(argv: list = None) -> int:
+    known_apps = sorted({app_dir for app_dirs in SHARED_MODULES.values() for app_dir in app_dirs})
+    parser = argparse.ArgumentParser(description="Copy the shared modules into the app directories")
+    parser.add_argument("apps", nargs="*", metavar="app",
+                        help=f"App directories to vendor into (default: all of {', '.join(known_apps)})")
+    parser.add_argument("--check", action="store_true", help="Only check that the vendored copies are up to date")
+    args = parser.parse_args(argv)
+    for app_dir in args.apps:
+        if app_dir not in known_apps:
+            parser.error(f"unknown app: {app_dir}")
+
+    stale = []
+    for (source, target) in vendored_files(args.apps):
+        if os.path.exists(target) and filecmp.cmp(source, target, shallow=False):
+            continue
+        if args.check:
+            stale.append(os.path.relpath(target, REPO_ROOT))
+        else:
+            shutil.copyfile(source, target)
+            print(f"Vendored {os.path.relpath(target, REPO_ROOT)}")
+
+    if stale:
+        print(f"Missing or out of date (run python shared/vendor.py): {', '.join(stale)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())